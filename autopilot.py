@@ -1,71 +1,402 @@
+import argparse
 import krpc
+import sys
 import time
 import math
+import threading
+from contextlib import contextmanager
 
+import instrument
+import varkt
+from cutoff import CutoffPredictor
+from guidance import GuidanceProfile
+from rpc_hook import on_rpc
+from vessel_streams import VesselStreams
 
-def wait_for_solid_fuel_empty(vessel, target_pitch, current_pitch):
+
+LAUNCH_AZIMUTH = 90  # Стандартный азимут запуска (90° = строго на восток)
+
+# Исходная программа тангажа автопилота: точки излома (высота, тангаж).
+# Если есть файл varkt.PROFILE_PATH (optimize_profile.py), летим по нему -
+# по той же программе, что и модель varkt.py.
+DEFAULT_PITCH_PROFILE = ((1000, 85), (10000, 45), (40000, 5))
+DEFAULT_GUIDANCE = GuidanceProfile.from_breakpoints(DEFAULT_PITCH_PROFILE)
+
+# Выключение по апоцентру: за RAMP_TIME с (на полной тяге) до цели газ
+# снижается до FINAL_THROTTLE, чтобы ошибка момента выключения стоила меньше
+RAMP_TIME = 3.0
+FINAL_THROTTLE = 0.25
+
+# Импульс по узлу: когда на полной тяге остается меньше BURN_RAMP_TIME с,
+# газ пропорционален остатку ΔV (но не меньше MIN_BURN_THROTTLE); газ
+# меняется ступенями не мельче THROTTLE_STEP от текущего (меньше RPC),
+# импульс закончен при остатке DV_TOLERANCE
+BURN_RAMP_TIME = 2.0
+MIN_BURN_THROTTLE = 0.05
+THROTTLE_STEP = 0.3
+DV_TOLERANCE = 0.05  # м/с
+
+# Тангаж в цикле разворота отправляется, только когда цель ушла от
+# последней команды не меньше чем на PITCH_STEP градусов (или дошла до
+# конца программы): на каждом обновлении высоты команда была бы лишним RPC
+PITCH_STEP = 0.5
+
+# Команды, о которых MissionStats сообщает слушателям: процедура kRPC ->
+# (имя, позиция аргумента-значения или None)
+COMMANDS = {
+    'Control_set_Throttle': ('throttle', 1),
+    'AutoPilot_TargetPitchAndHeading': ('pitch', 1),
+    'Control_ActivateNextStage': ('stage', None),
+}
+
+
+class MissionStats:
+    """
+    Статистика по фазам полета: число RPC, длительность фазы и задержка
+    срабатывания (от прихода события/обновления потока до отправки команды).
+
+    Считает все RPC соединения через rpc_hook.on_rpc (перехват на уровне
+    соединения клиента kRPC - его проходит каждый удаленный вызов).
+
+    Слушатели (listeners) получают listener(kind, name, value) о начале
+    каждой фазы (kind='phase') и о командах из COMMANDS (kind='command',
+    value - газ, тангаж или None для ступени) - по ним журнал полета
+    записывает, что делал автопилот. О командах слушатели узнают внутри
+    перехвата RPC: делать в них RPC нельзя.
+    """
+
+    def __init__(self, conn):
+        self.rpc_count = 0
+        self.phases = []
+        self.listeners = []
+        self._current = None
+
+        on_rpc(conn, self._on_rpc)
+
+    def _on_rpc(self, call):
+        self.rpc_count += 1
+        command = COMMANDS.get(call.procedure)
+        if command is not None and self.listeners:
+            name, position = command
+            self._emit('command', name, None if position is None else call.argument(position))
+
+    def _emit(self, kind, name, value=None):
+        for listener in list(self.listeners):
+            listener(kind, name, value)
+
+    @property
+    def current_phase(self):
+        return self._current['name'] if self._current is not None else None
+
+    @contextmanager
+    def phase(self, name):
+        record = {'name': name, 'rpcs': 0, 'duration': 0.0, 'latency': None}
+        self._current = record
+        self._emit('phase', name)
+        rpc_start = self.rpc_count
+        start = time.perf_counter()
+        try:
+            with instrument.span(name, 'phase'):
+                yield record
+        finally:
+            record['duration'] = time.perf_counter() - start
+            record['rpcs'] = self.rpc_count - rpc_start
+            self.phases.append(record)
+            self._current = None
+
+    def triggered(self, fired_at):
+        # Команда отправлена - запоминаем задержку от момента срабатывания
+        if self._current is not None:
+            self._current['latency'] = time.perf_counter() - fired_at
+            instrument.value('задержка реакции', self._current['latency'])
+
+    def report(self):
+        print(f"\n{'Фаза':<28} {'RPC':>6} {'время, с':>9} {'задержка, мс':>13}")
+        for record in self.phases:
+            latency = '-' if record['latency'] is None else f"{record['latency'] * 1000:.1f}"
+            print(f"{record['name']:<28} {record['rpcs']:>6} {record['duration']:>9.1f} {latency:>13}")
+        print(f"{'Всего':<28} {self.rpc_count:>6}")
+
+
+def pitch_due(current_pitch, new_pitch, end_pitch):
+    """Пора ли отправить новый тангаж new_pitch (тангаж только уменьшается)."""
+    return new_pitch <= current_pitch - PITCH_STEP or end_pitch >= new_pitch < current_pitch
+
+
+class ConditionEvent:
+    """
+    Условие на стороне сервера kRPC (событие по выражению call op value).
+
+    Вместо опроса значения раз в 0.1 с сервер сам сравнивает call с порогом
+    на каждом кадре и присылает событие, когда условие выполнилось.
+    Момент прихода события (time.perf_counter) сохраняется в fired_at.
+
+    Параметры:
+        conn: соединение kRPC
+        call: вызов, полученный через conn.get_call(...)
+        op: '>=' или '<='
+        value: порог
+        single: True, если вызов возвращает float (а не double)
+    """
+
+    def __init__(self, conn, call, op, value, single=False):
+        Expression = conn.krpc.Expression
+        left = Expression.call(call)
+        right = Expression.constant_float(value) if single else Expression.constant_double(value)
+        if op == '>=':
+            expression = Expression.greater_than_or_equal(left, right)
+        else:
+            expression = Expression.less_than_or_equal(left, right)
+
+        self.fired = threading.Event()
+        self.fired_at = None
+        self._event = conn.krpc.add_event(expression)
+        self._event.add_callback(self._on_event)
+        self._event.start()
+
+    def _on_event(self):
+        if self.fired_at is None:
+            self.fired_at = time.perf_counter()
+        self.fired.set()
+
+    def wait(self):
+        with instrument.span('wait event', 'wait'):
+            self.fired.wait()
+        return self.fired_at
+
+    def remove(self):
+        self._event.remove()
+
+
+def wait_for_condition(conn, call, op, value, single=False):
+    """
+    Ожидание условия на стороне сервера (см. ConditionEvent).
+    Возвращает момент прихода события (time.perf_counter).
+    """
+    event = ConditionEvent(conn, call, op, value, single)
+    try:
+        return event.wait()
+    finally:
+        event.remove()
+
+
+def next_value(stream):
+    """
+    Ожидание следующего обновления потока.
+    Возвращает (значение, момент прихода обновления).
+    """
+    with stream.condition:
+        with instrument.span('wait stream', 'wait'):
+            stream.wait()
+        return stream(), time.perf_counter()
+
+
+def wait_for_solid_fuel_empty(conn, vessel, current_pitch, altitude, guidance=DEFAULT_GUIDANCE):
     """
     Ожидание полного выгорания твердого топлива в твердотопливных ускорителях.
     
     Функция непрерывно мониторит количество твердого топлива на борту корабля,
     отслеживая его уменьшение до полного истощения. Во время ожидания также 
-    продолжается процесс гравитационного разворота, если высота меньше 40 км.
+    продолжается процесс гравитационного разворота до последней точки излома.
     Это важно для обеспечения оптимальной траектории выведения даже при 
     работающих твердотопливных ускорителях.
     
     Особенности реализации:
-    - Использует пороговое значение 0.5 единиц топлива для первичного определения
-      окончания работы ускорителей
-    - Выполняет финальную проверку с порогом 0.1 единиц для исключения 
-      ложных срабатываний из-за колебаний показаний датчиков
+    - Окончание работы ускорителей определяет сервер kRPC: событие по выражению
+      SolidFuel <= 0.1 (без опроса количества топлива по RPC)
+    - Тангаж считается по потоку высоты altitude на каждом обновлении, без
+      паузы между проверками, а отправляется шагами не мельче PITCH_STEP
     - Продолжает управление тангажом для поддержания оптимальной траектории
     
     Параметры:
+        conn: соединение kRPC
         vessel: объект корабля из kRPC, представляющий текущее космическое судно
-        target_pitch: целевой угол тангажа, к которому стремится система управления
         current_pitch: текущий угол тангажа корабля
+        altitude: поток kRPC высоты над поверхностью
+        guidance: программа тангажа (GuidanceProfile)
     
     Возвращает:
-        True: когда твердое топливо полностью израсходовано
+        float: момент (time.perf_counter) прихода события о выгорании топлива
     """
-    start_time = time.time()
+    burnout = ConditionEvent(conn, conn.get_call(vessel.resources.amount, 'SolidFuel'),
+                             '<=', 0.1, single=True)
+    end_alt, end_pitch = guidance.breakpoints[-1]
+    auto_pilot = vessel.auto_pilot
+    try:
+        while not burnout.fired.is_set():
+            # Продолжаем гравитационный разворот во время работы ускорителей,
+            # пока не пройдена последняя точка излома программы
+            current_alt, _ = next_value(altitude)
+            if current_alt >= end_alt or current_pitch <= end_pitch:
+                # Разворот закончен - просто ждем события
+                break
 
-    LAUNCH_AZIMUTH = 90  # Стандартный азимут запуска (90° = строго на восток)
+            new_pitch = guidance(current_alt)
 
-    while True:
-        # Получаем текущее количество твердого топлива на борту
-        solid_fuel = vessel.resources.amount('SolidFuel')
-        
-        # Первичная проверка: если топлива осталось меньше 0.5 единиц
-        if solid_fuel <= 0.5:
-            # Финальная проверка для исключения ложных срабатываний
-            # Некоторые движки могут показывать остаточные значения
-            final_check = vessel.resources.amount('SolidFuel')
-            if final_check <= 0.1:
-                # Твердое топливо действительно израсходовано
-                return True
-
-        # Продолжаем гравитационный разворот во время работы ускорителей
-        # если высота меньше 40 км и текущий тангаж больше 5 градусов
-        if vessel.flight().surface_altitude < 40000 and current_pitch > 5:
-            current_alt = vessel.flight().surface_altitude
-
-            # Плавное уменьшение тангажа от 10 км до 40 км
-            if current_alt > 10000:
-                # Расчет прогресса разворота: 0 на 10 км, 1 на 40 км
-                progress = (current_alt - 10000) / (40000 - 10000)
-                # Линейная интерполяция угла тангажа
-                new_pitch = target_pitch - (target_pitch - 5) * progress
-
-                # Обновляем угол тангажа только если он уменьшился
-                if new_pitch < current_pitch:
-                    current_pitch = new_pitch
-                    vessel.auto_pilot.target_pitch_and_heading(current_pitch, LAUNCH_AZIMUTH)
+            # Обновляем угол тангажа только если он уменьшился на шаг
+            if pitch_due(current_pitch, new_pitch, end_pitch):
+                current_pitch = new_pitch
+                auto_pilot.target_pitch_and_heading(current_pitch, LAUNCH_AZIMUTH)
+
+        return burnout.wait()
+    finally:
+        burnout.remove()
+
+
+def cutoff_at_apoapsis(conn, vessel, predictor, apo_reached, streams=None):
+    """
+    Выключение двигателя точно при достижении целевого апоцентра.
+
+    На каждом обновлении потоков (высота, вертикальная и горизонтальная
+    скорость в невращающейся системе, масса, тангаж, тяга) прогнозируется
+    время до пересечения апоцентром цели (CutoffPredictor - та же физика,
+    что и в varkt.py). Дальше:
+    - за RAMP_TIME с до цели газ снижается до FINAL_THROTTLE - апоцентр
+      растет медленнее, и задержка команды дает меньший перелет;
+    - когда до цели остается меньше, чем задержка команды плюс интервал
+      обновления потоков (следующего обновления ждать уже поздно), выключение
+      назначается заранее: пауза до прогнозного момента за вычетом задержки
+      команды и сразу команда throttle = 0.
+
+    Задержка команды - половина времени RPC снижения газа (измеряется здесь
+    же) плюс один кадр физики (интервал обновления потоков).
+    Событие apo_reached остается страховкой: если оно сработало раньше
+    прогноза (или прогноза еще нет - пока удельный импульс равен 0, он
+    запрашивается заново на каждом обновлении), двигатель выключается по нему.
 
-        time.sleep(0.1)  # Небольшая пауза для снижения нагрузки на CPU
+    Параметры:
+        conn: соединение kRPC
+        vessel: объект корабля
+        predictor: CutoffPredictor с целевым апоцентром
+        apo_reached: ConditionEvent "апоцентр >= цели"
+        streams: общие потоки VesselStreams (по умолчанию - свои на время функции)
+
+    Возвращает:
+        float: момент (time.perf_counter), когда принято решение о выключении
+    """
+    own_streams = streams is None
+    if own_streams:
+        streams = VesselStreams(conn, vessel)
+    exhaust_velocity = vessel.specific_impulse * varkt.g0  # Для расхода по тяге
+    throttle = 1.0
+    remaining = math.inf  # Без прогноза - выключение по событию apo_reached
+    rpc_time = 0.0
+    frame = None
+    last_ut = None
+    try:
+        while not apo_reached.fired.is_set():
+            ut, updated_at = next_value(streams['ut'])
+            if last_ut is not None and ut > last_ut:
+                frame = ut - last_ut if frame is None else 0.8 * frame + 0.2 * (ut - last_ut)
+            last_ut = ut
+
+            # Isp = 0 (двигатель не отдал удельный импульс) - расход не посчитать,
+            # остается предыдущий прогноз, а Isp запрашиваем заново, пока он не появится
+            if exhaust_velocity <= 0:
+                exhaust_velocity = vessel.specific_impulse * varkt.g0
+            if exhaust_velocity > 0:
+                thrust = streams['available_thrust']() * throttle
+                remaining = predictor.predict(
+                    streams['mean_altitude'](), streams['vertical_speed'](), streams['horizontal_speed'](),
+                    streams['mass'](), thrust, thrust / exhaust_velocity, streams['pitch']())
+
+            if throttle == 1.0 and remaining <= RAMP_TIME:
+                # Снижение газа (заодно - замер времени RPC)
+                start = time.perf_counter()
+                vessel.control.throttle = FINAL_THROTTLE
+                rpc_time = time.perf_counter() - start
+                throttle = FINAL_THROTTLE
+                continue
+
+            delay = rpc_time / 2 + (frame or 0.0)
+            if remaining <= delay + (frame or 0.0):
+                time.sleep(max(0.0, remaining - delay))
+                decided_at = time.perf_counter()
+                vessel.control.throttle = 0.0
+                return decided_at
+        fired_at = apo_reached.wait()
+        vessel.control.throttle = 0.0
+        return fired_at
+    finally:
+        if own_streams:
+            streams.close()
 
 
-def perform_orbit_circularization(conn, vessel, target_apo, target_peri):
+def burn_node(conn, vessel, node, streams=None):
+    """
+    Импульс по узлу маневра с обратной связью по остатку ΔV.
+
+    Двигатель уже включен на полную тягу. Остаток ΔV приходит потоком
+    node.remaining_delta_v (на каждом кадре физики, без опроса), тяга и
+    масса - тоже потоками. Перед концом импульса газ плавно снижается:
+    когда на полной тяге остается меньше BURN_RAMP_TIME с, газ равен
+    остатку ΔV, деленному на ΔV за BURN_RAMP_TIME с полной тяги. Поэтому
+    остаток уменьшается все медленнее, и момент выключения почти не влияет
+    на точность.
+
+    Двигатель выключается заранее - за время реакции на команду (половина
+    RPC изменения газа плюс один кадр): когда остатка ΔV хватает ровно на
+    это время. Если остаток начал расти (импульс проскочил узел), двигатель
+    выключается сразу.
+
+    Параметры:
+        conn: соединение kRPC
+        vessel: объект корабля
+        node: узел маневра
+        streams: общие потоки VesselStreams (по умолчанию - свои на время функции)
+
+    Возвращает:
+        dict: remaining_dv (остаток ΔV при выключении, м/с),
+              throttle_commands (сколько раз менялся газ)
+    """
+    own_streams = streams is None
+    if own_streams:
+        streams = VesselStreams(conn, vessel)
+    remaining_dv = conn.add_stream(getattr, node, 'remaining_delta_v')
+    thrust = streams['available_thrust']
+    mass = streams['mass']
+    throttle = 1.0
+    commands = 0
+    rpc_time = 0.0
+    frame = None
+    last_update = None
+    best = math.inf
+    try:
+        while True:
+            remaining, updated_at = next_value(remaining_dv)
+            if last_update is not None and updated_at > last_update:
+                step = updated_at - last_update
+                frame = step if frame is None else 0.8 * frame + 0.2 * step
+            last_update = updated_at
+
+            if remaining > best + DV_TOLERANCE:
+                break  # Узел пройден - остаток растет
+            best = min(best, remaining)
+
+            accel = thrust() / mass() if mass() > 0 else 0.0
+            if accel <= 0 or remaining <= DV_TOLERANCE:
+                break
+            delay = rpc_time / 2 + (frame or 0.0)
+            if remaining <= accel * throttle * delay:
+                break  # Остаток догорит, пока идет команда
+
+            new_throttle = min(1.0, max(MIN_BURN_THROTTLE, remaining / (accel * BURN_RAMP_TIME)))
+            if abs(new_throttle - throttle) >= THROTTLE_STEP * throttle:
+                start = time.perf_counter()
+                vessel.control.throttle = new_throttle
+                rpc_time = time.perf_counter() - start
+                throttle = new_throttle
+                commands += 1
+
+        vessel.control.throttle = 0.0
+        return {'remaining_dv': remaining_dv(), 'throttle_commands': commands + 1}
+    finally:
+        remaining_dv.remove()
+        if own_streams:
+            streams.close()
+
+
+def perform_orbit_circularization(conn, vessel, target_apo, target_peri, stats=None, streams=None):
     """
     Выполнение маневра для довыведения на целевую круговую (или эллиптическую) орбиту.
     
@@ -75,7 +406,8 @@ def perform_orbit_circularization(conn, vessel, target_apo, target_peri):
     2. Создание узла маневра в расчетной точке
     3. Ориентацию корабля в направлении маневра
     4. Выполнение импульса скорости в точно рассчитанное время
-    5. Контроль достижения целевых параметров орбиты
+    5. Контроль остатка ΔV узла по потоку с плавным снижением газа в конце
+       импульса (burn_node) и отчет: ошибка орбиты и лишний ΔV
     
     Теоретическая основа:
     - Использует уравнения орбитальной механики для расчета ΔV
@@ -90,10 +422,15 @@ def perform_orbit_circularization(conn, vessel, target_apo, target_peri):
         vessel: объект корабля, который необходимо вывести на орбиту
         target_apo: целевая высота апогея в метрах (относительно поверхности планеты)
         target_peri: целевая высота перигея в метрах (относительно поверхности планеты)
+        stats: MissionStats для учета RPC и задержек (необязательно)
+        streams: общие потоки VesselStreams (необязательно)
     
     Возвращает:
         tuple: (final_apo, final_peri) - достигнутые высоты апогея и перигея после маневра
     """
+    if stats is None:
+        stats = MissionStats(conn)
+
     # Получаем необходимые потоки данных из kRPC
     space_center = conn.space_center
     ut = space_center.ut  # Вселенское время (Universal Time) в игре
@@ -138,7 +475,8 @@ def perform_orbit_circularization(conn, vessel, target_apo, target_peri):
     vessel.auto_pilot.reference_frame = main_node.reference_frame
     vessel.auto_pilot.target_direction = (0, 1, 0)  # Направление по вектору скорости (вперед)
     vessel.auto_pilot.engage()  # Включаем автопилот
-    vessel.auto_pilot.wait()  # Ждем завершения ориентации
+    with instrument.span('auto_pilot.wait', 'wait'):
+        vessel.auto_pilot.wait()  # Ждем завершения ориентации
     
     # Расчет времени работы двигателя по формуле Циолковского
     # burn_time = (m0 - m1) / (F / Isp)
@@ -153,30 +491,37 @@ def perform_orbit_circularization(conn, vessel, target_apo, target_peri):
 
     # Ожидание времени начала маневра (50% времени работы до апоцентра)
     # Это оптимальное время начала импульса для минимизации ошибок
-    while vessel.orbit.time_to_apoapsis > burn_time / 2:
-        time.sleep(0.5)  # Проверяем каждые 0.5 секунды
-    
-    # Включаем двигатель на полную тягу
-    vessel.control.throttle = 1.0
-    
-    start_burn_time = time.time()  # Запоминаем время начала маневра
-    
-    # Выполнение маневра до достижения целевого перигея
-    # Контролируем параметры орбиты в реальном времени
-    while vessel.orbit.periapsis_altitude < target_peri:
-        time.sleep(0.1)  # Частые проверки для точного управления
-    
-    # Выключаем двигатель после достижения цели
-    vessel.control.throttle = 0.0
+    # Условие проверяет сервер kRPC (событие), а не опрос раз в 0.5 с
+    with stats.phase("Ожидание импульса"):
+        fired_at = wait_for_condition(conn, conn.get_call(getattr, vessel.orbit, 'time_to_apoapsis'),
+                                      '<=', burn_time / 2)
+    
+        # Включаем двигатель на полную тягу
+        vessel.control.throttle = 1.0
+        stats.triggered(fired_at)
+    
+    # Выполнение маневра по остатку ΔV узла (поток, обратная связь по газу)
+    with stats.phase("Импульс по узлу"):
+        burn = burn_node(conn, vessel, main_node, streams)
     vessel.auto_pilot.disengage()  # Отключаем автопилот
     
     # Получаем финальные параметры орбиты для отчетности
-    final_apo = vessel.orbit.apoapsis_altitude
-    final_peri = vessel.orbit.periapsis_altitude
+    orbit = vessel.orbit
+    final_apo = orbit.apoapsis_altitude
+    final_peri = orbit.periapsis_altitude
+    m_final = vessel.mass
     
     # Удаляем узел маневра, так как он больше не нужен
     main_node.remove()
 
+    # Отчет: ошибка орбиты и лишний ΔV (затраченный по Циолковскому сверх расчетного)
+    spent_dv = Isp * math.log(m0 / m_final) if m_final > 0 else 0.0
+    print(f"Довыведение: апоцентр {final_apo / 1000:.2f} км ({final_apo - target_apo:+.0f} м), "
+          f"перицентр {final_peri / 1000:.2f} км ({final_peri - target_peri:+.0f} м)")
+    print(f"ΔV: расчет {abs(delta_v):.1f} м/с, затрачено {spent_dv:.1f} м/с, "
+          f"лишнее {spent_dv - abs(delta_v):+.2f} м/с, остаток по узлу {burn['remaining_dv']:.2f} м/с, "
+          f"команд газа {burn['throttle_commands']}")
+
     return final_apo, final_peri
 
 
@@ -198,7 +543,7 @@ def update_active_vessel(conn, current_vessel):
     return current_vessel  # Активный корабль не изменился
 
 
-def launch_complete_mission():
+def launch_complete_mission(conn=None, profile=None, predictor=None, stats=None, streams=None):
     """
     Выполнение полного цикла запуска с последующей циркуляризацией орбиты.
     
@@ -213,152 +558,229 @@ def launch_complete_mission():
     8. Развертывание систем (солнечные батареи, антенны)
     9. Циркуляризация орбиты в апоцентре
     10. Завершение миссии с достижением целевой орбиты
+
+    Переходы между фазами управляются потоками и событиями kRPC (без опроса
+    через time.sleep), число RPC и задержка реакции по фазам выводятся в конце.
+
+    Параметры:
+        conn: готовое соединение kRPC (по умолчанию создается новое)
+        profile: параметры программы тангажа varkt (по умолчанию - из файла
+                 varkt.PROFILE_PATH, а если его нет - DEFAULT_PITCH_PROFILE)
+                 или готовая программа GuidanceProfile
+        predictor: CutoffPredictor для выключения по апоцентру (по умолчанию
+                   создается новый; False - выключение только по событию)
+        stats: MissionStats (по умолчанию создается новый)
+        streams: общие потоки VesselStreams, если соединение делят несколько
+                 задач (mission.py); по умолчанию - свои потоки автопилота
+
+    Возвращает:
+        tuple: (final_apo, final_peri) - достигнутые высоты апогея и перигея
     """
     # Подключение к KSP через kRPC
     # Имя соединения отображается в игровом интерфейсе kRPC
-    conn = krpc.connect(name='Запуск с автоматической циркуляризацией')
+    if conn is None:
+        conn = krpc.connect(name='Запуск с автоматической циркуляризацией')
+    if stats is None:
+        stats = MissionStats(conn)  # Учет RPC и задержек по фазам
+
+    # Программа тангажа: подобранная optimize_profile.py или исходная
+    if profile is None:
+        profile = varkt.load_profile()
+    if isinstance(profile, GuidanceProfile):
+        guidance = profile
+    else:
+        guidance = varkt.guidance_profile(profile) if profile else DEFAULT_GUIDANCE
+    breakpoints = guidance.breakpoints
+    if guidance is not DEFAULT_GUIDANCE:
+        print("Программа тангажа: " + ", ".join(f"{h / 1000:.1f} км {a:.1f}°" for h, a in breakpoints))
+    turn_alt, initial_pitch = breakpoints[0]
+    mid_alt = breakpoints[1][0]
+    end_alt, end_pitch = breakpoints[-1]
     vessel = conn.space_center.active_vessel  # Получаем текущий активный корабль
     space_center = conn.space_center  # Центр управления для доступа к глобальным функциям
-    
-    # Включаем систему стабилизации (SAS)
-    # SAS помогает стабилизировать корабль и удерживать ориентацию
-    vessel.control.sas = True
 
-    # Запуск двигателей: устанавливаем полную тягу
-    vessel.control.throttle = 1.0
-    time.sleep(3)  # Пауза для выхода двигателей на режим
-    vessel.control.activate_next_stage()  # Активируем первую ступень
+    # Потоки и вызовы для событий сервера (значения приходят без опроса по RPC)
+    own_streams = streams is None
+    if own_streams:
+        streams = VesselStreams(conn, vessel)
+    flight = vessel.flight()
+    altitude_call = conn.get_call(getattr, flight, 'surface_altitude')
+    altitude = streams['surface_altitude']
+    
+    with stats.phase("Старт"):
+        # Включаем систему стабилизации (SAS)
+        # SAS помогает стабилизировать корабль и удерживать ориентацию
+        vessel.control.sas = True
+
+        # Запуск двигателей: устанавливаем полную тягу
+        vessel.control.throttle = 1.0
+        time.sleep(3)  # Пауза для выхода двигателей на режим
+        vessel.control.activate_next_stage()  # Активируем первую ступень
     
-    # Фаза 1: Вертикальный подъём до 1 км
+    # Фаза 1: Вертикальный подъём до начала разворота (1 км)
     # Начальный вертикальный подъем необходим для:
     # 1. Набора безопасной высоты над стартовой площадкой
     # 2. Преодоления плотных слоев атмосферы с минимальными аэродинамическими потерями
-    while vessel.flight().surface_altitude < 1000:
-        time.sleep(0.1)  # Быстрый опрос для своевременного перехода к следующей фазе
-    
-    # Выключаем SAS для перехода к ручному управлению через автопилот
-    # SAS мешает плавному гравитационному развороту
-    vessel.control.sas = False
+    with stats.phase(f"Фаза 1: подъем до {turn_alt / 1000:.3g} км"):
+        # Сервер сам сообщит о достижении высоты - без опроса высоты
+        fired_at = wait_for_condition(conn, altitude_call, '>=', turn_alt)
     
-    # Устанавливаем азимут запуска
-    # 90° = строго на восток - оптимально для использования вращения Кербина
-    # (Кербин вращается с востока на запад, запуск на восток дает дополнительную скорость)
-    LAUNCH_AZIMUTH = 90
+        # Выключаем SAS для перехода к ручному управлению через автопилот
+        # SAS мешает плавному гравитационному развороту
+        vessel.control.sas = False
+        stats.triggered(fired_at)
     
-    vessel.auto_pilot.engage()  # Включаем автопилот kRPC
+        # Устанавливаем азимут запуска
+        # 90° = строго на восток - оптимально для использования вращения Кербина
+        # (Кербин вращается с востока на запад, запуск на восток дает дополнительную скорость)
+        auto_pilot = vessel.auto_pilot  # Один объект на весь разворот - без RPC на каждом шаге
+        auto_pilot.engage()  # Включаем автопилот kRPC
     
-    # Начальный угол тангажа (85° от горизонта)
-    # Почти вертикальный, но с небольшим наклоном для начала разворота
-    initial_pitch = 85
-    vessel.auto_pilot.target_pitch_and_heading(initial_pitch, LAUNCH_AZIMUTH)
+        # Начальный угол тангажа (85° от горизонта)
+        # Почти вертикальный, но с небольшим наклоном для начала разворота
+        auto_pilot.target_pitch_and_heading(initial_pitch, LAUNCH_AZIMUTH)
     
     current_pitch = initial_pitch  # Текущий угол для отслеживания
-    target_pitch = 45  # Целевой угол после завершения первой фазы разворота
     
     # Фаза 2: Гравитационный разворот от 1 до 10 км
     # Плавное уменьшение угла тангажа от 85° до 45° пропорционально высоте
     # Это позволяет оптимально набирать горизонтальную скорость
-    while vessel.flight().surface_altitude < 10000:
-        current_alt = vessel.flight().surface_altitude
+    # Высота приходит потоком: реагируем на каждое обновление, а не раз в 0.1 с
+    with stats.phase(f"Фаза 2: разворот {turn_alt / 1000:.3g}-{mid_alt / 1000:.3g} км"):
+        while True:
+            current_alt, updated_at = next_value(altitude)
+            if current_alt >= mid_alt:
+                break
         
-        # Плавное уменьшение угла тангажа с высотой
-        if current_alt > 1000:
-            # Расчет прогресса разворота: 0 на 1 км, 1 на 10 км
-            progress = (current_alt - 1000) / (10000 - 1000)
-            # Линейная интерполяция между начальным и целевым углом
-            new_pitch = initial_pitch - (initial_pitch - target_pitch) * progress
+            # Плавное уменьшение угла тангажа с высотой
+            if current_alt > turn_alt:
+                # Линейная интерполяция между точками излома программы
+                new_pitch = guidance(current_alt)
             
-            # Обновляем угол тангажа только если он уменьшился
-            if new_pitch < current_pitch:
-                current_pitch = new_pitch
-                vessel.auto_pilot.target_pitch_and_heading(current_pitch, LAUNCH_AZIMUTH)
-        
-        time.sleep(0.1)
+                # Обновляем угол тангажа только если он уменьшился на шаг
+                if pitch_due(current_pitch, new_pitch, end_pitch):
+                    current_pitch = new_pitch
+                    auto_pilot.target_pitch_and_heading(current_pitch, LAUNCH_AZIMUTH)
+                    stats.triggered(updated_at)
     
     # Ожидание выгорания твердого топлива (если есть твердотопливные ускорители)
     # Эта функция также продолжает гравитационный разворот во время работы SRB
-    wait_for_solid_fuel_empty(vessel, current_pitch, target_pitch)
-    
-    # Перезапуск жидкостных двигателей (если они были выключены)
-    # Некоторые конструкции ракет имеют возможность отключения ЖРД при работе SRB
-    vessel.control.throttle = 0.0
-    time.sleep(2)  # Пауза для стабилизации
-    vessel.control.activate_next_stage()  # Активируем следующую ступень (если нужно)
-    time.sleep(2)  # Пауза перед включением тяги
-    vessel.control.throttle = 1.0  # Полная тяга ЖРД
-    
-    # Фаза 3: Продолжение разворота до почти горизонтального полета (5°)
-    # Дальнейшее уменьшение тангажа для выхода на орбитальную траекторию
-    while vessel.flight().surface_altitude < 40000 and current_pitch > 5:
-        current_alt = vessel.flight().surface_altitude
-        
-        if current_alt > 10000:
-            # Прогресс от 10 км до 40 км
-            progress = (current_alt - 10000) / (40000 - 10000)
-            # Линейная интерполяция от 45° до 5°
-            new_pitch = target_pitch - (target_pitch - 5) * progress
-            
-            if new_pitch < current_pitch:
-                current_pitch = new_pitch
-                vessel.auto_pilot.target_pitch_and_heading(current_pitch, LAUNCH_AZIMUTH)
-        
-        time.sleep(0.1)
-    
-    # Устанавливаем почти горизонтальный полёт (1°)
-    # На этой высоте атмосфера достаточно разрежена для горизонтального полета
-    vessel.auto_pilot.target_pitch_and_heading(1, LAUNCH_AZIMUTH)
+    with stats.phase("Ожидание выгорания SRB"):
+        fired_at = wait_for_solid_fuel_empty(conn, vessel, current_pitch, altitude, guidance)
+    
+        # Перезапуск жидкостных двигателей (если они были выключены)
+        # Некоторые конструкции ракет имеют возможность отключения ЖРД при работе SRB
+        vessel.control.throttle = 0.0
+        stats.triggered(fired_at)
+        time.sleep(2)  # Пауза для стабилизации
+        vessel.control.activate_next_stage()  # Активируем следующую ступень (если нужно)
+        time.sleep(2)  # Пауза перед включением тяги
+        vessel.control.throttle = 1.0  # Полная тяга ЖРД
     
     # Контролируем апогей и выключаем двигатель при достижении цели
     # Это критически важно для выведения на правильную суборбитальную траекторию
     target_apo_max = 220000  # Максимальный апогей (220 км)
-    
-    while True:
-        # Получаем текущий апогей (проекцию самой высокой точки орбиты)
-        current_apo = vessel.orbit.apoapsis_altitude
-      
-        # Если апогей достиг или превысил целевую высоту
-        if current_apo >= target_apo_max:
-            vessel.control.throttle = 0.0  # Выключаем двигатель
-            break  # Завершаем активный участок выведения
+
+    # Апоцентр сравнивает сервер на каждом кадре - без опроса раз в 0.1 с.
+    # Событие включается до фазы 3: если программа тангажа заканчивается
+    # высоко, нужный апоцентр может набраться еще во время разворота
+    apo_reached = ConditionEvent(conn, conn.get_call(getattr, vessel.orbit, 'apoapsis_altitude'),
+                                 '>=', target_apo_max)
+
+    # Событие снимается и при ошибке (Ctrl-C, обрыв соединения): иначе
+    # выражение и его поток остаются на сервере
+    try:
+        # Фаза 3: Продолжение разворота до почти горизонтального полета (5°)
+        # Дальнейшее уменьшение тангажа для выхода на орбитальную траекторию
+        with stats.phase(f"Фаза 3: разворот до {end_alt / 1000:.3g} км"):
+            while current_pitch > end_pitch:
+                current_alt, updated_at = next_value(altitude)
+                if current_alt >= end_alt or apo_reached.fired.is_set():
+                    break
         
-        time.sleep(0.1)  # Частый опрос для точного контроля
+                if current_alt > mid_alt:
+                    # Линейная интерполяция по программе (исходная - от 45° до 5°)
+                    new_pitch = guidance(current_alt)
+            
+                    if pitch_due(current_pitch, new_pitch, end_pitch):
+                        current_pitch = new_pitch
+                        auto_pilot.target_pitch_and_heading(current_pitch, LAUNCH_AZIMUTH)
+                        stats.triggered(updated_at)
     
-    vessel.auto_pilot.disengage()  # Отключаем автопилот
-    time.sleep(2)  # Пауза для стабилизации
-    
-    # Отделение отработавших ступеней
-    # Этот процесс может включать несколько стадий разделения
-    vessel = update_active_vessel(conn, vessel)  # Обновляем объект корабля
-    control = vessel.control  # Получаем объект управления текущего корабля
-    
-    # Несколько циклов отделения (обычно 3: обтекатели, первая ступень, вторая ступень)
-    for i in range(3):
-        control.activate_next_stage()  # Активируем разделители или следующую ступень
-        time.sleep(2)  # Пауза для завершения процесса отделения
-        vessel = update_active_vessel(conn, vessel)  # Проверяем, не изменился ли активный корабль
-        control = vessel.control  # Обновляем объект управления
-    
-    # Включение систем через action group 1
-    # Обычно это солнечные батареи, антенны, научные приборы
-    vessel.control.toggle_action_group(1)
-    time.sleep(0.5)  # Короткая пауза
-    vessel = conn.space_center.active_vessel  # Финальное обновление объекта корабля
-    
-    # Выключаем двигатель для подготовки к маневру циркуляризации
-    # (на всякий случай, если двигатель был случайно включен)
-    vessel.control.throttle = 0.0
-    time.sleep(1)  # Пауза для уверенности
+        if predictor is None:
+            predictor = CutoffPredictor(target_apo_max)
+
+        with stats.phase("Разгон до апоцентра 220 км"):
+            if not apo_reached.fired.is_set():
+                # Устанавливаем почти горизонтальный полёт (1°)
+                # На этой высоте атмосфера достаточно разрежена для горизонтального полета
+                vessel.auto_pilot.target_pitch_and_heading(1, LAUNCH_AZIMUTH)
+
+            if predictor and not apo_reached.fired.is_set():
+                # Выключение по прогнозу (со снижением газа перед целью)
+                fired_at = cutoff_at_apoapsis(conn, vessel, predictor, apo_reached, streams)
+            else:
+                fired_at = apo_reached.wait()
+                vessel.control.throttle = 0.0  # Выключаем двигатель
+            stats.triggered(fired_at)
+    finally:
+        apo_reached.remove()
+    
+    with stats.phase("Разделение ступеней"):
+        vessel.auto_pilot.disengage()  # Отключаем автопилот
+        time.sleep(2)  # Пауза для стабилизации
+    
+        # Отделение отработавших ступеней
+        # Этот процесс может включать несколько стадий разделения
+        vessel = update_active_vessel(conn, vessel)  # Обновляем объект корабля
+        control = vessel.control  # Получаем объект управления текущего корабля
+    
+        # Несколько циклов отделения (обычно 3: обтекатели, первая ступень, вторая ступень)
+        for i in range(3):
+            control.activate_next_stage()  # Активируем разделители или следующую ступень
+            time.sleep(2)  # Пауза для завершения процесса отделения
+            vessel = update_active_vessel(conn, vessel)  # Проверяем, не изменился ли активный корабль
+            control = vessel.control  # Обновляем объект управления
+    
+        # Включение систем через action group 1
+        # Обычно это солнечные батареи, антенны, научные приборы
+        vessel.control.toggle_action_group(1)
+        time.sleep(0.5)  # Короткая пауза
+        vessel = conn.space_center.active_vessel  # Финальное обновление объекта корабля
+        streams.rebind(vessel)  # Если корабль сменился - потоки на новый
+    
+        # Выключаем двигатель для подготовки к маневру циркуляризации
+        # (на всякий случай, если двигатель был случайно включен)
+        vessel.control.throttle = 0.0
+        time.sleep(1)  # Пауза для уверенности
     
     # Целевые параметры орбиты
     target_apo = 220000  # 220 км - целевая высота апогея
     target_peri = 170000  # 170 км - целевая высота перигея
     
     # Выполнение маневра циркуляризации орбиты
-    final_apo, final_peri = perform_orbit_circularization(conn, vessel, target_apo, target_peri)
+    final_apo, final_peri = perform_orbit_circularization(conn, vessel, target_apo, target_peri,
+                                                          stats, streams)
+    if own_streams:
+        streams.close()
+
+    # Сколько RPC и какая задержка реакции на каждой фазе
+    stats.report()
+    return final_apo, final_peri
 
 
 if __name__ == '__main__':
     """
     Точка входа в программу при прямом запуске скрипта.
     """
-    launch_complete_mission()
+    parser = argparse.ArgumentParser(description="Запуск с автоматической циркуляризацией")
+    parser.add_argument('--trace', default=None,
+                        help="замеры RPC, ожиданий и фаз: файл трассы Chrome/Perfetto (JSON)")
+    args = parser.parse_args()
+    if args.trace:
+        instrument.enable(args.trace)
+        conn = krpc.connect(name='Запуск с автоматической циркуляризацией')
+        instrument.attach(conn, sys.modules[__name__])
+        launch_complete_mission(conn)
+    else:
+        launch_complete_mission()
@@ -0,0 +1,233 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')  # Без экрана: графики только в файлы
+import numpy as np
+
+import telemetry
+import varkt
+
+# ============================================
+# Бенчмарк: модель, загрузка логов, графики
+# ============================================
+#
+# Время - лучшее из нескольких повторов (perf_counter), память - отдельный
+# прогон под tracemalloc (пиковый объем выделенной памяти Python/NumPy).
+# Результаты сохраняются в JSON; --compare печатает отношение к старому файлу.
+
+# Размеры синтетических логов (строк)
+LOG_SIZES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Размеры пакетов траекторий
+BATCH_SIZES = (1, 100, 1000)
+
+# Размер лога для графиков
+PLOT_ROWS = 10_000
+
+DATA_DIR = "data/bench"
+
+
+# ============================================
+# Синтетические логи
+# ============================================
+
+def synthetic_columns(n_rows, seed=0):
+    """
+    Синтетический лог на n_rows строк: траектория модели на равномерной сетке
+    времени от 0 до t_max плюс небольшой шум (как у реальной телеметрии).
+    Возвращает массив (n_rows, 5) в порядке столбцов лога.
+    """
+    rng = np.random.default_rng(seed)
+    model = varkt.simulate_model(verbose=False)
+    t = np.linspace(0.0, varkt.t_max, n_rows)
+    out = np.empty((n_rows, len(telemetry.COLUMNS)))
+    out[:, 0] = t
+    # (столбец лога, столбец модели, шум)
+    for col, name, noise in ((1, 'pitch', 0.05), (2, 'height', 1.0), (3, 'speed', 0.1), (4, 'mass', 5.0)):
+        out[:, col] = model.at(t, name) + rng.normal(0.0, noise, n_rows)
+    return out
+
+
+def write_text_log(path, columns, chunk=100_000):
+    with open(path, 'w') as f:
+        f.write(telemetry.TEXT_HEADER)
+        for start in range(0, len(columns), chunk):
+            block = columns[start:start + chunk]
+            f.write(("%.2f %.2f %.2f %.2f %.2f\n" * len(block)) % tuple(block.ravel()))
+
+
+def write_binary_log(path, columns):
+    records = np.empty(len(columns), dtype=telemetry.record_dtype())
+    for i, (name, _) in enumerate(telemetry.COLUMNS):
+        records[name] = columns[:, i]
+    with open(path, 'wb') as f:
+        f.write(telemetry.encode_header())
+        records.tofile(f)
+
+
+def synthetic_log(n_rows, fmt='text', data_dir=DATA_DIR):
+    """Путь к синтетическому логу; файл создается один раз и переиспользуется."""
+    os.makedirs(data_dir, exist_ok=True)
+    ext = 'log' if fmt == 'text' else 'bin'
+    path = os.path.join(data_dir, f"synthetic_{n_rows}.{ext}")
+    if not os.path.exists(path):
+        columns = synthetic_columns(n_rows)
+        tmp = path + ".tmp"
+        if fmt == 'text':
+            write_text_log(tmp, columns)
+        else:
+            write_binary_log(tmp, columns)
+        os.replace(tmp, path)
+    return path
+
+
+# ============================================
+# Замеры
+# ============================================
+
+def measure(fn, repeats, trace_alloc=True):
+    """Время (лучшее и среднее из repeats) и пиковая память одного прогона."""
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    result = {
+        'repeats': repeats,
+        'best_s': min(times),
+        'mean_s': sum(times) / len(times),
+    }
+    if trace_alloc:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result['peak_bytes'] = peak
+    return result
+
+
+def repeats_for(n_rows, base):
+    # Большие логи грузим меньше раз
+    return max(1, min(base, 1_000_000 // max(n_rows, 1)))
+
+
+def build_cases(args):
+    """Список (имя, параметры, функция, повторы)."""
+    cases = [
+        ('simulate_model', {'method': 'euler'},
+         lambda: varkt.simulate_model(verbose=False), args.repeats),
+        ('simulate_model', {'method': 'rk45'},
+         lambda: varkt.simulate_model(method='rk45', verbose=False), args.repeats),
+    ]
+    for n in BATCH_SIZES:
+        cases.append(('simulate_batch', {'n_runs': n},
+                      lambda n=n: varkt.simulate_batch(n_runs=n), repeats_for(n * 1000, args.repeats)))
+
+    for n in LOG_SIZES:
+        if n > args.max_rows:
+            continue
+        for fmt in ('text', 'bin'):
+            path = synthetic_log(n, fmt, args.data_dir)
+            cases.append(('load_ksp_data', {'rows': n, 'format': fmt},
+                          lambda path=path: varkt.load_ksp_data(path), repeats_for(n, args.repeats)))
+
+    model = varkt.simulate_model(verbose=False)
+    ksp = varkt.load_ksp_data(synthetic_log(PLOT_ROWS, 'text', args.data_dir))
+    plot_dir = os.path.join(args.data_dir, "plots")
+    os.makedirs(plot_dir, exist_ok=True)
+    cases.append(('plot_comparison', {'figures': 4, 'rows': PLOT_ROWS},
+                  lambda: varkt.plot_all(model, ksp, plot_dir), max(1, args.repeats // 2)))
+    return cases
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def case_key(record):
+    params = ",".join(f"{k}={v}" for k, v in record['params'].items())
+    return f"{record['name']}({params})"
+
+
+def print_results(results, baseline=None):
+    old = {case_key(r): r for r in baseline['results']} if baseline else {}
+    header = f"{'операция':<42} {'повт.':>5} {'лучшее, мс':>11} {'среднее, мс':>12} {'пик, МБ':>9}"
+    if old:
+        header += f" {'было, мс':>10} {'x':>6}"
+    print(header)
+    print("-" * len(header))
+    for record in results:
+        key = case_key(record)
+        peak = record.get('peak_bytes')
+        peak = '-' if peak is None else f"{peak / 2**20:.1f}"
+        line = f"{key:<42} {record['repeats']:>5} {record['best_s'] * 1000:>11.2f} " \
+               f"{record['mean_s'] * 1000:>12.2f} {peak:>9}"
+        if key in old:
+            before = old[key]['best_s']
+            line += f" {before * 1000:>10.2f} {before / record['best_s']:>6.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк модели, загрузки логов и графиков")
+    parser.add_argument('--output', default='bench_results.json', help="файл результатов (JSON)")
+    parser.add_argument('--compare', default=None, help="прошлый файл результатов для сравнения")
+    parser.add_argument('--repeats', type=int, default=5, help="повторов на замер")
+    parser.add_argument('--max-rows', type=int, default=LOG_SIZES[-1],
+                        help="максимальный размер синтетического лога, строк")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="папка для синтетических логов")
+    parser.add_argument('--no-alloc', action='store_true', help="не замерять память (быстрее)")
+    parser.add_argument('--filter', default=None, help="только операции, содержащие эту строку")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print("Подготовка синтетических логов...")
+    results = []
+    for name, params, fn, repeats in build_cases(args):
+        if args.filter and args.filter not in name:
+            continue
+        record = {'name': name, 'params': params}
+        record.update(measure(fn, repeats, trace_alloc=not args.no_alloc))
+        results.append(record)
+        print(f"  {case_key(record)}: {record['best_s'] * 1000:.2f} мс")
+
+    print()
+    print_results(results, baseline)
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2, ensure_ascii=False)
+    print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
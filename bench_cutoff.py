@@ -0,0 +1,112 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+import mock_krpc
+from cutoff import CutoffPredictor
+
+# ============================================
+# Прогноз выключения по апоцентру: время вызова и точность
+# ============================================
+#
+# 1. Вызовы CutoffPredictor.predict на случайных состояниях конца выведения:
+#    время вызова и ошибка прогноза относительно того же интегрирования
+#    с очень мелким постоянным шагом.
+# 2. Полеты autopilot.py на замене kRPC (mock_krpc) с разной задержкой RPC:
+#    апоцентр в момент выключения при выключении по событию и по прогнозу.
+
+TARGET_APO = 220000.0
+
+# Задержки RPC для полетов, с реального времени (при warp W в моделировании - в W раз больше)
+LATENCIES = (0.0, 0.001, 0.002)
+
+
+def random_states(n, seed=0):
+    """Состояния конца выведения: (высота, верт. скорость, гориз. скорость, масса, тяга, расход, тангаж)."""
+    rng = np.random.default_rng(seed)
+    states = []
+    for _ in range(n):
+        thrust = rng.choice((1500000.0, 375000.0))
+        states.append((rng.uniform(40000, 90000), rng.uniform(200, 1000), rng.uniform(1000, 2200),
+                       rng.uniform(20000, 80000), thrust, thrust / 3444.0, rng.uniform(0, 10)))
+    return states
+
+
+def predictor_benchmark(n, checked=200, seed=0):
+    # Точность проверяем на первых checked состояниях с выключением в пределах
+    # 20 с (эталон с постоянным шагом медленный)
+    fast = CutoffPredictor(TARGET_APO)
+    reference = CutoffPredictor(TARGET_APO, min_step=0.002, max_step=0.002, horizon=20.0)
+    times, errors = [], []
+    for state in random_states(n, seed):
+        start = time.perf_counter()
+        predicted = fast.predict(*state)
+        times.append(time.perf_counter() - start)
+        if len(errors) < checked and 0 < predicted < 20.0:
+            exact = reference.predict(*state)
+            if math.isfinite(exact):
+                errors.append(predicted - exact)
+    times = np.array(times) * 1000
+    errors = np.abs(errors)
+    return {
+        'calls': n,
+        'mean_ms': float(times.mean()),
+        'p99_ms': float(np.percentile(times, 99)),
+        'max_ms': float(times.max()),
+        'cases': len(errors),
+        'error_mean_s': float(errors.mean()) if len(errors) else math.nan,
+        'error_max_s': float(errors.max()) if len(errors) else math.nan,
+    }
+
+
+def mission_benchmark(warp, latencies):
+    rows = []
+    for latency in latencies:
+        for mode in ('событие', 'прогноз'):
+            predictor = CutoffPredictor(TARGET_APO) if mode == 'прогноз' else False
+            result = mock_krpc.run_mission(warp, rpc_latency=latency, predictor=predictor)
+            row = {
+                'mode': mode,
+                'latency_s': latency * warp,
+                'cutoff_error': result['cutoff_apoapsis'] - TARGET_APO,
+                'apoapsis': result['apoapsis'],
+                'periapsis': result['periapsis'],
+                'rpc_count': result['rpc_count'],
+            }
+            if predictor:
+                row.update(predictor.report())
+            rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк прогноза выключения двигателя по апоцентру")
+    parser.add_argument('--calls', type=int, default=2000, help="число вызовов прогноза на случайных состояниях")
+    parser.add_argument('--warp', type=float, default=50.0, help="ускорение времени полетов")
+    parser.add_argument('--latency', type=float, nargs='*', default=list(LATENCIES),
+                        help="задержки RPC для полетов, с реального времени")
+    parser.add_argument('--no-missions', action='store_true', help="только вызовы прогноза, без полетов")
+    args = parser.parse_args()
+
+    r = predictor_benchmark(args.calls)
+    print(f"Прогноз: {r['calls']} вызовов, среднее {r['mean_ms']:.3f} мс, 99% {r['p99_ms']:.3f} мс, "
+          f"макс. {r['max_ms']:.3f} мс")
+    print(f"Ошибка момента выключения ({r['cases']} состояний): средняя {r['error_mean_s'] * 1000:.2f} мс, "
+          f"макс. {r['error_max_s'] * 1000:.2f} мс")
+    if args.no_missions:
+        return
+
+    rows = mission_benchmark(args.warp, args.latency)
+    print(f"\n{'выключение':<10} {'задержка, с':>11} {'ΔAп при выкл., м':>17} {'орбита, км':>16} "
+          f"{'RPC':>6} {'прогноз, мс':>12}")
+    for row in rows:
+        timing = f"{row['mean_ms']:.3f}/{row['max_ms']:.3f}" if 'calls' in row else '-'
+        print(f"{row['mode']:<10} {row['latency_s']:>11.2f} {row['cutoff_error']:>+17.0f} "
+              f"{row['apoapsis'] / 1000:>7.1f} x {row['periapsis'] / 1000:<6.1f} "
+              f"{row['rpc_count']:>6} {timing:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import time
+import numpy as np
+
+import varkt
+
+# ============================================
+# Сравнение интеграторов модели: шаги, время, точность
+# ============================================
+
+# (метод, параметры) - от грубого к точному
+CASES = [
+    ('euler', {'step': 0.1}),
+    ('euler', {'step': 0.01}),
+    ('euler', {'step': 0.001}),
+    ('rk4', {'step': 1.0}),
+    ('rk4', {'step': 0.5}),
+    ('rk4', {'step': 0.1}),
+    ('rk45', {'rtol': 1e-3}),
+    ('rk45', {'rtol': 1e-4}),
+    ('rk45', {'rtol': 1e-5}),
+    ('rk45', {'rtol': 1e-6}),
+    ('rk45', {'rtol': 1e-8}),
+    ('rk45', {'rtol': 1e-10}),
+]
+
+REPEATS = 5
+
+
+def final_state(result):
+    # Высота, скорость и масса в момент t_max (интерполяция по выходу модели)
+    return np.array([result.at(varkt.t_max, name) for name in ('height', 'speed', 'mass')])
+
+
+def ksp_rmse(result, ksp):
+    # Среднеквадратичная ошибка высоты и скорости относительно лога KSP
+    out = []
+    for name in ('height', 'speed'):
+        model = result.at(ksp['time'], name)
+        out.append(float(np.sqrt(np.mean((model - ksp[name])**2))))
+    return out
+
+
+def main():
+    # Эталон - очень мелкий шаг RK4
+    reference, _ = varkt.integrate_model(method='rk4', step=0.001, verbose=False)
+    ref_state = final_state(reference)
+
+    ksp = varkt.load_ksp_data()
+    has_ksp = len(ksp) > 0
+
+    header = f"{'метод':<6} {'параметры':<14} {'шагов':>6} {'отказ':>6} {'f(x)':>7} {'время, мс':>10} " \
+             f"{'ΔH(tmax), м':>12} {'ΔV(tmax), м/с':>14}"
+    if has_ksp:
+        header += f" {'RMSE H':>9} {'RMSE V':>8}"
+    print(header)
+    print("-" * len(header))
+
+    for method, kwargs in CASES:
+        best = None
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            result, info = varkt.integrate_model(method=method, verbose=False, **kwargs)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        err = np.abs(final_state(result) - ref_state)
+        label = ", ".join(f"{k}={v:g}" for k, v in kwargs.items())
+        line = f"{method:<6} {label:<14} {info['steps']:>6} {info['rejected']:>6} {info['rhs_evals']:>7} " \
+               f"{best * 1000:>10.2f} {err[0]:>12.2e} {err[1]:>14.2e}"
+        if has_ksp:
+            rmse_h, rmse_v = ksp_rmse(result, ksp)
+            line += f" {rmse_h:>9.1f} {rmse_v:>8.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
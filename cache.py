@@ -0,0 +1,156 @@
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+
+from trajectory import Trajectory
+
+# ============================================
+# Кэш результатов на диске
+# ============================================
+#
+# Расчет модели и разбор лога повторяются при каждом запуске varkt.py, хотя
+# параметры и файл не менялись. Результат (Trajectory) сохраняется в файл
+# .npz, имя которого - хэш всего, от чего результат зависит (ключ):
+#   модель - все параметры, интегратор и его настройки, шаг и длительность;
+#   лог    - путь, время изменения и размер файла (для сессии - всех ее
+#            файлов), t_max и t_min.
+# В каждый ключ входит и хэш исходного кода модулей расчета (CODE_FILES):
+# любая правка констант или формул в них дает новые ключи, старые записи
+# больше не находятся и со временем вытесняются.
+#
+# Размер кэша ограничен max_bytes: при записи вытесняются записи, которые
+# дольше всего не читались (время изменения файла обновляется при чтении).
+
+CACHE_DIR = 'data/cache'
+MAX_BYTES = 256 * 1024 * 1024
+
+# Модули, от кода которых зависят результаты в кэше
+CODE_FILES = ('varkt.py', 'guidance.py', 'trajectory.py', 'telemetry.py')
+
+_code_version = None
+
+
+def code_version():
+    """Хэш исходного кода CODE_FILES (считается один раз на процесс)."""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in CODE_FILES:
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(name.encode() + b'\0' + f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def make_key(kind, **parts):
+    """Ключ записи: хэш вида записи, версии кода и частей ключа (JSON, ключи по порядку)."""
+    text = json.dumps({'kind': kind, 'code': code_version(), **parts}, sort_keys=True, default=float)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class DiskCache:
+    """
+    Траектории на диске по ключу make_key(...).
+
+    get(key) - Trajectory или None, put(key, traj) - сохранить (и вытеснить
+    лишнее). Счетчики hits, misses и evicted - для отчета.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                columns = {name: data[name] for name in data.files}
+        except (OSError, ValueError, EOFError):
+            # Нет записи или она повреждена (например, оборвана запись)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)   # Отметка последнего чтения для вытеснения
+        except OSError:
+            pass
+        self.hits += 1
+        return Trajectory.from_columns(**columns)
+
+    def put(self, key, traj):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # Сначала во временный файл: другой процесс не увидит запись наполовину
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, 'wb') as f:
+            np.savez(f, **{name: traj[name] for name in traj.columns})
+        os.replace(temp, path)
+        self.evict()
+
+    def entries(self):
+        """Записи (время последнего чтения, размер, путь), старые первыми."""
+        try:
+            files = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.npz')]
+        except FileNotFoundError:
+            return []
+        result = []
+        for entry in files:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue   # Удалил другой процесс
+            result.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(result)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes=None):
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evicted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    def clear(self):
+        return self.evict(0)
+
+    def report(self):
+        return f"кэш: попаданий {self.hits}, промахов {self.misses}, вытеснено {self.evicted}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кэш расчетов модели и разобранных логов")
+    parser.add_argument('--dir', default=CACHE_DIR, help="папка кэша")
+    parser.add_argument('--max-mb', type=float, default=MAX_BYTES / 2**20, help="предел размера, МБ")
+    parser.add_argument('--clear', action='store_true', help="удалить все записи")
+    args = parser.parse_args()
+
+    cache = DiskCache(args.dir, int(args.max_mb * 2**20))
+    if args.clear:
+        cache.clear()
+    else:
+        cache.evict()
+    entries = cache.entries()
+    print(f"{args.dir}: записей {len(entries)}, {sum(size for _, size, _ in entries) / 2**20:.1f} МБ "
+          f"(предел {args.max_mb:g} МБ)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import compare
+import varkt
+
+# ============================================
+# Калибровка параметров модели по логу KSP
+# ============================================
+
+# Подбираемые параметры и их допустимые границы
+BOUNDS = {
+    'Cx': (0.1, 1.5),
+    'flow_booster_units': (30.0, 55.0),
+    'flow_core_units': (30.0, 55.0),
+    'F_booster_one': (400000.0, 900000.0),
+    'F_core_one': (1000000.0, 2000000.0),
+    'mass_drop_at_stage': (10000.0, 30000.0),
+    'booster_jettison_time': (55.0, 75.0),
+}
+
+DEFAULT_PARAMS = ('Cx', 'flow_booster_units', 'F_booster_one', 'mass_drop_at_stage')
+
+# Данные KSP в процессе-исполнителе (задаются один раз при запуске пула)
+_comparator = None
+
+
+def _init_worker(comparator):
+    global _comparator
+    _comparator = comparator
+
+
+def _evaluate(names, candidates):
+    # Стоимость = сумма нормированных среднеквадратичных невязок по каналам
+    params = {name: candidates[:, i] for i, name in enumerate(names)}
+    batch = varkt.simulate_batch(params)
+    return _comparator.cost(batch)
+
+
+def evaluate_parallel(pool, evaluate, names, candidates, workers):
+    """
+    Стоимости популяции: evaluate(names, кусок) в процессах пула
+    (evaluate - функция верхнего уровня модуля, чтобы ее можно было передать в процесс).
+    """
+    # Делим популяцию на равные куски по числу процессов
+    if pool is None:
+        return evaluate(names, candidates)
+    chunks = np.array_split(candidates, workers)
+    futures = [pool.submit(evaluate, names, chunk) for chunk in chunks if len(chunk)]
+    return np.concatenate([f.result() for f in futures])
+
+
+def differential_evolution(evaluate, lo, hi, popsize, generations, rng, x0=None, verbose=True):
+    """
+    Минимизация DE/rand/1/bin в границах [lo, hi].
+
+    evaluate(population) -> массив стоимостей (всё поколение за один вызов),
+    x0 - начальная точка (первая особь). Возвращает (лучшая точка, стоимость, число расчетов).
+    """
+    population = lo + rng.random((popsize, len(lo))) * (hi - lo)
+    if x0 is not None:
+        population[0] = np.clip(x0, lo, hi)
+
+    cost = evaluate(population)
+    evaluations = popsize
+    for gen in range(generations):
+        # Мутация и скрещивание
+        a, b, c = (population[rng.integers(0, popsize, popsize)] for _ in range(3))
+        F = rng.uniform(0.5, 1.0)
+        mutant = np.clip(a + F * (b - c), lo, hi)
+        cross = rng.random(population.shape) < 0.9
+        cross[np.arange(popsize), rng.integers(0, len(lo), popsize)] = True
+        trial = np.where(cross, mutant, population)
+
+        trial_cost = evaluate(trial)
+        evaluations += popsize
+        better = trial_cost < cost
+        population[better] = trial[better]
+        cost[better] = trial_cost[better]
+
+        if verbose:
+            print(f"[{gen + 1:3d}/{generations}] стоимость={cost.min():.5f}")
+
+    best = np.argmin(cost)
+    return population[best], float(cost[best]), evaluations
+
+
+def calibrate(ksp, names=DEFAULT_PARAMS, popsize=64, generations=40, workers=None,
+              seed=0, verbose=True):
+    """
+    Подбор параметров модели дифференциальной эволюцией (DE/rand/1/bin).
+
+    Каждое поколение считается одним пакетом varkt.simulate_batch,
+    разбитым на куски по процессам пула.
+
+    Возвращает словарь: params (подобранные значения), cost, rmse (по каналам),
+    evaluations, wall_time.
+    """
+    comparator = compare.Comparator(ksp)
+
+    workers = workers or os.cpu_count() or 1
+    rng = np.random.default_rng(seed)
+    lo = np.array([BOUNDS[name][0] for name in names])
+    hi = np.array([BOUNDS[name][1] for name in names])
+
+    start = time.perf_counter()
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(comparator,))
+    else:
+        _init_worker(comparator)
+
+    try:
+        # Первая особь - текущие значения из varkt.py
+        best, cost, evaluations = differential_evolution(
+            lambda candidates: evaluate_parallel(pool, _evaluate, names, candidates, workers),
+            lo, hi, popsize, generations, rng,
+            x0=[getattr(varkt, name) for name in names], verbose=verbose)
+        best_params = dict(zip(names, best.tolist()))
+        metrics = comparator.metrics(varkt.simulate_batch(best_params, n_runs=1))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return {
+        'params': best_params,
+        'cost': cost,
+        'rmse': {name: float(m['rmse'][0]) for name, m in metrics.items()},
+        'evaluations': evaluations,
+        'wall_time': time.perf_counter() - start,
+        'workers': workers,
+    }
+
+
+def print_report(result):
+    print("\nПодобранные параметры:")
+    for name, value in result['params'].items():
+        print(f"  {name:<22} {getattr(varkt, name):>14.6g} -> {value:<14.6g}")
+    print("\nНевязки (RMSE):")
+    for name, value in result['rmse'].items():
+        print(f"  {name:<8} {value:>12.3f} {compare.UNITS[name]}")
+    print(f"\nСтоимость: {result['cost']:.6f}")
+    print(f"Расчетов модели: {result['evaluations']} за {result['wall_time']:.2f} с "
+          f"({result['evaluations'] / result['wall_time']:.0f} траекторий/с, "
+          f"процессов: {result['workers']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Калибровка параметров varkt.py по логу KSP")
+    parser.add_argument('--log', default='data/ksp_launch.log', help="файл лога KSP")
+    parser.add_argument('--params', default=",".join(DEFAULT_PARAMS),
+                        help=f"подбираемые параметры через запятую (из: {', '.join(BOUNDS)})")
+    parser.add_argument('--popsize', type=int, default=64, help="размер популяции")
+    parser.add_argument('--generations', type=int, default=40, help="число поколений")
+    parser.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument('--seed', type=int, default=0, help="зерно генератора случайных чисел")
+    parser.add_argument('--output', default=None, help="сохранить результат в JSON")
+    args = parser.parse_args()
+
+    names = tuple(name.strip() for name in args.params.split(",") if name.strip())
+    unknown = [name for name in names if name not in BOUNDS]
+    if unknown:
+        parser.error(f"нельзя подбирать: {', '.join(unknown)}")
+
+    ksp = varkt.load_ksp_data(args.log)
+    if not len(ksp):
+        print("Данные KSP пусты! Проверь файл.")
+        return
+
+    result = calibrate(ksp, names, popsize=args.popsize, generations=args.generations,
+                       workers=args.workers, seed=args.seed)
+    print_report(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"Результат сохранен в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+
+import varkt
+
+# ============================================
+# Сравнение модели с телеметрией KSP в числах
+# ============================================
+#
+# Модель и лог KSP записаны на разных сетках времени, поэтому модель
+# интерполируется на моменты времени лога (линейно, векторизовано), и уже
+# по невязкам считаются RMSE, максимальная ошибка и смещение (bias) для
+# каждого канала - по всему полету и по фазам полета.
+#
+# Пакет траекторий (varkt.simulate_batch) оценивается целиком за один
+# проход: у всех строк пакета одна сетка времени, поэтому индексы и веса
+# интерполяции считаются один раз.
+
+CHANNELS = ('height', 'speed', 'mass', 'pitch')
+
+UNITS = {'height': 'м', 'speed': 'м/с', 'mass': 'кг', 'pitch': '°'}
+
+METRICS = ('rmse', 'max', 'bias')
+
+
+def flight_phases(times, heights, p):
+    """
+    Фазы полета по данным KSP: {имя: маска отсчетов}.
+    Границы - из параметров модели p (высота начала разворота, время сброса).
+    """
+    boosters = times < p['booster_jettison_time']
+    return {
+        'подъем': boosters & (heights < p['h_start']),
+        'разворот на ускорителях': boosters & (heights >= p['h_start']),
+        'центральный блок': ~boosters,
+    }
+
+
+def interp_weights(grid, times):
+    """Индексы и веса линейной интерполяции с сетки grid на моменты times."""
+    idx = np.clip(np.searchsorted(grid, times, side='right') - 1, 0, len(grid) - 2)
+    w = np.clip((times - grid[idx]) / (grid[idx + 1] - grid[idx]), 0.0, 1.0)
+    return idx, w
+
+
+class Comparator:
+    """
+    Подготовленные данные KSP для быстрого сравнения с моделью.
+
+    ksp - Trajectory (результат varkt.load_ksp_data), p - параметры модели
+    для границ фаз (по умолчанию - текущие из varkt.py).
+
+    Модель - Trajectory одной траектории или структурированный массив
+    пакета (n_runs, n_steps) из varkt.simulate_batch. Для пакета все
+    метрики - массивы длины n_runs.
+    """
+
+    def __init__(self, ksp, p=None, channels=CHANNELS):
+        p = varkt.default_params(**(p or {}))
+        self.channels = tuple(channels)
+        self.times = np.asarray(ksp['time'], dtype=float)
+        self.values = {name: np.asarray(ksp[name], dtype=float) for name in self.channels}
+        # Масштаб канала - размах данных KSP (чтобы каналы были сопоставимы)
+        self.scales = {name: max(float(np.ptp(v)), 1e-9) if len(v) else 1.0
+                       for name, v in self.values.items()}
+        self.phases = {name: mask for name, mask in
+                       flight_phases(self.times, self.values['height'], p).items() if mask.any()}
+
+    def __len__(self):
+        return len(self.times)
+
+    def residuals(self, model):
+        """Невязки модель - KSP: {канал: массив (..., число отсчетов KSP)}."""
+        grid = model['time']
+        if grid.ndim > 1:
+            grid = grid[0]  # У пакета одна сетка на все строки
+        idx, w = interp_weights(grid, self.times)
+        out = {}
+        for name in self.channels:
+            col = model[name]
+            resampled = col[..., idx] * (1.0 - w) + col[..., idx + 1] * w
+            out[name] = resampled - self.values[name]
+        return out
+
+    @staticmethod
+    def _metrics(res):
+        return {
+            'rmse': np.sqrt(np.mean(res**2, axis=-1)),
+            'max': np.max(np.abs(res), axis=-1),
+            'bias': np.mean(res, axis=-1),
+        }
+
+    def metrics(self, model, residuals=None):
+        """{канал: {rmse, max, bias}} по всему полету."""
+        residuals = residuals if residuals is not None else self.residuals(model)
+        return {name: self._metrics(res) for name, res in residuals.items()}
+
+    def phase_metrics(self, model, residuals=None):
+        """{фаза: {канал: {rmse, max, bias}}}."""
+        residuals = residuals if residuals is not None else self.residuals(model)
+        return {phase: {name: self._metrics(res[..., mask]) for name, res in residuals.items()}
+                for phase, mask in self.phases.items()}
+
+    def cost(self, model, residuals=None):
+        """Сумма нормированных среднеквадратичных невязок по каналам (для калибровки)."""
+        residuals = residuals if residuals is not None else self.residuals(model)
+        total = 0.0
+        for name, res in residuals.items():
+            total = total + np.mean((res / self.scales[name])**2, axis=-1)
+        return np.where(np.isfinite(total), total, np.inf)
+
+    def report(self, model):
+        """Отчет для одной траектории: словарь из чисел (можно сохранить в JSON)."""
+        residuals = self.residuals(model)
+
+        def as_float(metrics):
+            return {name: {k: float(v) for k, v in values.items()} for name, values in metrics.items()}
+
+        return {
+            'samples': len(self),
+            'cost': float(self.cost(model, residuals)),
+            'total': as_float(self.metrics(model, residuals)),
+            'phases': {phase: dict(as_float(metrics), samples=int(self.phases[phase].sum()))
+                       for phase, metrics in self.phase_metrics(model, residuals).items()},
+        }
+
+
+def compare(model, ksp, p=None):
+    """Отчет сравнения одной траектории модели с данными KSP."""
+    return Comparator(ksp, p).report(model)
+
+
+def format_report(report):
+    lines = [f"{'канал':<8} {'RMSE':>10} {'макс.':>10} {'смещение':>10}"]
+
+    def block(metrics):
+        for name in CHANNELS:
+            if name in metrics:
+                m = metrics[name]
+                lines.append(f"{name:<8} {m['rmse']:>10.2f} {m['max']:>10.2f} {m['bias']:>+10.2f}"
+                             f"  {UNITS[name]}")
+
+    lines.append(f"Весь полет ({report['samples']} отсчетов):")
+    block(report['total'])
+    for phase, metrics in report['phases'].items():
+        lines.append(f"{phase} ({metrics['samples']} отсчетов):")
+        block(metrics)
+    lines.append(f"Стоимость: {report['cost']:.6f}")
+    return "\n".join(lines)
+
+
+def parse_limits(text):
+    # "height=500,speed=30" -> {'height': 500.0, 'speed': 30.0}
+    limits = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, value = item.partition("=")
+        if name not in CHANNELS:
+            raise ValueError(f"Неизвестный канал: {name}")
+        limits[name] = float(value)
+    return limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Численное сравнение модели varkt.py с логом KSP")
+    parser.add_argument('--log', default='data/ksp_launch.log', help="файл лога KSP")
+    parser.add_argument('--method', choices=varkt.INTEGRATORS, default='euler', help="интегратор модели")
+    parser.add_argument('--json', default=None, help="сохранить отчет в JSON")
+    parser.add_argument('--max-rmse', default=None,
+                        help="пределы RMSE для проверки, например height=500,speed=30 "
+                             "(код выхода 1, если превышены)")
+    args = parser.parse_args()
+
+    try:
+        limits = parse_limits(args.max_rmse) if args.max_rmse else {}
+    except ValueError as e:
+        parser.error(str(e))
+
+    ksp = varkt.load_ksp_data(args.log)
+    if not len(ksp):
+        print("Данные KSP пусты! Проверь файл.")
+        sys.exit(2)
+
+    profile = varkt.load_profile()
+    model = varkt.simulate_model(profile, method=args.method, verbose=False)
+    report = compare(model, ksp, profile)
+    print(format_report(report))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Отчет сохранен в {args.json}")
+
+    failed = [name for name, limit in limits.items() if report['total'][name]['rmse'] > limit]
+    for name in failed:
+        print(f"ПРЕВЫШЕНИЕ: RMSE {name} = {report['total'][name]['rmse']:.2f} > {limits[name]:g} {UNITS[name]}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
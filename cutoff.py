@@ -0,0 +1,127 @@
+import math
+import time
+
+import varkt
+
+# ============================================
+# Прогноз момента выключения двигателя по апоцентру
+# ============================================
+#
+# Событие "апоцентр >= цели" срабатывает уже после пересечения цели, а
+# команда на выключение идет еще один RPC - за это время апоцентр успевает
+# вырасти. Поэтому время до пересечения считается заранее: состояние ракеты
+# (из потоков kRPC) интегрируется вперед той же физикой, что и в
+# varkt.simulate_model, плюс кривизна траектории (v²/r), при постоянных тяге
+# и тангаже. Апоцентр на каждом шаге - по формулам Кеплера.
+#
+# Шаг RK4 переменный: половина оставшегося до цели времени (по скорости
+# роста апоцентра), от min_step до max_step - поэтому шагов немного
+# (обычно 10-40) и вызов занимает около миллисекунды.
+
+MU = varkt.g0 * varkt.R ** 2   # Гравитационный параметр Кербина в модели, м³/с²
+
+
+def apoapsis_altitude(y, vx, vy, mu=MU, radius=varkt.R):
+    """Высота апоцентра по высоте y и скоростям vx (по горизонту), vy (вертикальной)."""
+    r = radius + y
+    energy = (vx * vx + vy * vy) / 2 - mu / r
+    if energy >= 0:
+        return math.inf
+    h = r * vx
+    e = math.sqrt(max(0.0, 1 + 2 * energy * h * h / (mu * mu)))
+    return -mu / (2 * energy) * (1 + e) - radius
+
+
+class CutoffPredictor:
+    """
+    Время до момента, когда апоцентр дорастет до target_apo.
+
+    predict(...) - секунды от текущего состояния (0 - цель уже достигнута,
+    inf - не достигается за horizon секунд). Счетчики calls, total_time и
+    max_time - сколько вызовов и сколько они заняли (реальное время).
+
+    Параметры:
+        target_apo: целевая высота апоцентра, м
+        params: параметры модели varkt (Cx, S для сопротивления)
+        mu, radius: гравитационный параметр и радиус планеты
+        min_step, max_step: пределы шага интегрирования, с
+        horizon: дальше этого времени не считаем, с
+    """
+
+    def __init__(self, target_apo, params=None, mu=MU, radius=varkt.R,
+                 min_step=0.05, max_step=0.5, horizon=30.0):
+        self.target_apo = target_apo
+        self.p = varkt.default_params(**(params or {}))
+        self.mu = mu
+        self.radius = radius
+        self.min_step = min_step
+        self.max_step = max_step
+        self.horizon = horizon
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def _rhs(self, s, thrust, mass_flow, pitch):
+        y, vx, vy, m = s
+        ax, ay = varkt.model_accelerations(y, vx, vy, m, thrust, pitch, self.p)
+        r = self.radius + y
+        return (vy, ax - vx * vy / r, ay + vx * vx / r, -mass_flow)
+
+    def _rk4(self, s, h, *args):
+        y, vx, vy, m = s
+        k1 = self._rhs(s, *args)
+        k2 = self._rhs((y + 0.5 * h * k1[0], vx + 0.5 * h * k1[1], vy + 0.5 * h * k1[2],
+                        m + 0.5 * h * k1[3]), *args)
+        k3 = self._rhs((y + 0.5 * h * k2[0], vx + 0.5 * h * k2[1], vy + 0.5 * h * k2[2],
+                        m + 0.5 * h * k2[3]), *args)
+        k4 = self._rhs((y + h * k3[0], vx + h * k3[1], vy + h * k3[2], m + h * k3[3]), *args)
+        c = h / 6
+        return (y + c * (k1[0] + 2 * k2[0] + 2 * k3[0] + k4[0]),
+                vx + c * (k1[1] + 2 * k2[1] + 2 * k3[1] + k4[1]),
+                vy + c * (k1[2] + 2 * k2[2] + 2 * k3[2] + k4[2]),
+                m + c * (k1[3] + 2 * k2[3] + 2 * k3[3] + k4[3]))
+
+    def predict(self, altitude, vertical_speed, horizontal_speed, mass, thrust, mass_flow, pitch):
+        """
+        Секунды до пересечения апоцентром цели при тяге thrust (Н), расходе
+        mass_flow (кг/с) и тангаже pitch (°), которые дальше не меняются.
+        """
+        start = time.perf_counter()
+        try:
+            return self._predict(altitude, vertical_speed, horizontal_speed, mass,
+                                 thrust, mass_flow, pitch)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.calls += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+
+    def _predict(self, altitude, vertical_speed, horizontal_speed, mass, thrust, mass_flow, pitch):
+        target = self.target_apo
+        s = (altitude, horizontal_speed, vertical_speed, mass)
+        apo = apoapsis_altitude(s[0], s[1], s[2], self.mu, self.radius)
+        if apo >= target:
+            return 0.0
+        if thrust <= 0 or mass <= 0:
+            return math.inf
+
+        t = 0.0
+        h = self.min_step
+        while t < self.horizon:
+            s_new = self._rk4(s, h, thrust, mass_flow, pitch)
+            apo_new = apoapsis_altitude(s_new[0], s_new[1], s_new[2], self.mu, self.radius)
+            if apo_new >= target:
+                # Внутри шага апоцентр растет почти линейно
+                if math.isinf(apo_new):
+                    return t + h
+                return t + h * (target - apo) / (apo_new - apo)
+            rate = (apo_new - apo) / h
+            t += h
+            s, apo = s_new, apo_new
+            remaining = (target - apo) / rate if rate > 0 else self.max_step
+            h = min(self.max_step, max(self.min_step, 0.5 * remaining))
+        return math.inf
+
+    def report(self):
+        mean = self.total_time / self.calls if self.calls else 0.0
+        return {'calls': self.calls, 'mean_ms': mean * 1000, 'max_ms': self.max_time * 1000}
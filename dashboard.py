@@ -0,0 +1,215 @@
+import argparse
+import os
+import time
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+
+import downsample
+import telemetry
+import varkt
+from trajectory import COLUMNS, Trajectory
+
+# ============================================
+# Графики во время полета: лог KSP против модели
+# ============================================
+#
+# varkt.py рисует четыре графика в файлы по готовому логу. Здесь все четыре
+# канала в одном окне, и лог читается по мере того, как его пишет
+# log_ksp.py (или mission.py).
+#
+# Кадр перерисовывается через blitting: оси, сетка и кривая модели рисуются
+# один раз и сохраняются как фон; в каждом кадре фон восстанавливается и
+# поверх рисуются только точки KSP (не больше точки на пиксель, см.
+# downsample.py). Кадров не больше fps в секунду - при телеметрии 100 Гц в
+# кадр попадает сразу пачка новых строк. Полная перерисовка - только когда
+# точки вышли за пределы осей.
+#
+# --headless - без окна (backend Agg): PNG по готовому логу - те же четыре
+# графика, что у varkt.py, и общий график dashboard.png.
+
+LOG_PATH = "data/ksp_launch.log"   # Лог log_ksp.py по умолчанию
+FPS = 10.0
+POLL_PERIOD = 0.1   # Как часто проверять лог, пока окно ждет событий, с
+
+def log_blocks(path):
+    """
+    Новые строки лога по мере записи (telemetry.iter_chunks в режиме follow):
+    при каждом next() - Trajectory из всех дописанных строк, пустая, если их нет.
+    """
+    chunks = telemetry.iter_chunks(path, follow=True, poll_interval=0)
+    while True:
+        blocks = []
+        for chunk in chunks:
+            if not len(chunk):
+                break
+            blocks.append(chunk)
+        log = np.concatenate(blocks) if blocks else np.zeros(0, dtype=telemetry.record_dtype())
+        yield Trajectory.from_columns(time=log['time'], height=log['altitude'], speed=log['speed'],
+                                      mass=log['mass'], pitch=log['pitch'])
+
+
+class LiveDashboard:
+    """
+    Одно окно с четырьмя графиками varkt.PLOTS: кривая модели model
+    (Trajectory) и точки KSP, которые добавляет add(block).
+
+    draw() - кадр: через blitting, если оси не изменились, иначе полная
+    перерисовка. Счетчики frames и full_redraws - для проверки, сколько
+    кадров обошлись без полной перерисовки.
+    """
+
+    def __init__(self, model, figsize=(14, 9)):
+        self.fig, axes = plt.subplots(2, 2, figsize=figsize)
+        self.axes = axes.ravel()
+        self.columns = [column for _, _, column, _ in varkt.PLOTS]
+        self.points = []
+        for ax, (title, y_label, column, _) in zip(self.axes, varkt.PLOTS):
+            ax.plot(model['time'], model[column], 'r-', linewidth=2.5, label='Мат. Модель (Теория)')
+            # animated: точки не рисуются при полной перерисовке, только в кадре
+            points, = ax.plot([], [], 'bo', markersize=2, alpha=0.6, label='KSP (Эксперимент)',
+                              animated=True)
+            self.points.append(points)
+            ax.set_title(title, fontsize=12)
+            ax.set_xlabel('Время (с)')
+            ax.set_ylabel(y_label)
+            ax.legend(loc='best')
+            ax.grid(True, alpha=0.3)
+        self.fig.tight_layout()
+
+        self.data = Trajectory(capacity=4096)
+        self.frames = 0
+        self.full_redraws = 0
+        self._background = None
+        self._new = True
+        # После любой полной перерисовки (в т.ч. изменения размера окна) - новый фон
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def add(self, block):
+        if len(block):
+            self.data.extend(*(block[name] for name in COLUMNS))
+            self._new = True
+
+    def _on_draw(self, event):
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_points()
+
+    def _draw_points(self):
+        for ax, points in zip(self.axes, self.points):
+            ax.draw_artist(points)
+
+    def _fit_axes(self):
+        # Расширяем оси с запасом, чтобы полная перерисовка была редкой
+        t = self.data['time']
+        if not len(t):
+            return False
+        changed = False
+        for ax, column in zip(self.axes, self.columns):
+            values = self.data[column]
+            x0, x1 = ax.get_xlim()
+            if t[-1] > x1:
+                ax.set_xlim(x0, x0 + (t[-1] - x0) * 1.5)
+                changed = True
+            low, high = float(values.min()), float(values.max())
+            y0, y1 = ax.get_ylim()
+            if low < y0 or high > y1:
+                margin = 0.1 * (max(high, y1) - min(low, y0) or 1.0)
+                ax.set_ylim(min(low, y0) - margin if low < y0 else y0,
+                            max(high, y1) + margin if high > y1 else y1)
+                changed = True
+        return changed
+
+    def draw(self):
+        if not self._new:
+            return
+        self._new = False
+        canvas = self.fig.canvas
+        rescaled = self._fit_axes()
+        for ax, points, column in zip(self.axes, self.points, self.columns):
+            # Не больше точки на пиксель: кадр не дорожает с длиной полета
+            points.set_data(*downsample.downsample(self.data['time'], self.data[column],
+                                                   max(1, int(ax.bbox.width)),
+                                                   max(1, int(ax.bbox.height))))
+        if self._background is None or rescaled:
+            self.full_redraws += 1
+            canvas.draw()   # Точки рисует _on_draw
+        else:
+            canvas.restore_region(self._background)
+            self._draw_points()
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+        self.frames += 1
+
+    def save(self, path, dpi=150):
+        # Анимированные точки savefig пропускает - на время сохранения делаем обычными
+        for points in self.points:
+            points.set_animated(False)
+        try:
+            self.fig.savefig(path, dpi=dpi)
+        finally:
+            for points in self.points:
+                points.set_animated(True)
+
+
+def follow(path, model, fps=FPS):
+    """Окно с графиками, которые дополняются по мере записи лога path; до закрытия окна."""
+    blocks = log_blocks(path)
+    dashboard = LiveDashboard(model)
+    plt.show(block=False)
+    period = 1.0 / fps
+    try:
+        while plt.fignum_exists(dashboard.fig.number):
+            frame_start = time.perf_counter()
+            dashboard.add(next(blocks))
+            dashboard.draw()
+            # Остаток кадра окно обрабатывает события (масштаб, закрытие)
+            remaining = period - (time.perf_counter() - frame_start)
+            if remaining > 0:
+                dashboard.fig.canvas.start_event_loop(min(remaining, POLL_PERIOD))
+    finally:
+        blocks.close()
+    return dashboard
+
+
+def render_pngs(path, model, out_dir='.'):
+    """Без окна: четыре графика varkt.PLOTS и общий dashboard.png по готовому логу."""
+    ksp = varkt.load_ksp_data(path)
+    os.makedirs(out_dir, exist_ok=True)
+    files = varkt.plot_all(model, ksp, out_dir)
+    dashboard = LiveDashboard(model)
+    dashboard.add(ksp)
+    dashboard.draw()
+    files.append(os.path.join(out_dir, 'dashboard.png'))
+    dashboard.save(files[-1])
+    plt.close(dashboard.fig)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Графики телеметрии KSP и модели во время полета")
+    parser.add_argument('log', nargs='?', default=LOG_PATH,
+                        help="лог телеметрии (текстовый или двоичный)")
+    parser.add_argument('--fps', type=float, default=FPS, help="не больше кадров в секунду")
+    parser.add_argument('--headless', action='store_true',
+                        help="без окна (Agg): сохранить PNG по готовому логу")
+    parser.add_argument('--out-dir', default='.', help="папка для PNG в режиме --headless")
+    args = parser.parse_args()
+
+    if args.headless:
+        matplotlib.use('Agg')
+
+    profile = varkt.load_profile()
+    model = varkt.simulate_model(profile)
+
+    if args.headless:
+        for filename in render_pngs(args.log, model, args.out_dir):
+            print(f"Сохранено: {filename}")
+        return
+
+    dashboard = follow(args.log, model, args.fps)
+    print(f"Кадров: {dashboard.frames}, полных перерисовок: {dashboard.full_redraws}, "
+          f"точек KSP: {len(dashboard.data)}")
+
+
+if __name__ == "__main__":
+    main()
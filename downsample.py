@@ -0,0 +1,103 @@
+import numpy as np
+
+# ============================================
+# Прореживание рядов для графиков
+# ============================================
+#
+# При 100 Гц за полет в ряду сотни тысяч точек, а по горизонтали на графике
+# около полутора тысяч пикселей: почти все точки рисуются друг поверх друга,
+# а время растеризации растет с длиной лога. Перед рисованием ряд
+# прореживается с сохранением формы:
+#   pixel  - по одной точке на пиксель (клетку сетки размером с график): для
+#            точечных графиков картинка та же, а точек не больше, чем
+#            занятых пикселей, при любой длине лога;
+#   minmax - в каждом столбце пикселей только точки с наименьшим и
+#            наибольшим значением: огибающая (пики, скачки при сбросе
+#            ступеней) остается на месте, точки между ними закрыты маркерами;
+#   lttb   - Largest-Triangle-Three-Buckets: по одной точке на корзину,
+#            выбирается точка с наибольшей площадью треугольника с соседними
+#            (для линий, когда нужно ровно n точек).
+# Время x должно возрастать (как в логе и модели).
+
+
+def minmax_indices(x, y, buckets):
+    """Номера точек (по возрастанию): минимум и максимум y в каждой из buckets корзин по x."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(x)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    span = x[-1] - x[0]
+    if span <= 0:
+        return np.array([int(np.argmin(y)), int(np.argmax(y))]) if n else np.arange(0)
+    ids = np.minimum(((x - x[0]) * (buckets / span)).astype(np.int64), buckets - 1)
+    # Внутри корзины - по возрастанию y: первая точка группы - минимум, последняя - максимум
+    order = np.lexsort((y, ids))
+    sorted_ids = ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.concatenate((order[starts], order[ends])))
+
+
+def pixel_indices(x, y, width, height):
+    """Номера точек (по возрастанию): по одной на занятую клетку сетки width x height по размаху x и y."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(x)
+    if n <= 2 * width:
+        return np.arange(n)
+    cells = []
+    for values, size in ((x, width), (y, height)):
+        low, high = values.min(), values.max()
+        scale = size / (high - low) if high > low else 0.0
+        cells.append(np.minimum(((values - low) * scale).astype(np.int64), size - 1))
+    _, first = np.unique(cells[0] * height + cells[1], return_index=True)
+    first.sort()
+    return first
+
+
+def lttb_indices(x, y, n_out):
+    """Номера n_out точек по алгоритму Largest-Triangle-Three-Buckets (первая и последняя - всегда)."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # Корзины между первой и последней точкой
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    result = np.empty(n_out, dtype=np.int64)
+    result[0] = 0
+    result[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Третья вершина - среднее следующей корзины (для последней - последняя точка)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+            cx, cy = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        result[i + 1] = a
+    return result
+
+
+METHODS = ('pixel', 'minmax', 'lttb')
+
+
+def downsample(x, y, width, height, method='pixel'):
+    """
+    Прореженный ряд (x, y) для графика width x height пикселей
+    (minmax и lttb высоту не используют: корзины только по x).
+    """
+    if method == 'pixel':
+        indices = pixel_indices(x, y, width, height)
+    elif method == 'minmax':
+        indices = minmax_indices(x, y, width)
+    elif method == 'lttb':
+        indices = lttb_indices(x, y, width)
+    else:
+        raise ValueError(f"Неизвестный способ прореживания: {method}. Доступны: {', '.join(METHODS)}")
+    return np.asarray(x)[indices], np.asarray(y)[indices]
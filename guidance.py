@@ -0,0 +1,116 @@
+from bisect import bisect_right
+
+import numpy as np
+
+# ============================================
+# Программа тангажа: общая для модели и автопилота
+# ============================================
+#
+# Программа задается точками излома (высота, тангаж): между соседними
+# точками тангаж меняется линейно, ниже первой точки держится тангаж первой,
+# выше последней - тангаж последней. Две точки на одной высоте - ступенька
+# (выше этой высоты действует вторая из них).
+#
+# Точки один раз переводятся в массивы, поиск отрезка - бинарный
+# (bisect для одной высоты в цикле управления, searchsorted для массива).
+# У пакета траекторий (varkt.simulate_batch) точки свои у каждой строки:
+# массивы формы (n_runs, число точек).
+
+
+class GuidanceProfile:
+    """
+    Программа тангажа по точкам излома.
+
+    altitudes, pitches - высоты (м, не убывают) и углы (°) точек излома:
+    последовательности одной длины или массивы (n_runs, число точек) для
+    пакета, где у каждой строки своя программа.
+
+    profile(altitude) - тангаж на одной высоте (число),
+    profile.evaluate(heights) - тангаж для массива высот (для пакета -
+    высоты строк пакета). profile(altitude) и breakpoints - только для
+    одной программы (у пакета - ValueError).
+    """
+
+    def __init__(self, altitudes, pitches):
+        self.altitudes = np.array(altitudes, dtype=float)
+        self.pitches = np.array(pitches, dtype=float)
+        if self.altitudes.shape != self.pitches.shape or self.altitudes.shape[-1] < 2:
+            raise ValueError("Нужно не меньше двух точек излома (высота, тангаж)")
+        if np.any(np.diff(self.altitudes, axis=-1) < 0):
+            raise ValueError("Высоты точек излома должны не убывать")
+        # Для поиска по одной высоте - обычные списки (без накладных расходов NumPy)
+        self._alt = self._pitch = None
+        if self.altitudes.ndim == 1:
+            self._alt = self.altitudes.tolist()
+            self._pitch = self.pitches.tolist()
+
+    def _batch_error(self):
+        return ValueError(f"Пакет из {self.altitudes.shape[0]} программ тангажа: "
+                          "нужна одна программа (точки излома у строк пакета свои)")
+
+    @classmethod
+    def from_breakpoints(cls, breakpoints):
+        """Программа из точек ((высота, тангаж), ...)."""
+        altitudes, pitches = zip(*breakpoints)
+        return cls(altitudes, pitches)
+
+    @classmethod
+    def from_params(cls, p):
+        """
+        Программа из параметров модели varkt (числа или массивы длины n_runs):
+        тангаж pitch_start до h_start, дальше по прямой от (turn_start_h,
+        pitch_start) к (h_mid, pitch_mid), затем к (h_high, pitch_high) и к
+        нулю на h_end; выше h_end - горизонтально.
+        """
+        start = np.maximum(p['h_start'], p['turn_start_h'])
+        fraction = (start - p['turn_start_h']) / (p['h_mid'] - p['turn_start_h'])
+        turn_pitch = p['pitch_start'] - (p['pitch_start'] - p['pitch_mid']) * fraction
+        zero = np.zeros_like(np.asarray(p['pitch_high'], dtype=float))
+        altitudes = np.broadcast_arrays(start, start, p['h_mid'], p['h_high'], p['h_end'])
+        pitches = np.broadcast_arrays(p['pitch_start'], turn_pitch, p['pitch_mid'],
+                                      p['pitch_high'], zero)
+        return cls(np.stack(altitudes, axis=-1), np.stack(pitches, axis=-1))
+
+    @property
+    def breakpoints(self):
+        """Точки излома ((высота, тангаж), ...) без ступенек - для вывода и фаз полета."""
+        if self._alt is None:
+            raise self._batch_error()
+        points = []
+        for altitude, pitch in zip(self._alt, self._pitch):
+            if not points or altitude > points[-1][0]:
+                points.append((altitude, pitch))
+        return tuple(points)
+
+    def __len__(self):
+        return self.altitudes.shape[-1]
+
+    def __call__(self, altitude):
+        # Те же действия, что в evaluate - результат совпадает до бита
+        alt = self._alt
+        if alt is None:
+            raise self._batch_error()
+        i = min(max(bisect_right(alt, altitude), 1), len(alt) - 1)
+        a0, a1 = alt[i - 1], alt[i]
+        width = a1 - a0 if a1 > a0 else 1.0
+        fraction = min(max((altitude - a0) / width, 0.0), 1.0)
+        start_pitch = self._pitch[i - 1]
+        return start_pitch - (start_pitch - self._pitch[i]) * fraction
+
+    def evaluate(self, heights):
+        """Тангаж для массива высот (для пакета - по одной высоте на строку)."""
+        heights = np.asarray(heights, dtype=float)
+        n = len(self)
+        if self.altitudes.ndim == 1:
+            i = np.clip(np.searchsorted(self.altitudes, heights, side='right'), 1, n - 1)
+            a0, a1 = self.altitudes[i - 1], self.altitudes[i]
+            p0, p1 = self.pitches[i - 1], self.pitches[i]
+        else:
+            # Точек излома мало, поэтому номер отрезка у каждой строки - просто
+            # число точек не выше ее высоты (то же, что searchsorted по строке)
+            i = np.clip((heights[:, None] >= self.altitudes).sum(axis=1), 1, n - 1)[:, None]
+            a0, a1 = (np.take_along_axis(self.altitudes, j, axis=1)[:, 0] for j in (i - 1, i))
+            p0, p1 = (np.take_along_axis(self.pitches, j, axis=1)[:, 0] for j in (i - 1, i))
+        width = np.where(a1 > a0, a1 - a0, 1.0)
+        fraction = np.clip((heights - a0) / width, 0.0, 1.0)
+        return p0 - (p0 - p1) * fraction
@@ -0,0 +1,251 @@
+import atexit
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from rpc_hook import on_rpc
+
+# ============================================
+# Замеры горячих мест полета (по запросу)
+# ============================================
+#
+# Где уходит время в autopilot.py и log_ksp.py: сколько длится каждый RPC
+# (по процедурам kRPC - по атрибутам: Flight_get_SurfaceAltitude,
+# Control_set_Throttle...), сколько фаза стоит в time.sleep, ожидании
+# потоков и событий и в vessel.auto_pilot.wait(), какой интервал между
+# отсчетами лога получается на самом деле.
+#
+# Включается вызовом enable() (в скриптах - флаг --trace): до этого attach()
+# ничего не подменяет, span() возвращает один и тот же пустой контекст, а
+# value() сразу выходит - в горячих циклах остается одна проверка.
+# Включенные замеры:
+#   attach(conn, *modules) - перехват каждого RPC (rpc_hook.on_rpc) и замена
+#     модуля time в modules (как mock_krpc.patch_time): замер каждого sleep;
+#   span(name) - участок кода (фаза, ожидание);
+#   value(name, x) - отдельное значение (интервал отсчетов, задержка реакции).
+# По каждому имени - гистограмма (логарифмические корзины, память не растет),
+# на выходе из программы - таблица (число, сумма, p50/p95/p99, максимум) и
+# файл трассы в формате Chrome Trace Event (chrome://tracing, ui.perfetto.dev):
+# участки по потокам, значения - счетчиками. Перцентили - по границам корзин
+# (точность около 25%).
+#
+# Участки меряются по настоящим часам, а значения - в тех единицах, в которых
+# их считает скрипт: в полете без KSP (mock_krpc.py) интервал отсчетов и
+# задержка реакции - во времени моделирования.
+
+MAX_EVENTS = 1_000_000   # Больше событий в трассу не пишем (память), счет - дальше
+BUCKETS_PER_DECADE = 10
+MIN_VALUE = 1e-7         # Нижняя граница гистограммы, с (0.1 мкс)
+DECADES = 9              # До 100 с
+
+
+class Histogram:
+    """Распределение длительностей (с) в логарифмических корзинах."""
+
+    EDGES = [MIN_VALUE * 10 ** (i / BUCKETS_PER_DECADE) for i in range(DECADES * BUCKETS_PER_DECADE + 1)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.EDGES) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_right(self.EDGES, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Верхняя граница корзины, в которую попадает доля q значений."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.EDGES[min(i, len(self.EDGES) - 1)], self.max)
+        return self.max
+
+
+class Tracer:
+    """
+    Гистограммы по именам и события трассы.
+
+    Время - time.perf_counter настоящего модуля time (даже если скрипт идет
+    по времени моделирования mock_krpc), в трассе - микросекунды от enable().
+    """
+
+    def __init__(self, path=None, max_events=MAX_EVENTS):
+        self.path = path
+        self.max_events = max_events
+        self.histograms = {}
+        self.events = []
+        self.dropped = 0
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def _event(self, event):
+        # Вызывается под self._lock
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        if len(self.events) < self.max_events:
+            event['tid'] = tid
+            self.events.append(event)
+        else:
+            self.dropped += 1
+
+    def _histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def complete(self, name, cat, start, end, args=None):
+        """Участок [start, end] (perf_counter): в гистограмму name и в трассу."""
+        with self._lock:
+            self._histogram(name).add(end - start)
+            event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': (start - self._start) * 1e6,
+                     'dur': (end - start) * 1e6, 'pid': 1}
+            if args:
+                event['args'] = args
+            self._event(event)
+
+    def value(self, name, value):
+        with self._lock:
+            self._histogram(name).add(value)
+            self._event({'name': name, 'cat': 'value', 'ph': 'C', 'pid': 1,
+                         'ts': (time.perf_counter() - self._start) * 1e6, 'args': {name: value}})
+
+    def instant(self, name, cat='mark'):
+        with self._lock:
+            self._event({'name': name, 'cat': cat, 'ph': 'i', 's': 't', 'pid': 1,
+                         'ts': (time.perf_counter() - self._start) * 1e6})
+
+    def write(self, path=None):
+        path = path or self.path
+        with self._lock:
+            names = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}}
+                     for tid, name in self._threads.items()]
+            data = {'traceEvents': names + self.events, 'displayTimeUnit': 'ms',
+                    'otherData': {'dropped_events': self.dropped}}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        return path
+
+    def summary(self):
+        lines = [f"{'Замер':<44} {'число':>8} {'сумма, мс':>11} {'p50, мс':>9} {'p95, мс':>9} "
+                 f"{'p99, мс':>9} {'макс, мс':>9}"]
+        with self._lock:
+            items = sorted(self.histograms.items(), key=lambda item: -item[1].total)
+        for name, h in items:
+            lines.append(f"{name[:44]:<44} {h.count:>8} {h.total * 1000:>11.1f} "
+                         f"{h.percentile(0.5) * 1000:>9.3f} {h.percentile(0.95) * 1000:>9.3f} "
+                         f"{h.percentile(0.99) * 1000:>9.3f} {h.max * 1000:>9.3f}")
+        if self.dropped:
+            lines.append(f"(в трассу не вошло событий: {self.dropped}, предел {self.max_events})")
+        return "\n".join(lines)
+
+
+_tracer = None
+
+
+def enable(path=None, max_events=MAX_EVENTS, report=True):
+    """
+    Включает замеры. path - файл трассы (JSON), записывается при выходе из
+    программы; report - печатать таблицу при выходе. Возвращает Tracer.
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(path, max_events)
+        atexit.register(_finish, _tracer, report)
+    return _tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def _finish(tracer, report):
+    if report:
+        print("\n" + tracer.summary())
+    if tracer.path:
+        print(f"Трасса ({len(tracer.events)} событий) сохранена в {tracer.write()}")
+
+
+class _TracedTime:
+    """Модуль time, в котором каждый sleep - участок 'sleep' трассы."""
+
+    def __init__(self, module, tracer):
+        self._module = module
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def sleep(self, seconds):
+        start = time.perf_counter()
+        try:
+            self._module.sleep(seconds)
+        finally:
+            self._tracer.complete('sleep', 'wait', start, time.perf_counter(),
+                                  {'requested': seconds})
+
+
+def attach(conn, *modules):
+    """
+    Замеры RPC соединения conn и sleep в modules (autopilot, log_ksp...).
+    Без enable() ничего не делает.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return
+    on_rpc(conn, lambda call: tracer.complete(f"rpc {call.procedure}", 'rpc', call.start, call.end))
+    for module in modules:
+        if not isinstance(module.time, _TracedTime):
+            module.time = _TracedTime(module.time, tracer)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+@contextmanager
+def _span(tracer, name, cat):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.complete(name, cat, start, time.perf_counter())
+
+
+def span(name, cat='span'):
+    """Участок кода: with instrument.span('auto_pilot.wait'): ..."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _span(_tracer, name, cat)
+
+
+def value(name, x):
+    """Значение x (с) в гистограмму name и счетчиком в трассу."""
+    if _tracer is not None:
+        _tracer.value(name, x)
+
+
+def instant(name, cat='mark'):
+    """Отметка момента в трассе (например, пропущенный срок отсчета)."""
+    if _tracer is not None:
+        _tracer.instant(name, cat)
@@ -1,56 +1,272 @@
+import argparse
+import math
+import os
+import sys
+import threading
 import time
 import krpc
 
-conn = krpc.connect(name="LaunchLogger")
-vessel = conn.space_center.active_vessel
+import instrument
+import telemetry
+from vessel_streams import VesselStreams
 
-# Создаём папку для данных
-import os
-os.makedirs("data", exist_ok=True)
+# Файл лога по умолчанию для каждого формата
+LOG_PATHS = {
+    'text': "data/ksp_launch.log",
+    'bin': "data/ksp_launch.bin",
+}
+LOG_PATH = LOG_PATHS['text']
 
-# Открываем файл
-file = open("data/ksp_launch.log", "w")
-file.write("Time Pitch Altitude Speed Mass\n")
 
 # Функция проверки запуска двигателей
-def is_launched():
+def is_launched(vessel):
     for engine in vessel.parts.engines:
         if engine.active:
             return True
     return False
 
-print("Ожидание запуска ракеты...")
-while not is_launched():
-    time.sleep(0.1)
-
-print("Ракета запущена! Начинаю запись...")
-mission_start_time = conn.space_center.ut
-last_write_time = mission_start_time
-
-try:
-    while True:
-        current_time = conn.space_center.ut
-        elapsed = current_time - mission_start_time
-        
-        # Записываем каждые 0.1 секунды
-        if current_time - last_write_time >= 0.1:
-            altitude = vessel.flight().surface_altitude
-            pitch = vessel.flight().pitch  # Угол тангажа
-            speed = vessel.flight(vessel.orbit.body.reference_frame).speed
-            mass = vessel.mass
-            
-            file.write(f"{elapsed:.2f} {pitch:.2f} {altitude:.2f} {speed:.2f} {mass:.2f}\n")
-            last_write_time = current_time
-            
-            # Вывод в консоль каждую секунду
-            if int(elapsed) != int(elapsed - 0.1):
-                print(f"[{elapsed:.1f}с] H={altitude:.0f}м, V={speed:.0f}м/с, pitch={pitch:.1f}°")
-        
-        time.sleep(0.01)  # Не грузим процессор
-
-except KeyboardInterrupt:
-    print("\nЗапись остановлена пользователем")
-finally:
-    file.close()
-    conn.close()
-    print("Данные сохранены в data/ksp_launch.log")
\ No newline at end of file
+
+# Каналы лога (VesselStreams) в порядке столбцов: ut, тангаж, высота, скорость, масса
+SAMPLER_CHANNELS = ('ut', 'pitch', 'surface_altitude', 'speed', 'mass')
+
+
+class StreamSampler:
+    """
+    Подписка на потоки kRPC для всех каналов лога.
+
+    Сервер присылает значения всех потоков одним сообщением; после его
+    обработки вызывается _on_update и сохраняет согласованный снимок
+    (ut, pitch, altitude, speed, mass). Чтение снимка не делает RPC.
+
+    streams - общие потоки VesselStreams (mission.py): тогда частоту
+    потоков не ограничиваем (ими пользуется и автопилот) и не закрываем их,
+    а после смены корабля (streams.rebind) берем потоки заново.
+    """
+
+    def __init__(self, conn, vessel, rate, streams=None):
+        self._conn = conn
+        self._own = streams is None
+        self._vessel_streams = VesselStreams(conn, vessel) if self._own else streams
+        self._rate = rate
+        self._lock = threading.Lock()
+        self._latest = None
+
+        self._streams = self._start_streams()
+        self._on_update()
+        conn.add_stream_update_callback(self._on_update)
+        if not self._own:
+            self._vessel_streams.subscribe(self._on_rebind)
+
+    def _start_streams(self):
+        streams = [self._vessel_streams[name] for name in SAMPLER_CHANNELS]
+        for stream in streams:
+            if self._own:
+                stream.rate = self._rate
+            stream.start()
+        return streams
+
+    def _on_update(self):
+        # Чтение потоков под блокировкой: rebind закрывает старые потоки
+        # только после _on_rebind, то есть не посреди чтения
+        with self._lock:
+            self._latest = tuple(stream() for stream in self._streams)
+
+    def _on_rebind(self, vessel_streams):
+        streams = self._start_streams()
+        with self._lock:
+            self._streams = streams
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+    def close(self):
+        self._conn.remove_stream_update_callback(self._on_update)
+        self._vessel_streams.unsubscribe(self._on_rebind)
+        if self._own:
+            self._vessel_streams.close()
+
+
+class RateStats:
+    """
+    Фактическая частота записи и дрожание интервала между отсчетами.
+    Хранит только суммы, поэтому память не растет со временем.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.samples = 0
+        self.repeats = 0  # Отсчеты без нового UT (сервер не обновился)
+        self.late = 0     # Отсчеты, опоздавшие больше чем на пол-периода
+        self._first = None
+        self._last = None
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._max_dev = 0.0
+
+    def add(self, now, deadline):
+        if now - deadline > self.period / 2:
+            self.late += 1
+            instrument.instant('опоздание отсчета')
+        if self._last is not None:
+            interval = now - self._last
+            instrument.value('интервал отсчетов', interval)
+            self._sum += interval
+            self._sum_sq += interval * interval
+            self._max_dev = max(self._max_dev, abs(interval - self.period))
+        else:
+            self._first = now
+        self._last = now
+        self.samples += 1
+
+    def achieved_rate(self):
+        if self.samples < 2:
+            return 0.0
+        return (self.samples - 1) / (self._last - self._first)
+
+    def jitter(self):
+        # Стандартное отклонение интервала и максимальное отклонение от периода (с)
+        n = self.samples - 1
+        if n < 1:
+            return 0.0, 0.0
+        mean = self._sum / n
+        var = max(0.0, self._sum_sq / n - mean * mean)
+        return math.sqrt(var), self._max_dev
+
+    def report(self):
+        std, max_dev = self.jitter()
+        return (f"частота {self.achieved_rate():.2f} Гц (цель {1 / self.period:.0f} Гц), "
+                f"дрожание {std * 1000:.2f} мс (макс. {max_dev * 1000:.2f} мс), "
+                f"опозданий {self.late}, повторов UT {self.repeats}")
+
+
+def run_logger(conn, path=LOG_PATH, rate=10.0, fmt='text', queue_size=65536,
+               policy='drop-oldest', fsync_interval=1.0, stop=None, streams=None,
+               start_ut=None, console=True, session=False, rotate_bytes=None, rotate_seconds=None,
+               compress=False):
+    # stop - threading.Event для остановки записи из другого потока (по умолчанию - Ctrl-C).
+    # streams - общие потоки VesselStreams, start_ut - начало отсчета времени лога
+    # (по умолчанию - момент запуска двигателей), console - печатать ли состояние.
+    # session - path это папка сессии: лог кусками (новый кусок - по rotate_bytes
+    # байт или rotate_seconds секунд), compress - сжатие gzip, см. telemetry.SessionLog
+    vessel = conn.space_center.active_vessel
+
+    if session:
+        file = writer = telemetry.SessionLog(path, fmt, rotate_bytes, rotate_seconds, compress)
+    else:
+        # Создаём папку для данных
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        # Открываем файл (текстовый или двоичный формат, см. telemetry.py)
+        file, writer = telemetry.open_log(path, fmt)
+
+    if start_ut is None:
+        print("Ожидание запуска ракеты...")
+        while not is_launched(vessel):
+            if stop is not None and stop.is_set():
+                file.close()
+                return None
+            time.sleep(0.1)
+
+    sampler = StreamSampler(conn, vessel, rate, streams)
+    period = 1.0 / rate
+    stats = RateStats(period)
+    last_print = -1
+
+    def status(row):
+        nonlocal last_print
+        # Вывод в консоль каждую секунду - из потока записи, а не из цикла опроса
+        elapsed, pitch, altitude, speed, mass = row
+        if int(elapsed) != last_print:
+            last_print = int(elapsed)
+            print(f"[{elapsed:.1f}с] H={altitude:.0f}м, V={speed:.0f}м/с, pitch={pitch:.1f}° | "
+                  f"{stats.achieved_rate():.1f} Гц")
+
+    # Запись на диск в отдельном потоке, чтобы диск не сбивал частоту опроса
+    output = telemetry.BackgroundWriter(file, writer, capacity=queue_size, policy=policy,
+                                        fsync_interval=fsync_interval,
+                                        status=status if console else None)
+
+    if start_ut is None:
+        print(f"Ракета запущена! Начинаю запись ({rate:g} Гц)...")
+    else:
+        print(f"Начинаю запись ({rate:g} Гц)...")
+    mission_start_time = sampler.latest()[0] if start_ut is None else start_ut
+    last_ut = None
+
+    try:
+        deadline = time.perf_counter()
+        while stop is None or not stop.is_set():
+            # Ждем следующего отсчета по фиксированной сетке
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.perf_counter()
+            stats.add(now, deadline)
+            deadline += period
+            if now - deadline > period:
+                # Сильно отстали (например, игра подвисла) - не пытаемся догонять
+                deadline = now + period
+
+            ut, pitch, altitude, speed, mass = sampler.latest()
+            if ut == last_ut:
+                stats.repeats += 1
+                continue
+            last_ut = ut
+            elapsed = ut - mission_start_time
+
+            output.put((elapsed, pitch, altitude, speed, mass))
+
+    except KeyboardInterrupt:
+        print("\nЗапись остановлена пользователем")
+    finally:
+        sampler.close()
+        # Дописываем все, что осталось в очереди, и закрываем файл
+        output.close()
+        print(f"Данные сохранены в {path}")
+        print(f"Итог: {stats.report()}")
+        print(f"Запись: {output.report()}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запись телеметрии запуска из KSP")
+    parser.add_argument('--rate', type=float, default=10.0, help="частота записи, Гц (10/50/100)")
+    parser.add_argument('--format', choices=sorted(telemetry.WRITERS), default='text',
+                        help="формат лога: text - текст, bin - двоичные записи для быстрой загрузки")
+    parser.add_argument('--output', default=None, help="файл лога (по умолчанию зависит от формата)")
+    parser.add_argument('--queue-size', type=int, default=65536, help="размер очереди записи, строк")
+    parser.add_argument('--on-full', choices=telemetry.OVERFLOW_POLICIES, default='drop-oldest',
+                        help="что делать при заполненной очереди записи")
+    parser.add_argument('--fsync-interval', type=float, default=1.0, help="период fsync, с")
+    parser.add_argument('--session', nargs='?', const='', default=None,
+                        help="писать в папку сессии (имя по умолчанию - дата и время): "
+                             "куски с ротацией и индексом по времени вместо одного файла")
+    parser.add_argument('--sessions-dir', default=telemetry.SESSIONS_DIR, help="папка сессий")
+    parser.add_argument('--rotate-mb', type=float, default=64.0, help="новый кусок сессии после стольких МБ")
+    parser.add_argument('--rotate-seconds', type=float, default=None,
+                        help="новый кусок сессии после стольких секунд лога")
+    parser.add_argument('--compress', action='store_true', help="сжимать куски сессии (gzip)")
+    parser.add_argument('--trace', default=None,
+                        help="замеры RPC, пауз и интервала отсчетов: файл трассы Chrome/Perfetto (JSON)")
+    args = parser.parse_args()
+    session = args.session is not None
+    if session:
+        path = os.path.join(args.sessions_dir, args.session or telemetry.session_name())
+    else:
+        path = args.output or LOG_PATHS[args.format]
+
+    if args.trace:
+        instrument.enable(args.trace)
+    conn = krpc.connect(name="LaunchLogger")
+    instrument.attach(conn, sys.modules[__name__])
+    try:
+        run_logger(conn, path, args.rate, args.format, args.queue_size, args.on_full,
+                   args.fsync_interval, session=session, rotate_bytes=int(args.rotate_mb * 2**20),
+                   rotate_seconds=args.rotate_seconds, compress=args.compress)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import sys
+import threading
+import time
+import krpc
+
+import autopilot
+import instrument
+import log_ksp
+from vessel_streams import VesselStreams
+
+# ============================================
+# Полет в одном процессе: автопилот, запись лога, контроль ступеней и
+# вывод состояния на одном соединении kRPC
+# ============================================
+#
+# Раньше autopilot.py и log_ksp.py запускались отдельными процессами: два
+# соединения, два набора одинаковых потоков (высота, скорость, масса), а в
+# логе нет того, что в этот момент делал автопилот. Здесь все задачи -
+# потоки одного процесса:
+#   - управление (autopilot.launch_complete_mission) - в основном потоке;
+#   - запись телеметрии (log_ksp.run_logger);
+#   - контроль ступеней: сброс массы и изменение тяги по общим потокам;
+#   - вывод состояния в консоль раз в секунду.
+# Все читают одни потоки VesselStreams. Фазы и команды автопилота (через
+# слушателя MissionStats) и события ступеней пишутся в журнал <лог>.events.jsonl
+# с тем же отсчетом времени, что и строки лога.
+
+# Сброс массы больше STAGE_MASS_DROP (доля) между отсчетами - отделение
+# ступени, изменение тяги больше THRUST_CHANGE (доля) - смена режима двигателей
+STAGE_MASS_DROP = 0.02
+THRUST_CHANGE = 0.1
+MONITOR_RATE = 10.0   # Частота контроля ступеней, Гц
+STATUS_PERIOD = 1.0   # Период вывода состояния, с
+
+
+class EventJournal:
+    """
+    Журнал событий полета: строки JSON {"time", "kind", "name", "value"}.
+
+    time - секунды от origin по времени игры (как в логе телеметрии).
+    Пишут несколько потоков (автопилот, контроль ступеней), поэтому запись
+    под блокировкой; каждая строка сразу сбрасывается на диск.
+    """
+
+    def __init__(self, path, streams, origin):
+        self.path = path
+        self._streams = streams
+        self._origin = origin
+        self._file = open(path, 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, kind, name, value=None):
+        record = {'time': round(self._streams.value('ut') - self._origin, 3), 'kind': kind, 'name': name,
+                  'value': value}
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + '\n')
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def monitor_staging(streams, emit, stop, rate=MONITOR_RATE):
+    """Контроль ступеней: сообщает emit о сбросе массы и изменении тяги."""
+    period = 1.0 / rate
+    last_mass = streams.value('mass')
+    last_thrust = streams.value('thrust')
+    while not stop.is_set():
+        time.sleep(period)
+        mass = streams.value('mass')
+        thrust = streams.value('thrust')
+        if last_mass - mass > STAGE_MASS_DROP * last_mass:
+            emit('staging', 'separation', round(last_mass - mass, 1))
+        if abs(thrust - last_thrust) > THRUST_CHANGE * max(last_thrust, 1.0):
+            emit('staging', 'thrust', round(thrust, 1))
+            last_thrust = thrust
+        last_mass = mass
+
+
+def print_status(streams, stats, stop, origin, period=STATUS_PERIOD):
+    """Вывод фазы и состояния корабля раз в period секунд."""
+    names = ('ut', 'surface_altitude', 'speed', 'apoapsis_altitude', 'thrust')
+    while not stop.is_set():
+        time.sleep(period)
+        ut, altitude, speed, apoapsis, thrust = streams.snapshot(names)
+        print(f"[{ut - origin:.0f}с] {stats.current_phase or '-'} | H={altitude / 1000:.1f}км, "
+              f"V={speed:.0f}м/с, Ap={apoapsis / 1000:.1f}км, тяга={thrust / 1000:.0f}кН")
+
+
+def run(conn, log_path=log_ksp.LOG_PATH, rate=10.0, fmt='text', status=True, **mission):
+    """
+    Полет с записью лога на одном соединении conn.
+
+    Параметры:
+        log_path, rate, fmt: файл, частота и формат лога телеметрии (log_ksp)
+        status: выводить ли состояние раз в секунду
+        mission: параметры autopilot.launch_complete_mission (profile, predictor)
+
+    Возвращает:
+        tuple: (final_apo, final_peri), как launch_complete_mission
+    """
+    vessel = conn.space_center.active_vessel
+    streams = VesselStreams(conn, vessel)
+    stats = autopilot.MissionStats(conn)
+    # Отсчет времени лога и журнала - от запуска полета (а не от включения
+    # двигателей, как у отдельного log_ksp.py)
+    origin = streams.value('ut')
+    journal = EventJournal(log_path + '.events.jsonl', streams, origin)
+    stats.listeners.append(journal)
+
+    stop = threading.Event()
+    tasks = [
+        threading.Thread(target=log_ksp.run_logger, name="logger",
+                         kwargs={'conn': conn, 'path': log_path, 'rate': rate, 'fmt': fmt,
+                                 'stop': stop, 'streams': streams, 'start_ut': origin,
+                                 'console': False}),
+        threading.Thread(target=monitor_staging, name="staging", args=(streams, journal, stop)),
+    ]
+    if status:
+        tasks.append(threading.Thread(target=print_status, name="status",
+                                      args=(streams, stats, stop, origin)))
+    for task in tasks:
+        task.start()
+
+    try:
+        result = autopilot.launch_complete_mission(conn, stats=stats, streams=streams, **mission)
+        journal('phase', 'Полет завершен')
+    finally:
+        stop.set()
+        for task in tasks:
+            task.join()
+        stats.listeners.remove(journal)
+        journal.close()
+        streams.close()
+    print(f"Журнал событий ({journal.count}) сохранен в {journal.path}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Полет с автопилотом и записью телеметрии на одном соединении kRPC")
+    parser.add_argument('--rate', type=float, default=10.0, help="частота записи, Гц")
+    parser.add_argument('--format', choices=sorted(log_ksp.LOG_PATHS), default='text',
+                        help="формат лога (см. telemetry.py)")
+    parser.add_argument('--output', default=None, help="файл лога (по умолчанию зависит от формата)")
+    parser.add_argument('--quiet', action='store_true', help="не выводить состояние раз в секунду")
+    parser.add_argument('--trace', default=None,
+                        help="замеры RPC, ожиданий и фаз: файл трассы Chrome/Perfetto (JSON)")
+    args = parser.parse_args()
+
+    if args.trace:
+        instrument.enable(args.trace)
+    conn = krpc.connect(name='Запуск с автоматической циркуляризацией')
+    instrument.attach(conn, autopilot, log_ksp, sys.modules[__name__])
+    try:
+        run(conn, args.output or log_ksp.LOG_PATHS[args.format], args.rate, args.format,
+            status=not args.quiet)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1038 @@
+import argparse
+import math
+import threading
+import time as real_time
+import types
+from contextlib import contextmanager
+
+import instrument
+import varkt
+
+# ============================================
+# Локальная замена kRPC без KSP
+# ============================================
+#
+# Поддерживается только то, что используют autopilot.py и log_ksp.py:
+# space_center (active_vessel, ut), vessel.flight(), orbit, resources,
+# auto_pilot, control (в т.ч. add_node), parts.engines, потоки (add_stream),
+# события по выражениям (krpc.add_event, krpc.Expression).
+#
+# Состояние ракеты считается той же физикой, что и varkt.simulate_model
+# (varkt.model_accelerations), плюс члены кривизны траектории (v²/r),
+# чтобы после выключения двигателя ракета летела по орбите.
+# Время моделирования идет в warp раз быстрее реального.
+
+SIM_DT = 0.02          # Шаг физики, с (как кадр физики KSP)
+PITCH_RATE = 10.0      # Скорость поворота ракеты автопилотом, °/с
+SF_DENSITY = 7.5       # кг на единицу SolidFuel
+LF_DENSITY = 5.0       # кг на единицу LiquidFuel
+
+# Ступени сверх параметров varkt.py (оценки для замены KSP)
+FAIRING_MASS = 1000.0      # Обтекатель, кг
+CORE_DRY_MASS = 10000.0    # Сухая масса центрального блока, кг
+UPPER_WET_MASS = 8000.0    # Верхняя ступень с полезной нагрузкой, кг
+UPPER_DRY_MASS = 2500.0
+UPPER_THRUST = 120000.0    # Н
+UPPER_ISP = 345.0          # с
+
+
+class MockCall:
+    """Вызов на стороне "сервера" (для потоков и выражений)."""
+
+    def __init__(self, func, args):
+        if func is getattr:
+            obj, name = args
+            self._fn = lambda: getattr(obj, name)
+        else:
+            self._fn = lambda: func(*args)
+
+    def __call__(self):
+        return self._fn()
+
+
+class MockStream:
+    def __init__(self, conn, call):
+        self._conn = conn
+        self._call = call
+        self._callbacks = []
+        self._started = False
+        self._removed = False
+        self._value = None
+        self.rate = 0.0
+        self.condition = threading.Condition()
+
+    def start(self, wait=True):
+        if not self._started:
+            universe = self._conn.universe
+            with universe.lock, universe.server_side():
+                self._value = self._call()
+            self._started = True
+            self._conn._streams.append(self)
+
+    def __call__(self):
+        if self._removed:
+            # Как в kRPC: удаленный поток больше не читается
+            raise RuntimeError("Stream does not exist")
+        if not self._started:
+            self.start()
+        return self._value
+
+    def wait(self, timeout=None):
+        if not self._started:
+            self.start()
+        self._conn.universe.wait_on(self.condition, timeout)
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def remove(self):
+        self._removed = True
+        if self in self._conn._streams:
+            self._conn._streams.remove(self)
+
+    def _update(self):
+        # Как сервер kRPC: обновление приходит только при изменении значения
+        value = self._call()
+        if value == self._value:
+            return False
+        with self.condition:
+            self._value = value
+            self._conn.universe.notify(self.condition)
+        for callback in list(self._callbacks):
+            callback(value)
+        return True
+
+
+class MockEvent:
+    def __init__(self, conn, expression):
+        self._stream = MockStream(conn, expression.evaluate)
+        self._callbacks = {}
+
+    @property
+    def condition(self):
+        return self._stream.condition
+
+    @property
+    def stream(self):
+        return self._stream
+
+    def start(self):
+        self._stream.start()
+        if self._stream():
+            # Условие уже выполнено - сообщаем сразу
+            for wrapper in list(self._callbacks.values()):
+                wrapper(True)
+
+    def wait(self, timeout=None):
+        self._stream.start()
+        with self.condition:
+            while not self._stream():
+                self._stream.wait(timeout)
+                if timeout is not None:
+                    return
+
+    def add_callback(self, callback):
+        def wrapper(value):
+            if value:
+                callback()
+        self._callbacks[callback] = wrapper
+        self._stream.add_callback(wrapper)
+
+    def remove_callback(self, callback):
+        wrapper = self._callbacks.pop(callback, None)
+        if wrapper is not None:
+            self._stream.remove_callback(wrapper)
+
+    def remove(self):
+        self._stream.remove()
+
+
+class MockExpression:
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+
+
+class _ExpressionBuilder:
+    """Подмножество krpc.Expression; каждый вызов - RPC, как в настоящем kRPC."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def _build(self, name, evaluate):
+        return self._conn._invoke('KRPC', 'Expression_static_' + name, [],
+                                  lambda: MockExpression(evaluate))
+
+    def call(self, call):
+        return self._build('Call', call)
+
+    def constant_double(self, value):
+        return self._build('ConstantDouble', lambda: value)
+
+    def constant_float(self, value):
+        return self._build('ConstantFloat', lambda: value)
+
+    def greater_than_or_equal(self, a, b):
+        return self._build('GreaterThanOrEqual', lambda: a.evaluate() >= b.evaluate())
+
+    def less_than_or_equal(self, a, b):
+        return self._build('LessThanOrEqual', lambda: a.evaluate() <= b.evaluate())
+
+    def greater_than(self, a, b):
+        return self._build('GreaterThan', lambda: a.evaluate() > b.evaluate())
+
+    def less_than(self, a, b):
+        return self._build('LessThan', lambda: a.evaluate() < b.evaluate())
+
+    def and_(self, a, b):
+        return self._build('And', lambda: a.evaluate() and b.evaluate())
+
+    def or_(self, a, b):
+        return self._build('Or', lambda: a.evaluate() or b.evaluate())
+
+
+class _KRPCService:
+    def __init__(self, conn):
+        self._conn = conn
+        self.Expression = _ExpressionBuilder(conn)
+
+    def add_event(self, expression):
+        return self._conn._invoke('KRPC', 'AddEvent', [expression], lambda: MockEvent(self._conn, expression))
+
+
+# ============================================
+# Объекты API (каждое обращение к свойству - один RPC)
+# ============================================
+
+class _Remote:
+    def __init__(self, conn):
+        self._conn = conn
+        self._universe = conn.universe
+
+    def _rpc(self, name, fn, *values):
+        # Потоки и выражения вычисляются "на сервере" - без учета RPC.
+        # Аргументы как у kRPC: объект, затем значения (их видит MissionStats)
+        if self._universe.is_server():
+            return fn()
+        return self._conn._invoke('SpaceCenter', name, [self, *values], fn)
+
+
+class MockReferenceFrame:
+    def __init__(self, name):
+        self.name = name
+
+
+class MockBody(_Remote):
+    name = 'Kerbin'
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self._frame = MockReferenceFrame('Kerbin')
+        self._non_rotating = MockReferenceFrame('Kerbin (non-rotating)')
+
+    @property
+    def equatorial_radius(self):
+        return self._rpc('CelestialBody_get_EquatorialRadius', lambda: float(varkt.R))
+
+    @property
+    def gravitational_parameter(self):
+        return self._rpc('CelestialBody_get_GravitationalParameter', lambda: self._universe.mu)
+
+    @property
+    def reference_frame(self):
+        return self._rpc('CelestialBody_get_ReferenceFrame', lambda: self._frame)
+
+    @property
+    def non_rotating_reference_frame(self):
+        # Планета в модели не вращается - скорости в обеих системах одинаковы
+        return self._rpc('CelestialBody_get_NonRotatingReferenceFrame', lambda: self._non_rotating)
+
+
+class MockOrbit(_Remote):
+    def __init__(self, conn):
+        super().__init__(conn)
+        self._body = MockBody(conn)
+
+    @property
+    def body(self):
+        return self._rpc('Orbit_get_Body', lambda: self._body)
+
+    @property
+    def apoapsis_altitude(self):
+        return self._rpc('Orbit_get_ApoapsisAltitude', lambda: self._universe.elements()['apoapsis'])
+
+    @property
+    def periapsis_altitude(self):
+        return self._rpc('Orbit_get_PeriapsisAltitude', lambda: self._universe.elements()['periapsis'])
+
+    @property
+    def semi_major_axis(self):
+        return self._rpc('Orbit_get_SemiMajorAxis', lambda: self._universe.elements()['sma'])
+
+    @property
+    def time_to_apoapsis(self):
+        return self._rpc('Orbit_get_TimeToApoapsis', lambda: self._universe.elements()['time_to_apoapsis'])
+
+    @property
+    def speed(self):
+        return self._rpc('Orbit_get_Speed', lambda: self._universe.speed())
+
+
+class MockFlight(_Remote):
+    @property
+    def surface_altitude(self):
+        return self._rpc('Flight_get_SurfaceAltitude', lambda: self._universe.y)
+
+    @property
+    def mean_altitude(self):
+        return self._rpc('Flight_get_MeanAltitude', lambda: self._universe.y)
+
+    @property
+    def pitch(self):
+        return self._rpc('Flight_get_Pitch', lambda: self._universe.pitch)
+
+    @property
+    def speed(self):
+        return self._rpc('Flight_get_Speed', lambda: self._universe.speed())
+
+    @property
+    def vertical_speed(self):
+        return self._rpc('Flight_get_VerticalSpeed', lambda: self._universe.vy)
+
+    @property
+    def horizontal_speed(self):
+        return self._rpc('Flight_get_HorizontalSpeed', lambda: self._universe.vx)
+
+
+class MockResources(_Remote):
+    def amount(self, name):
+        return self._rpc('Resources_Amount', lambda: self._universe.resource(name))
+
+
+class MockEngine(_Remote):
+    def __init__(self, conn, group):
+        super().__init__(conn)
+        self._group = group
+
+    @property
+    def active(self):
+        return self._rpc('Engine_get_Active', lambda: self._group in self._universe.active_engines)
+
+
+class MockParts(_Remote):
+    @property
+    def engines(self):
+        return self._rpc('Parts_get_Engines', lambda: [
+            MockEngine(self._conn, group) for group in ('booster', 'core', 'upper')
+        ])
+
+
+class MockNode(_Remote):
+    def __init__(self, conn, ut, prograde):
+        super().__init__(conn)
+        self.ut = ut
+        self.prograde = prograde
+        self._frame = MockReferenceFrame('Node')
+        self._removed = False
+
+    @property
+    def delta_v(self):
+        return self._rpc('Node_get_DeltaV', lambda: abs(self.prograde))
+
+    @property
+    def remaining_delta_v(self):
+        return self._rpc('Node_get_RemainingDeltaV',
+                         lambda: max(0.0, abs(self.prograde) - self._universe.node_burned))
+
+    @property
+    def time_to(self):
+        return self._rpc('Node_get_TimeTo', lambda: self.ut - self._universe.ut)
+
+    @property
+    def reference_frame(self):
+        return self._rpc('Node_get_ReferenceFrame', lambda: self._frame)
+
+    def remove(self):
+        def do():
+            self._removed = True
+            if self._universe.node is self:
+                self._universe.node = None
+        return self._rpc('Node_Remove', do)
+
+
+class MockAutoPilot(_Remote):
+    def engage(self):
+        return self._rpc('AutoPilot_Engage', lambda: self._universe.set('autopilot', True))
+
+    def disengage(self):
+        return self._rpc('AutoPilot_Disengage', lambda: self._universe.set('autopilot', False))
+
+    def target_pitch_and_heading(self, pitch, heading):
+        def do():
+            self._universe.target_pitch = float(pitch)
+            self._universe.target_prograde = False
+        return self._rpc('AutoPilot_TargetPitchAndHeading', do, pitch, heading)
+
+    @property
+    def reference_frame(self):
+        return self._rpc('AutoPilot_get_ReferenceFrame', lambda: self._universe.autopilot_frame)
+
+    @reference_frame.setter
+    def reference_frame(self, frame):
+        self._rpc('AutoPilot_set_ReferenceFrame', lambda: self._universe.set('autopilot_frame', frame))
+
+    @property
+    def target_direction(self):
+        return self._rpc('AutoPilot_get_TargetDirection', lambda: (0.0, 1.0, 0.0))
+
+    @target_direction.setter
+    def target_direction(self, direction):
+        # В системе отсчета узла (0, 1, 0) - направление импульса (по скорости)
+        def do():
+            frame = self._universe.autopilot_frame
+            self._universe.target_prograde = frame is not None and frame.name == 'Node'
+        self._rpc('AutoPilot_set_TargetDirection', do)
+
+    def wait(self):
+        # Ждем, пока ракета довернется до цели (время моделирования)
+        self._rpc('AutoPilot_Wait', lambda: None)
+        self._universe.wait_until(lambda: self._universe.pointing_error() < 0.5)
+
+
+class MockControl(_Remote):
+    @property
+    def throttle(self):
+        return self._rpc('Control_get_Throttle', lambda: self._universe.throttle)
+
+    @throttle.setter
+    def throttle(self, value):
+        self._rpc('Control_set_Throttle', lambda: self._universe.set('throttle', min(1.0, max(0.0, value))),
+                  value)
+
+    @property
+    def sas(self):
+        return self._rpc('Control_get_SAS', lambda: self._universe.sas)
+
+    @sas.setter
+    def sas(self, value):
+        self._rpc('Control_set_SAS', lambda: self._universe.set('sas', bool(value)))
+
+    def activate_next_stage(self):
+        return self._rpc('Control_ActivateNextStage', self._universe.activate_next_stage)
+
+    def toggle_action_group(self, group):
+        return self._rpc('Control_ToggleActionGroup', lambda: None)
+
+    def add_node(self, ut, prograde=0.0, normal=0.0, radial=0.0):
+        def do():
+            node = MockNode(self._conn, ut, prograde)
+            self._universe.node = node
+            self._universe.node_burned = 0.0
+            return node
+        return self._rpc('Control_AddNode', do)
+
+
+class MockVessel(_Remote):
+    name = 'Luna-9'
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self._orbit = MockOrbit(conn)
+        self._control = MockControl(conn)
+        self._auto_pilot = MockAutoPilot(conn)
+        self._resources = MockResources(conn)
+        self._parts = MockParts(conn)
+
+    def flight(self, reference_frame=None):
+        return self._rpc('Vessel_Flight', lambda: MockFlight(self._conn))
+
+    @property
+    def orbit(self):
+        return self._rpc('Vessel_get_Orbit', lambda: self._orbit)
+
+    @property
+    def control(self):
+        return self._rpc('Vessel_get_Control', lambda: self._control)
+
+    @property
+    def auto_pilot(self):
+        return self._rpc('Vessel_get_AutoPilot', lambda: self._auto_pilot)
+
+    @property
+    def resources(self):
+        return self._rpc('Vessel_get_Resources', lambda: self._resources)
+
+    @property
+    def parts(self):
+        return self._rpc('Vessel_get_Parts', lambda: self._parts)
+
+    @property
+    def mass(self):
+        return self._rpc('Vessel_get_Mass', lambda: self._universe.m)
+
+    @property
+    def available_thrust(self):
+        return self._rpc('Vessel_get_AvailableThrust', self._universe.available_thrust)
+
+    @property
+    def thrust(self):
+        return self._rpc('Vessel_get_Thrust', lambda: self._universe.thrust)
+
+    @property
+    def specific_impulse(self):
+        return self._rpc('Vessel_get_SpecificImpulse', self._universe.specific_impulse)
+
+
+class MockSpaceCenter(_Remote):
+    def __init__(self, conn):
+        super().__init__(conn)
+        self._vessel = MockVessel(conn)
+
+    @property
+    def active_vessel(self):
+        return self._rpc('get_ActiveVessel', lambda: self._vessel)
+
+    @property
+    def ut(self):
+        return self._rpc('get_UT', lambda: self._universe.ut)
+
+
+# ============================================
+# Соединение
+# ============================================
+
+class MockConnection:
+    """
+    Замена krpc.Client. rpc_count - число RPC через это соединение;
+    rpc_latency - искусственная задержка каждого RPC (с реального времени).
+    """
+
+    def __init__(self, universe, name=None, rpc_latency=0.0):
+        self.universe = universe
+        self.name = name
+        self.rpc_latency = rpc_latency
+        self.rpc_count = 0
+        self._streams = []
+        self._update_callbacks = []
+        self._update_condition = threading.Condition()
+        self.krpc = _KRPCService(self)
+        self.space_center = MockSpaceCenter(self)
+
+    def _invoke(self, service, procedure, args, fn):
+        self.rpc_count += 1
+        self.universe.rpc_count += 1
+        if self.rpc_latency:
+            real_time.sleep(self.rpc_latency)
+        with self.universe.lock:
+            return fn()
+
+    def add_stream(self, func, *args):
+        stream = MockStream(self, MockCall(func, args))
+        self.universe.stream_count += 1
+        self._invoke('KRPC', 'AddStream', [], stream.start)
+        return stream
+
+    @staticmethod
+    def get_call(func, *args):
+        return MockCall(func, args)
+
+    @property
+    def stream_update_condition(self):
+        return self._update_condition
+
+    def wait_for_stream_update(self, timeout=None):
+        self.universe.wait_on(self._update_condition, timeout)
+
+    def add_stream_update_callback(self, callback):
+        self._update_callbacks.append(callback)
+
+    def remove_stream_update_callback(self, callback):
+        if callback in self._update_callbacks:
+            self._update_callbacks.remove(callback)
+
+    def _update_streams(self):
+        updated = False
+        for stream in list(self._streams):
+            updated |= stream._update()
+        if updated:
+            for callback in list(self._update_callbacks):
+                callback()
+            with self._update_condition:
+                self.universe.notify(self._update_condition)
+
+    def close(self):
+        self.universe.disconnect(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ============================================
+# Физика
+# ============================================
+
+class MockUniverse:
+    """
+    Состояние ракеты и поток моделирования.
+
+    warp - во сколько раз моделирование быстрее реального времени.
+    Состояние (x, y, vx, vy, m) - то же, что в varkt.simulate_model.
+    """
+
+    def __init__(self, warp=20.0, params=None):
+        self.warp = warp
+        self.p = varkt.default_params(**(params or {}))
+        self.mu = varkt.g0 * varkt.R ** 2
+        self.lock = threading.RLock()
+        self.tick = threading.Condition(self.lock)
+        # Кто чего ждет: поток -> условие его wait_on (None - уже разбужен
+        # notify, но еще не вернулся из wait). Для lockstep в replay.py
+        self.idle = threading.Condition()
+        self._waits = {}
+        self.connections = []
+        self.rpc_count = 0      # RPC и потоки всех соединений (автопилот + запись лога)
+        self.stream_count = 0
+        self.thread = None
+        self._stop = threading.Event()
+        self._server = threading.local()
+
+        self.ut = 0.0
+        self.x = 0.0
+        self.y = 11.24  # Начальная высота из лога
+        self.vx = 0.0
+        self.vy = 0.0
+        self.pitch = 90.0
+        self.throttle = 0.0
+        self.throttle_log = []  # (ut, ступень, газ, апоцентр) на каждую команду газа
+        self.thrust = 0.0
+        self.sas = False
+        self.autopilot = False
+        self.autopilot_frame = None
+        self.target_pitch = 90.0
+        self.target_prograde = False
+        self.node = None
+        self.node_burned = 0.0
+
+        p = self.p
+        self.stage = 0
+        self.active_engines = set()
+        self.booster_rate = p['flow_booster_units'] * 4           # ед. SolidFuel/с
+        self.core_rate = p['flow_core_units'] * 5.0 / LF_DENSITY  # ед. LiquidFuel/с
+        self.solid_fuel = self.booster_rate * p['booster_jettison_time']
+        self.booster_dry = p['mass_drop_at_stage']
+        core_and_upper = p['m0'] - self.solid_fuel * SF_DENSITY - self.booster_dry
+        self.liquid_fuel = max(0.0, core_and_upper - FAIRING_MASS - CORE_DRY_MASS - UPPER_WET_MASS) / LF_DENSITY
+        self.upper_fuel = (UPPER_WET_MASS - UPPER_DRY_MASS) / LF_DENSITY
+        self.m = p['m0']
+
+    # --- соединения и поток ---
+
+    def connect(self, name=None, rpc_latency=0.0):
+        conn = MockConnection(self, name, rpc_latency)
+        self.connections.append(conn)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="mock-krpc", daemon=True)
+            self.thread.start()
+        return conn
+
+    def disconnect(self, conn):
+        if conn in self.connections:
+            self.connections.remove(conn)
+        if not self.connections:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        with self.idle:
+            self.idle.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def _run(self):
+        start = real_time.perf_counter()
+        sim_start = self.ut
+        while not self._stop.is_set():
+            with self.lock:
+                self.step(SIM_DT)
+                self.notify(self.tick)
+            for conn in list(self.connections):
+                conn._update_streams()
+            # Держим темп: warp секунд моделирования за секунду реального времени
+            delay = start + (self.ut - sim_start) / self.warp - real_time.perf_counter()
+            if delay > 0:
+                real_time.sleep(delay)
+
+    def is_server(self):
+        return threading.current_thread() is self.thread or getattr(self._server, 'active', False)
+
+    @contextmanager
+    def server_side(self):
+        # Вычисления "на сервере" (значения потоков) не считаются RPC
+        self._server.active = True
+        try:
+            yield
+        finally:
+            self._server.active = False
+
+    def wait_until(self, predicate, timeout=None):
+        # Ожидание условия во времени моделирования
+        with self.tick:
+            end = None if timeout is None else self.ut + timeout
+            while not predicate() and not self._stop.is_set():
+                if end is not None and self.ut >= end:
+                    return False
+                self.wait_on(self.tick, 1.0)
+        return True
+
+    def wait_on(self, condition, timeout=None):
+        """
+        condition.wait(timeout) (замок condition взят) с отметкой: поток
+        ждет condition. Все ожидания замены kRPC идут через него.
+        """
+        thread = threading.current_thread()
+        with self.idle:
+            self._waits[thread] = condition
+            self.idle.notify_all()
+        try:
+            return condition.wait(timeout)
+        finally:
+            with self.idle:
+                self._waits.pop(thread, None)
+
+    def notify(self, condition):
+        """condition.notify_all() (замок condition взят) с отметкой разбуженных потоков."""
+        with self.idle:
+            for thread, waiting in self._waits.items():
+                if waiting is condition:
+                    self._waits[thread] = None
+        condition.notify_all()
+
+    def is_waiting(self, thread):
+        """Поток ждет в wait_on и его не будили (вызывать под замком idle)."""
+        return self._waits.get(thread) is not None
+
+    def set(self, name, value):
+        if name == 'throttle':
+            self.throttle_log.append((self.ut, self.stage, value, self.elements()['apoapsis']))
+        setattr(self, name, value)
+
+    # --- двигатели и ступени ---
+
+    def activate_next_stage(self):
+        self.stage += 1
+        if self.stage == 1:
+            # Зажигание ускорителей и центрального блока
+            self.active_engines = {'booster', 'core'}
+        elif self.stage == 2:
+            # Сброс ускорителей (с остатками топлива)
+            self.m -= self.booster_dry + self.solid_fuel * SF_DENSITY
+            self.solid_fuel = 0.0
+            self.active_engines.discard('booster')
+        elif self.stage == 3:
+            self.m -= FAIRING_MASS
+        elif self.stage == 4:
+            # Отделение центрального блока, включается верхняя ступень
+            self.m -= CORE_DRY_MASS + self.liquid_fuel * LF_DENSITY
+            self.liquid_fuel = 0.0
+            self.active_engines = {'upper'}
+        return []
+
+    def resource(self, name):
+        if name == 'SolidFuel':
+            return self.solid_fuel
+        if name == 'LiquidFuel':
+            return self.liquid_fuel + self.upper_fuel
+        return 0.0
+
+    def available_thrust(self):
+        thrust = 0.0
+        if 'booster' in self.active_engines and self.solid_fuel > 0:
+            thrust += self.p['F_booster_one'] * 4
+        if 'core' in self.active_engines and self.liquid_fuel > 0:
+            thrust += self.p['F_core_one']
+        if 'upper' in self.active_engines and self.upper_fuel > 0:
+            thrust += UPPER_THRUST
+        return thrust
+
+    def specific_impulse(self):
+        if 'upper' in self.active_engines:
+            return UPPER_ISP
+        mu = self.p['flow_core_units'] * 5.0
+        return self.p['F_core_one'] / (mu * varkt.g0)
+
+    def _engines(self, dt):
+        # Тяга и расход за шаг; ускорители не дросселируются (как в KSP)
+        thrust = 0.0
+        dm = 0.0
+        if 'booster' in self.active_engines and self.solid_fuel > 0:
+            thrust += self.p['F_booster_one'] * 4
+            used = min(self.solid_fuel, self.booster_rate * dt)
+            self.solid_fuel -= used
+            dm += used * SF_DENSITY
+        if 'core' in self.active_engines and self.liquid_fuel > 0 and self.throttle > 0:
+            thrust += self.p['F_core_one'] * self.throttle
+            used = min(self.liquid_fuel, self.core_rate * self.throttle * dt)
+            self.liquid_fuel -= used
+            dm += used * LF_DENSITY
+        if 'upper' in self.active_engines and self.upper_fuel > 0 and self.throttle > 0:
+            thrust += UPPER_THRUST * self.throttle
+            rate = UPPER_THRUST / (UPPER_ISP * varkt.g0) / LF_DENSITY
+            used = min(self.upper_fuel, rate * self.throttle * dt)
+            self.upper_fuel -= used
+            dm += used * LF_DENSITY
+        return thrust, dm
+
+    # --- состояние ---
+
+    def speed(self):
+        return math.sqrt(self.vx ** 2 + self.vy ** 2)
+
+    def flight_path_angle(self):
+        return math.degrees(math.atan2(self.vy, self.vx)) if self.speed() > 1e-6 else 90.0
+
+    def pointing_error(self):
+        target = self.flight_path_angle() if self.target_prograde else self.target_pitch
+        return abs(target - self.pitch)
+
+    def elements(self):
+        # Кеплерова орбита по (r, vx, vy): vx - по горизонту, vy - вертикально
+        r = varkt.R + self.y
+        v2 = self.vx ** 2 + self.vy ** 2
+        h = r * self.vx
+        energy = v2 / 2 - self.mu / r
+        if energy >= 0:
+            return {'apoapsis': math.inf, 'periapsis': r - varkt.R, 'sma': math.inf,
+                    'time_to_apoapsis': math.inf}
+        sma = -self.mu / (2 * energy)
+        e = math.sqrt(max(0.0, 1 + 2 * energy * h * h / self.mu ** 2))
+        # Истинная аномалия -> эксцентрическая -> средняя
+        nu = math.atan2(h * self.vy / self.mu, h * h / (self.mu * r) - 1)
+        E = 2 * math.atan2(math.sqrt(1 - e) * math.sin(nu / 2), math.sqrt(1 + e) * math.cos(nu / 2))
+        M = E - e * math.sin(E)
+        n = math.sqrt(self.mu / sma ** 3)
+        time_to_apo = ((math.pi - M) % (2 * math.pi)) / n
+        return {
+            'apoapsis': sma * (1 + e) - varkt.R,
+            'periapsis': sma * (1 - e) - varkt.R,
+            'sma': sma,
+            'time_to_apoapsis': time_to_apo,
+        }
+
+    def step(self, dt):
+        # Ориентация: автопилот доворачивает с ограниченной скоростью, SAS держит
+        if self.autopilot:
+            target = self.flight_path_angle() if self.target_prograde else self.target_pitch
+            delta = max(-PITCH_RATE * dt, min(PITCH_RATE * dt, target - self.pitch))
+            self.pitch += delta
+
+        thrust, dm = self._engines(dt)
+        self.thrust = thrust
+        on_pad = self.y <= 11.24 and self.vy <= 0 and self.speed() < 1.0
+
+        # Физика varkt + кривизна (центробежное ускорение и кориолисов член)
+        ax, ay = varkt.model_accelerations(self.y, self.vx, self.vy, self.m, thrust, self.pitch, self.p)
+        r = varkt.R + self.y
+        ax -= self.vx * self.vy / r
+        ay += self.vx ** 2 / r
+
+        self.vx += ax * dt
+        self.vy += ay * dt
+        if on_pad and ay <= 0:
+            # Стоит на столе: тяги меньше веса
+            self.vx = self.vy = 0.0
+        self.x += self.vx * dt
+        self.y += self.vy * dt
+        self.m -= dm
+        self.ut += dt
+
+        if self.node is not None and thrust > 0:
+            self.node_burned += thrust / self.m * dt
+
+
+def connect(name=None, warp=20.0, params=None, rpc_latency=0.0):
+    """Аналог krpc.connect: новое моделирование и соединение с ним."""
+    return MockUniverse(warp, params).connect(name, rpc_latency)
+
+
+# ============================================
+# Время моделирования для скриптов
+# ============================================
+
+class SimTime(types.SimpleNamespace):
+    """
+    Замена модуля time для autopilot.py / log_ksp.py: sleep, time,
+    monotonic и perf_counter идут по времени моделирования.
+    """
+
+    def __init__(self, universe):
+        super().__init__()
+        self._universe = universe
+
+    def sleep(self, seconds):
+        # Допуск на накопленную ошибку суммы шагов SIM_DT
+        target = self._universe.ut + seconds - 1e-9
+        self._universe.wait_until(lambda: self._universe.ut >= target)
+
+    def time(self):
+        return self._universe.ut
+
+    monotonic = time
+    perf_counter = time
+
+
+@contextmanager
+def patch_time(universe, *modules):
+    """Временно подменяет модуль time в указанных модулях на SimTime."""
+    sim_time = SimTime(universe)
+    saved = [(module, module.time) for module in modules]
+    for module in modules:
+        module.time = sim_time
+    try:
+        yield sim_time
+    finally:
+        for module, original in saved:
+            module.time = original
+
+
+class SimEvent:
+    """threading.Event, ожидание которого - wait_until замены kRPC."""
+
+    def __init__(self, universe):
+        self._universe = universe
+        self._flag = False
+
+    def is_set(self):
+        return self._flag
+
+    def set(self):
+        with self._universe.tick:
+            self._flag = True
+            self._universe.notify(self._universe.tick)
+
+    def clear(self):
+        self._flag = False
+
+    def wait(self, timeout=None):
+        # timeout - во времени моделирования
+        self._universe.wait_until(lambda: self._flag, timeout)
+        return self._flag
+
+
+@contextmanager
+def patch_threading(universe, *modules):
+    """
+    Временно подменяет модуль threading в modules: threading.Event - SimEvent
+    (остальное - настоящий threading).
+    """
+    sim_threading = types.SimpleNamespace(**vars(threading))
+    sim_threading.Event = lambda: SimEvent(universe)
+    saved = [(module, module.threading) for module in modules]
+    for module in modules:
+        module.threading = sim_threading
+    try:
+        yield sim_threading
+    finally:
+        for module, original in saved:
+            module.threading = original
+
+
+# ============================================
+# Полный полет без KSP
+# ============================================
+
+def run_mission(warp=20.0, log_path=None, log_rate=10.0, log_format='text', rpc_latency=0.0,
+                shared=False, **mission):
+    """
+    Полет autopilot.launch_complete_mission на замене kRPC; при log_path
+    параллельно пишет телеметрию через log_ksp.run_logger (отдельное соединение,
+    как два процесса в настоящем KSP). shared - вместо этого полет через
+    mission.run: все задачи на одном соединении и общих потоках. mission -
+    параметры для launch_complete_mission (profile, predictor).
+    Возвращает словарь с итогами.
+    """
+    import autopilot
+    import log_ksp
+    import mission as mission_runner
+
+    universe = MockUniverse(warp)
+    conn = universe.connect('Запуск с автоматической циркуляризацией', rpc_latency)
+    logger_thread = None
+    stop = threading.Event()
+
+    with patch_time(universe, autopilot, log_ksp, mission_runner):
+        # Замеры (instrument.enable) - поверх времени моделирования
+        instrument.attach(conn, autopilot, log_ksp, mission_runner)
+        if log_path is not None and not shared:
+            log_conn = universe.connect('LaunchLogger', rpc_latency)
+            instrument.attach(log_conn)
+            logger_thread = threading.Thread(
+                target=log_ksp.run_logger, name="logger",
+                kwargs={'conn': log_conn, 'path': log_path, 'rate': log_rate, 'fmt': log_format,
+                        'stop': stop})
+            logger_thread.start()
+
+        start = real_time.perf_counter()
+        if shared:
+            final_apo, final_peri = mission_runner.run(
+                conn, log_path or log_ksp.LOG_PATH, log_rate, log_format, **mission)
+        else:
+            final_apo, final_peri = autopilot.launch_complete_mission(conn, **mission)
+        wall = real_time.perf_counter() - start
+
+        stop.set()
+        if logger_thread is not None:
+            logger_thread.join()
+
+    # Апоцентр в момент выключения центрального блока (первая команда газа 0
+    # после сброса ускорителей)
+    cutoff = [apo for ut, stage, value, apo in universe.throttle_log if stage == 2 and value == 0.0]
+    result = {
+        'cutoff_apoapsis': cutoff[0] if cutoff else None,
+        'apoapsis': final_apo,
+        'periapsis': final_peri,
+        'sim_time': universe.ut,
+        'wall_time': wall,
+        'speedup': universe.ut / wall,
+        'rpc_count': conn.rpc_count,
+        'rpc_total': universe.rpc_count,
+        'stream_count': universe.stream_count,
+    }
+    universe.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Полет autopilot.py без KSP (замена kRPC на модели varkt)")
+    parser.add_argument('--warp', type=float, default=20.0, help="ускорение времени")
+    parser.add_argument('--log', default=None, help="параллельно писать телеметрию в этот файл")
+    parser.add_argument('--rate', type=float, default=10.0, help="частота записи телеметрии, Гц")
+    parser.add_argument('--format', choices=('text', 'bin'), default='text', help="формат лога")
+    parser.add_argument('--rpc-latency', type=float, default=0.0,
+                        help="искусственная задержка RPC, с (имитация загруженной игры)")
+    parser.add_argument('--shared', action='store_true',
+                        help="полет через mission.py: автопилот и запись лога на одном соединении")
+    parser.add_argument('--trace', default=None,
+                        help="замеры RPC, ожиданий и фаз: файл трассы Chrome/Perfetto (JSON)")
+    args = parser.parse_args()
+
+    if args.trace:
+        instrument.enable(args.trace)
+
+    result = run_mission(args.warp, args.log, args.rate, args.format, args.rpc_latency,
+                         shared=args.shared)
+    print(f"\nОрбита: {result['apoapsis'] / 1000:.1f} x {result['periapsis'] / 1000:.1f} км")
+    if result['cutoff_apoapsis'] is not None:
+        print(f"Апоцентр при выключении двигателя: {result['cutoff_apoapsis'] / 1000:.3f} км")
+    print(f"Время полета {result['sim_time']:.0f} с за {result['wall_time']:.1f} с "
+          f"(x{result['speedup']:.0f}), RPC автопилота: {result['rpc_count']}")
+    print(f"Всего RPC: {result['rpc_total']}, потоков: {result['stream_count']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import varkt
+
+# ============================================
+# Монте-Карло: разброс траекторий при допусках параметров
+# ============================================
+#
+# Параметры ракеты разыгрываются случайно в пределах допусков, траектории
+# считаются пакетами varkt.simulate_batch в нескольких процессах.
+# Траектории не хранятся: каждый пакет сразу добавляется в гистограммы
+# (своя на каждый шаг времени и канал), по которым потом считаются
+# процентили. Память не зависит от числа прогонов.
+
+# Допуски: (тип, сигма) - 'rel' в долях номинала, 'abs' в единицах параметра.
+# Отклонения нормальные, обрезаются на 3 сигмах.
+TOLERANCES = {
+    'Cx': ('rel', 0.10),
+    'F_booster_one': ('rel', 0.02),
+    'F_core_one': ('rel', 0.02),
+    'flow_booster_units': ('rel', 0.02),
+    'flow_core_units': ('rel', 0.02),
+    'm0': ('rel', 0.01),
+    'booster_jettison_time': ('abs', 0.5),
+}
+
+CHANNELS = ('height', 'speed', 'mass')
+
+PERCENTILES = (5, 50, 95)
+
+CHUNK = 500      # Траекторий в одном пакете
+BINS = 512       # Корзин гистограммы на шаг времени
+PILOT_RUNS = 256     # Траекторий для границ гистограмм (первые пакеты)
+MIN_PILOT_RUNS = 32  # Меньше - границы по физическому диапазону каналов
+MAX_CLIPPED = 0.001  # Больше этой доли значений за границами - пересчет с точными границами
+
+
+def sample_params(rng, n, tolerances=TOLERANCES):
+    """Случайные параметры для n прогонов: {имя: массив длины n}."""
+    nominal = varkt.default_params()
+    params = {}
+    for name, (kind, sigma) in tolerances.items():
+        deviation = np.clip(rng.standard_normal(n), -3.0, 3.0) * sigma
+        if kind == 'rel':
+            params[name] = nominal[name] * (1.0 + deviation)
+        else:
+            params[name] = nominal[name] + deviation
+    return params
+
+
+def run_chunk(seed, n, every=1):
+    """Один пакет: параметры из своего зерна (воспроизводимо при любом числе процессов)."""
+    rng = np.random.default_rng(seed)
+    return varkt.simulate_batch(sample_params(rng, n), n_runs=n, every=every)
+
+
+class Envelope:
+    """
+    Потоковая статистика по пакетам траекторий: для каждого шага времени
+    и канала - гистограмма на bins корзин, точные min/max и число прогонов.
+
+    Границы корзин свои на каждом шаге: [lo, hi] берутся из первых
+    пакетов (не меньше PILOT_RUNS траекторий) с запасом. Значения за
+    границами попадают в крайние корзины (их число - в clipped), min/max
+    при этом остаются точными.
+    """
+
+    def __init__(self, grid, lo, hi, bins=BINS, channels=CHANNELS):
+        self.grid = grid
+        self.channels = tuple(channels)
+        self.bins = bins
+        self.lo = lo
+        self.width = {name: (hi[name] - lo[name]) / bins for name in self.channels}
+        n_steps = len(grid)
+        self.counts = {name: np.zeros((n_steps, bins), dtype=np.int64) for name in self.channels}
+        self.min = {name: np.full(n_steps, np.inf) for name in self.channels}
+        self.max = {name: np.full(n_steps, -np.inf) for name in self.channels}
+        self.runs = 0
+        self.clipped = 0
+
+    @classmethod
+    def from_pilot(cls, batch, bins=BINS, channels=CHANNELS, margin=0.5):
+        # Границы: разброс пилотных траекторий плюс margin его ширины с каждой
+        # стороны. По нескольким траекториям разброс на шаге не оценить -
+        # тогда на всех шагах физический диапазон канала: от 0 до удвоенного
+        # максимума за весь полет (корзины шире, но разброс не схлопывается)
+        if len(batch) < MIN_PILOT_RUNS:
+            n_steps = batch.shape[1]
+            lo = {name: np.zeros(n_steps) for name in channels}
+            hi = {name: np.full(n_steps, 2.0 * max(float(np.nanmax(batch[name])), 1.0))
+                  for name in channels}
+            return cls(batch['time'][0].copy(), lo, hi, bins, channels)
+        lo, hi = {}, {}
+        for name in channels:
+            col = batch[name]
+            cmin, cmax = col.min(axis=0), col.max(axis=0)
+            span = np.maximum(cmax - cmin, 1e-6 * np.maximum(1.0, np.abs(cmax)))
+            lo[name] = cmin - margin * span
+            hi[name] = cmax + margin * span
+        return cls(batch['time'][0].copy(), lo, hi, bins, channels)
+
+    def rebinned(self, margin=0.01):
+        """Пустая статистика с границами по точным min/max этой (всех прогонов)."""
+        lo, hi = {}, {}
+        for name in self.channels:
+            span = np.maximum(self.max[name] - self.min[name],
+                              1e-6 * np.maximum(1.0, np.abs(self.max[name])))
+            lo[name] = self.min[name] - margin * span
+            hi[name] = self.max[name] + margin * span
+        return Envelope(self.grid, lo, hi, self.bins, self.channels)
+
+    def clipped_fraction(self):
+        total = self.runs * len(self.grid) * len(self.channels)
+        return self.clipped / total if total else 0.0
+
+    def empty_like(self):
+        hi = {name: self.lo[name] + self.width[name] * self.bins for name in self.channels}
+        return Envelope(self.grid, self.lo, hi, self.bins, self.channels)
+
+    def add(self, batch):
+        n_runs, n_steps = batch.shape
+        offsets = np.arange(n_steps) * self.bins
+        for name in self.channels:
+            col = batch[name]
+            raw = np.floor((col - self.lo[name]) / self.width[name])
+            outside = (raw < 0) | (raw >= self.bins)
+            self.clipped += int(np.count_nonzero(outside))
+            idx = np.clip(np.nan_to_num(raw, nan=0.0), 0, self.bins - 1).astype(np.int64)
+            # Одна bincount на весь пакет: номер ячейки = шаг * bins + корзина
+            flat = np.bincount((idx + offsets).ravel(), minlength=n_steps * self.bins)
+            self.counts[name] += flat.reshape(n_steps, self.bins)
+            self.min[name] = np.fmin(self.min[name], col.min(axis=0))
+            self.max[name] = np.fmax(self.max[name], col.max(axis=0))
+        self.runs += n_runs
+
+    def merge(self, other):
+        for name in self.channels:
+            self.counts[name] += other.counts[name]
+            self.min[name] = np.fmin(self.min[name], other.min[name])
+            self.max[name] = np.fmax(self.max[name], other.max[name])
+        self.runs += other.runs
+        self.clipped += other.clipped
+
+    def percentiles(self, name, qs=PERCENTILES):
+        """Процентили канала на каждом шаге: массив (len(qs), n_steps)."""
+        counts = self.counts[name]
+        cumulative = np.cumsum(counts, axis=1)
+        total = cumulative[:, -1:]
+        out = np.empty((len(qs), len(self.grid)))
+        steps = np.arange(len(self.grid))
+        for k, q in enumerate(qs):
+            target = q / 100.0 * total[:, 0]
+            # Первая корзина, где накопленное число достигло цели, и доля внутри нее
+            b = np.minimum((cumulative < target[:, None]).sum(axis=1), self.bins - 1)
+            before = np.where(b > 0, cumulative[steps, b - 1], 0)
+            inside = counts[steps, b]
+            frac = np.where(inside > 0, (target - before) / np.maximum(inside, 1), 0.5)
+            value = self.lo[name] + (b + frac) * self.width[name]
+            out[k] = np.clip(value, self.min[name], self.max[name])
+        return out
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in self.counts.values()) + \
+            sum(a.nbytes for a in self.min.values()) * 2
+
+
+def _run_task(chunks, every, template):
+    # Задача процесса: несколько пакетов -> одна общая статистика
+    envelope = template.empty_like()
+    for seed, n in chunks:
+        envelope.add(run_chunk(seed, n, every))
+    return envelope
+
+
+def _accumulate(envelope, chunks, every, workers):
+    # Пакеты - поровну по процессам; счетчики складываются точно,
+    # поэтому порядок сложения на результат не влияет
+    tasks = [chunks[i::workers] for i in range(workers) if chunks[i::workers]]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_task, task, every, envelope.empty_like()) for task in tasks]
+            for future in futures:
+                envelope.merge(future.result())
+    else:
+        for task in tasks:
+            for s, n in task:
+                envelope.add(run_chunk(s, n, every))
+
+
+def run_montecarlo(runs=10000, seed=0, workers=None, chunk=CHUNK, bins=BINS, every=1):
+    """
+    Монте-Карло на runs прогонов. Прогоны делятся на пакеты по chunk штук,
+    у каждого пакета свое зерно из SeedSequence(seed) - результат не
+    зависит от числа процессов. Возвращает Envelope.
+
+    Если за границы гистограмм попало больше MAX_CLIPPED значений, все
+    пакеты считаются заново с границами по точным min/max первого прохода.
+    """
+    if runs < 1:
+        raise ValueError(f"Число прогонов должно быть >= 1: {runs}")
+    if chunk < 1:
+        raise ValueError(f"Размер пакета должен быть >= 1: {chunk}")
+    workers = workers or os.cpu_count() or 1
+    sizes = [chunk] * (runs // chunk) + ([runs % chunk] if runs % chunk else [])
+    chunks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+
+    # Первые пакеты (PILOT_RUNS траекторий, но не больше runs) задают
+    # границы гистограмм - от размера пакета они не зависят
+    pilot = []
+    n_pilot = 0
+    while n_pilot < min(runs, max(chunk, PILOT_RUNS)):
+        pilot.append(run_chunk(*chunks[len(pilot)], every))
+        n_pilot += len(pilot[-1])
+    batch = np.concatenate(pilot)
+    envelope = Envelope.from_pilot(batch, bins)
+    envelope.add(batch)
+    rest = chunks[len(pilot):]
+    del pilot, batch
+    _accumulate(envelope, rest, every, workers)
+
+    if envelope.clipped_fraction() > MAX_CLIPPED:
+        print(f"Вне границ гистограмм {envelope.clipped_fraction():.2%} значений - "
+              f"пересчет с границами по min/max")
+        envelope = envelope.rebinned()
+        _accumulate(envelope, chunks, every, workers)
+    return envelope
+
+
+def plot_envelopes(envelope, ksp=None, prefix="dispersion"):
+    """Графики разброса: min-max, 5-95%, медиана, номинал и данные KSP."""
+    # matplotlib - только для графиков: процессы расчета импортируют этот
+    # модуль заново и без него стартуют быстрее
+    import matplotlib.pyplot as plt
+    nominal = varkt.simulate_model(verbose=False)
+    titles = {'height': ("ВЫСОТА ПОЛЕТА", "Высота (м)"),
+              'speed': ("СКОРОСТЬ", "Скорость (м/с)"),
+              'mass': ("МАССА РАКЕТЫ", "Масса (кг)")}
+    files = []
+    for name in envelope.channels:
+        p5, p50, p95 = envelope.percentiles(name, PERCENTILES)
+        t = envelope.grid
+        plt.figure(figsize=(10, 6))
+        plt.fill_between(t, envelope.min[name], envelope.max[name], color='r', alpha=0.12,
+                         label='Мин.-макс.')
+        plt.fill_between(t, p5, p95, color='r', alpha=0.3, label='5-95%')
+        plt.plot(t, p50, 'r-', linewidth=1.5, label='Медиана')
+        plt.plot(nominal['time'], nominal[name], 'k--', linewidth=1, label='Номинал')
+        if ksp is not None and len(ksp):
+            plt.plot(ksp['time'], ksp[name], 'bo', markersize=2, alpha=0.6, label='KSP (Эксперимент)')
+        title, y_label = titles[name]
+        plt.title(f'Разброс ({envelope.runs} прогонов): {title}', fontsize=14)
+        plt.xlabel('Время (с)', fontsize=12)
+        plt.ylabel(y_label, fontsize=12)
+        plt.legend()
+        plt.grid(True, alpha=0.3)
+        filename = f"{prefix}_{name}.png"
+        plt.savefig(filename, dpi=150)
+        plt.close()
+        files.append(filename)
+    return files
+
+
+def summary(envelope):
+    """Разброс в конце расчета (t_max): {канал: {p5, p50, p95, min, max}}."""
+    out = {}
+    for name in envelope.channels:
+        values = envelope.percentiles(name)[:, -1]
+        out[name] = dict(zip((f"p{q}" for q in PERCENTILES), values.tolist()))
+        out[name]['min'] = float(envelope.min[name][-1])
+        out[name]['max'] = float(envelope.max[name][-1])
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Монте-Карло разброса траектории по допускам параметров")
+    parser.add_argument('--runs', type=int, default=10000, help="число прогонов")
+    parser.add_argument('--seed', type=int, default=0, help="зерно (одинаковое зерно - одинаковый результат)")
+    parser.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument('--chunk', type=int, default=CHUNK, help="траекторий в пакете")
+    parser.add_argument('--bins', type=int, default=BINS, help="корзин гистограммы на шаг")
+    parser.add_argument('--every', type=int, default=1, help="хранить каждый N-й шаг времени")
+    parser.add_argument('--log', default='data/ksp_launch.log', help="лог KSP для графиков")
+    parser.add_argument('--prefix', default='dispersion', help="начало имени файлов графиков")
+    parser.add_argument('--json', default=None, help="сохранить разброс в конце расчета в JSON")
+    args = parser.parse_args()
+
+    if args.runs < 1 or args.chunk < 1:
+        parser.error("--runs и --chunk должны быть >= 1")
+
+    start = time.perf_counter()
+    envelope = run_montecarlo(args.runs, args.seed, args.workers, args.chunk, args.bins, args.every)
+    elapsed = time.perf_counter() - start
+    print(f"Всего {elapsed:.2f} с ({envelope.runs / elapsed:.0f} траекторий/с), "
+          f"память статистики {envelope.nbytes / 2**20:.1f} МБ, "
+          f"вне границ гистограмм {envelope.clipped} значений")
+
+    result = summary(envelope)
+    print(f"\nРазброс при t={envelope.grid[-1]:.1f} с:")
+    print(f"{'канал':<8} {'мин.':>12} {'5%':>12} {'50%':>12} {'95%':>12} {'макс.':>12}")
+    for name, s in result.items():
+        print(f"{name:<8} {s['min']:>12.1f} {s['p5']:>12.1f} {s['p50']:>12.1f} "
+              f"{s['p95']:>12.1f} {s['max']:>12.1f}")
+
+    ksp = varkt.load_ksp_data(args.log)
+    files = plot_envelopes(envelope, ksp, args.prefix)
+    print(f"\nГрафики: {', '.join(files)}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'runs': envelope.runs, 'seed': args.seed, 'tolerances': TOLERANCES,
+                       'final': result}, f, indent=2, ensure_ascii=False)
+        print(f"Результат сохранен в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
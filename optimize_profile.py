@@ -0,0 +1,325 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import varkt
+from guidance import GuidanceProfile
+from calibrate import differential_evolution, evaluate_parallel
+
+# ============================================
+# Подбор программы тангажа (гравитационного разворота)
+# ============================================
+#
+# Ищем точки излома программы тангажа (высоты и углы), при которых на
+# выведение уходит меньше всего топлива, и при этом скоростной напор и
+# нагрев не выходят за пределы. Топливо = разгон до апоцентра target_apo
+# плюс импульс в апоцентре до перицентра target_peri (по формуле
+# Циолковского). Без второй части задача вырождается: апоцентр дешевле
+# всего набирать вертикальным подъемом, но на орбиту так не выйти.
+#
+# Полет считается тем же методом Эйлера с шагом dt и той же физикой, что и
+# в varkt.simulate_batch, но до выключения двигателя по апоцентру (а не до
+# t_max) и с учетом кривизны траектории (v²/r), без которой апоцентра нет.
+# Вся популяция считается одним пакетом.
+
+# Подбираемые параметры программы и их границы (h_start = turn_start_h)
+BOUNDS = {
+    'turn_start_h': (200.0, 3000.0),
+    'h_mid': (3000.0, 20000.0),
+    'h_high': (10000.0, 45000.0),
+    'h_end': (25000.0, 80000.0),
+    'pitch_start': (80.0, 90.0),
+    'pitch_mid': (25.0, 75.0),
+    'pitch_high': (3.0, 45.0),
+}
+NAMES = tuple(BOUNDS)
+ALTITUDES = ('turn_start_h', 'h_mid', 'h_high', 'h_end')
+ANGLES = ('pitch_start', 'pitch_mid', 'pitch_high')
+
+TARGET_APO = 220000.0   # Целевой апоцентр (как в autopilot.py), м
+TARGET_PERI = 170000.0  # Целевой перицентр после довыведения, м
+MAX_Q = 40000.0         # Предел скоростного напора, Па
+MAX_HEAT = 40000.0      # Предел конвективного нагрева, Вт/м²
+T_LIMIT = 400.0         # Дольше не считаем, с
+
+# Нагрев по формуле Саттона-Грейвса: q = k * sqrt(rho / r_n) * v³
+HEAT_K = 1.7415e-4
+NOSE_RADIUS = 1.0       # м
+
+MIN_GAP = 500.0         # Минимальный промежуток между точками излома, м
+PENALTY = 1e6           # кг за единицу относительного нарушения ограничений
+
+
+def repair(candidates):
+    """
+    Приводит кандидатов к допустимой программе: высоты точек излома растут
+    (с промежутком MIN_GAP), углы не растут.
+    """
+    x = np.array(candidates, dtype=float)
+    alt = [NAMES.index(name) for name in ALTITUDES]
+    ang = [NAMES.index(name) for name in ANGLES]
+    gaps = MIN_GAP * np.arange(len(alt))
+    x[:, alt] = np.maximum.accumulate(x[:, alt] - gaps, axis=1) + gaps
+    x[:, ang] = np.minimum.accumulate(x[:, ang], axis=1)
+    return x
+
+
+def to_params(candidates):
+    """Кандидаты (n, len(NAMES)) -> параметры модели {имя: массив}."""
+    params = {name: candidates[:, i] for i, name in enumerate(NAMES)}
+    params['h_start'] = params['turn_start_h']
+    return params
+
+
+def ascent_batch(params=None, n_runs=None, target_apo=TARGET_APO, target_peri=TARGET_PERI,
+                 t_limit=T_LIMIT):
+    """
+    Выведение до апоцентра target_apo для пакета вариантов.
+
+    Возвращает словарь массивов длины n_runs: reached (апоцентр достигнут),
+    propellant (кг топлива до выключения), cutoff_time, apoapsis (на момент
+    выключения или конца расчета), max_q (Па), max_heat (Вт/м²),
+    circularization_dv (м/с, импульс в апоцентре до перицентра target_peri)
+    и circularization_propellant (кг, двигателем центрального блока).
+    """
+    p = varkt.default_params(**(params or {}))
+    if n_runs is None:
+        n_runs = max(np.size(value) for value in p.values())
+    p = {name: np.broadcast_to(np.asarray(value, dtype=float), (n_runs,))
+         for name, value in p.items()}
+    mu = varkt.g0 * varkt.R**2
+    dt = varkt.dt
+
+    mu_core_b = p['flow_core_units'] * 5.0
+    current_mu = p['flow_booster_units'] * 7.5 * 4 + mu_core_b
+    current_F = p['F_booster_one'] * 4 + p['F_core_one']
+    boosters_attached = np.ones(n_runs, dtype=bool)
+
+    y = np.full(n_runs, 11.24)
+    vx = np.zeros(n_runs)
+    vy = np.zeros(n_runs)
+    m = p['m0'].copy()
+    dropped = np.zeros(n_runs)  # Сброшенная сухая масса (не топливо)
+
+    flying = np.ones(n_runs, dtype=bool)
+    reached = np.zeros(n_runs, dtype=bool)
+    cutoff_time = np.full(n_runs, np.nan)
+    apoapsis = np.zeros(n_runs)
+    momentum = np.zeros(n_runs)  # Удельный момент импульса r * vx
+    max_q = np.zeros(n_runs)
+    max_heat = np.zeros(n_runs)
+    guidance = GuidanceProfile.from_params(p)
+
+    t = 0.0
+    while t < t_limit and flying.any():
+        pitch_rad = np.radians(guidance.evaluate(y))
+        cos_p = np.cos(pitch_rad)
+        sin_p = np.sin(pitch_rad)
+
+        v_total = np.sqrt(vx**2 + vy**2)
+        rho = varkt.p0 * np.exp(-y / varkt.H)
+        g = varkt.g0 * (varkt.R / (varkt.R + y))**2
+        F_drag = 0.5 * rho * v_total**2 * p['Cx'] * p['S']
+
+        r = varkt.R + y
+        ax = (current_F * cos_p - F_drag * cos_p) / m - vx * vy / r
+        ay = (current_F * sin_p - F_drag * sin_p - m * g) / m + vx**2 / r
+
+        # Выключившиеся ракеты дальше не считаем
+        vx = np.where(flying, vx + ax * dt, vx)
+        vy = np.where(flying, vy + ay * dt, vy)
+        y = np.where(flying, y + vy * dt, y)
+        m = np.where(flying & (current_F > 0), m - current_mu * dt, m)
+        t += dt
+
+        jettison = flying & boosters_attached & (t >= p['booster_jettison_time'])
+        if jettison.any():
+            boosters_attached &= ~jettison
+            m = m - np.where(jettison, p['mass_drop_at_stage'], 0.0)
+            dropped += np.where(jettison, p['mass_drop_at_stage'], 0.0)
+            current_mu = np.where(jettison, mu_core_b, current_mu)
+            current_F = np.where(jettison, p['F_core_one'], current_F)
+
+        v_total = np.sqrt(vx**2 + vy**2)
+        rho = varkt.p0 * np.exp(-y / varkt.H)
+        max_q = np.where(flying, np.maximum(max_q, 0.5 * rho * v_total**2), max_q)
+        heat = HEAT_K * np.sqrt(rho / NOSE_RADIUS) * v_total**3
+        max_heat = np.where(flying, np.maximum(max_heat, heat), max_heat)
+
+        # Апоцентр по энергии и моменту (кеплерова орбита)
+        r = varkt.R + y
+        energy = v_total**2 / 2 - mu / r
+        bound = energy < 0
+        sma = np.where(bound, -mu / (2 * np.where(bound, energy, -1.0)), np.inf)
+        h = r * vx
+        e = np.sqrt(np.maximum(0.0, 1 + 2 * energy * h**2 / mu**2))
+        apo = np.where(bound, sma * (1 + e) - varkt.R, np.inf)
+        apoapsis = np.where(flying, apo, apoapsis)
+        momentum = np.where(flying, h, momentum)
+
+        done = flying & (apo >= target_apo)
+        out_of_fuel = flying & (m <= p['m_dry'])
+        crashed = flying & (y < 0)
+        reached |= done
+        cutoff_time = np.where(done | out_of_fuel | crashed, t, cutoff_time)
+        flying &= ~(done | out_of_fuel | crashed)
+
+    # Довыведение в апоцентре: скорость там h / r_a (момент импульса h сохраняется)
+    r_apo = varkt.R + np.where(reached, apoapsis, target_apo)
+    r_peri = varkt.R + target_peri
+    v_needed = np.sqrt(mu * (2 / r_apo - 2 / (r_apo + r_peri)))
+    dv = np.clip(v_needed - momentum / r_apo, 0.0, None)
+    isp = p['F_core_one'] / mu_core_b  # м/с
+    circ_propellant = m * (1.0 - np.exp(-dv / isp))
+
+    return {
+        'reached': reached,
+        'propellant': p['m0'] - m - dropped,
+        'circularization_dv': dv,
+        'circularization_propellant': circ_propellant,
+        'cutoff_time': cutoff_time,
+        'apoapsis': apoapsis,
+        'max_q': max_q,
+        'max_heat': max_heat,
+    }
+
+
+def profile_cost(result, max_q=MAX_Q, max_heat=MAX_HEAT, target_apo=TARGET_APO):
+    """Топливо на выведение + штрафы за недолет и превышение напора и нагрева."""
+    cost = result['propellant'] + result['circularization_propellant']
+    shortfall = np.clip((target_apo - result['apoapsis']) / target_apo, 0.0, None)
+    cost += np.where(result['reached'], 0.0, PENALTY * (1.0 + shortfall))
+    cost += PENALTY * np.clip(result['max_q'] / max_q - 1.0, 0.0, None)
+    cost += PENALTY * np.clip(result['max_heat'] / max_heat - 1.0, 0.0, None)
+    return np.where(np.isfinite(cost), cost, np.inf)
+
+
+# Ограничения в процессе-исполнителе
+_limits = None
+
+
+def _init_worker(limits):
+    global _limits
+    _limits = limits
+
+
+def _evaluate(names, candidates):
+    result = ascent_batch(to_params(repair(candidates)), target_apo=_limits['target_apo'])
+    return profile_cost(result, **_limits)
+
+
+def optimize(popsize=64, generations=60, workers=None, seed=0, max_q=MAX_Q, max_heat=MAX_HEAT,
+             target_apo=TARGET_APO, verbose=True):
+    """
+    Подбор программы тангажа дифференциальной эволюцией.
+    Возвращает словарь: profile (параметры для varkt.PROFILE_NAMES),
+    result (топливо, напор, нагрев лучшего варианта), baseline (то же для
+    текущей программы из varkt.py), evaluations, wall_time, workers.
+    """
+    workers = workers or os.cpu_count() or 1
+    limits = {'max_q': max_q, 'max_heat': max_heat, 'target_apo': target_apo}
+    rng = np.random.default_rng(seed)
+    lo = np.array([BOUNDS[name][0] for name in NAMES])
+    hi = np.array([BOUNDS[name][1] for name in NAMES])
+
+    start = time.perf_counter()
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(limits,))
+    else:
+        _init_worker(limits)
+
+    try:
+        # Первая особь - текущая программа из varkt.py
+        best, cost, evaluations = differential_evolution(
+            lambda candidates: evaluate_parallel(pool, _evaluate, NAMES, candidates, workers),
+            lo, hi, popsize, generations, rng,
+            x0=[getattr(varkt, name) for name in NAMES], verbose=verbose)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    best = repair(best[None, :])
+    profile = {name: float(values[0]) for name, values in to_params(best).items()}
+
+    def summary(params):
+        result = ascent_batch(params, n_runs=1, target_apo=target_apo)
+        out = {name: float(values[0]) for name, values in result.items()}
+        out['reached'] = bool(result['reached'][0])
+        return out
+
+    return {
+        'profile': profile,
+        'cost': cost,
+        'result': summary(profile),
+        'baseline': summary(None),
+        'evaluations': evaluations,
+        'wall_time': time.perf_counter() - start,
+        'workers': workers,
+    }
+
+
+def violations(result, max_q=MAX_Q, max_heat=MAX_HEAT):
+    """Нарушенные пределы траектории result (словарь summary) - список строк."""
+    out = []
+    if result['max_q'] > max_q:
+        out.append(f"скоростной напор {result['max_q'] / 1000:.1f} кПа > предела {max_q / 1000:.1f} кПа")
+    if result['max_heat'] > max_heat:
+        out.append(f"нагрев {result['max_heat'] / 1000:.1f} кВт/м² > предела {max_heat / 1000:.1f} кВт/м²")
+    return out
+
+
+def print_report(result):
+    print("\nПрограмма тангажа:")
+    for name in varkt.PROFILE_NAMES:
+        print(f"  {name:<14} {getattr(varkt, name):>10.1f} -> {result['profile'][name]:<10.1f}")
+    print(f"\n{'':<6} {'разгон, кг':>11} {'довывед., кг':>13} {'ΔV, м/с':>8} {'выкл., с':>9} "
+          f"{'напор, кПа':>11} {'нагрев, кВт/м²':>15}")
+    for label, key in (("было", 'baseline'), ("стало", 'result')):
+        r = result[key]
+        mark = "" if r['reached'] else "  (апоцентр не достигнут)"
+        print(f"{label:<6} {r['propellant']:>11.0f} {r['circularization_propellant']:>13.0f} "
+              f"{r['circularization_dv']:>8.0f} {r['cutoff_time']:>9.1f} {r['max_q'] / 1000:>11.1f} "
+              f"{r['max_heat'] / 1000:>15.1f}{mark}")
+    print(f"\nРасчетов: {result['evaluations']} за {result['wall_time']:.2f} с "
+          f"({result['evaluations'] / result['wall_time']:.0f} траекторий/с, процессов: {result['workers']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор программы тангажа для автопилота и модели")
+    parser.add_argument('--popsize', type=int, default=64, help="размер популяции")
+    parser.add_argument('--generations', type=int, default=60, help="число поколений")
+    parser.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument('--seed', type=int, default=0, help="зерно генератора случайных чисел")
+    parser.add_argument('--target-apo', type=float, default=TARGET_APO, help="целевой апоцентр, м")
+    parser.add_argument('--max-q', type=float, default=MAX_Q, help="предел скоростного напора, Па")
+    parser.add_argument('--max-heat', type=float, default=MAX_HEAT, help="предел нагрева, Вт/м²")
+    parser.add_argument('--output', default=varkt.PROFILE_PATH, help="файл программы тангажа")
+    parser.add_argument('--force', action='store_true',
+                        help="сохранить программу, даже если она нарушает пределы напора и нагрева")
+    args = parser.parse_args()
+
+    result = optimize(args.popsize, args.generations, args.workers, args.seed,
+                      args.max_q, args.max_heat, args.target_apo)
+    print_report(result)
+
+    if not result['result']['reached']:
+        print("Допустимая программа не найдена - файл не записан.")
+        return
+    broken = violations(result['result'], args.max_q, args.max_heat)
+    for violation in broken:
+        print(f"Нарушен предел: {violation}")
+    if broken and not args.force:
+        print("Программа нарушает пределы - файл не записан (сохранить все равно: --force).")
+        return
+    varkt.save_profile(result['profile'], args.output, target_apoapsis=args.target_apo,
+                       max_q_limit=args.max_q, max_heat_limit=args.max_heat,
+                       result=result['result'], baseline=result['baseline'])
+    print(f"Программа сохранена в {args.output} (ее читают varkt.py и autopilot.py)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import argparse
+import bisect
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+import autopilot
+import mock_krpc
+import varkt
+from mock_krpc import SIM_DT
+
+# ============================================
+# Воспроизведение записанных полетов для проверки автопилота
+# ============================================
+#
+# Логика autopilot.py (пороги фаз, обновление тангажа только при его
+# уменьшении, выгорание ускорителей, выключение по апоцентру) работает только
+# в живом полете. Здесь вместо KSP - замена kRPC из mock_krpc.py, но
+# состояние ракеты берется не из физики, а из записанного лога: в каждый
+# момент высота, скорость, масса и тангаж - из лога (линейная интерполяция).
+# Команды автопилота на полет не влияют, а только записываются (через
+# слушателя MissionStats) вместе со временем лога - так видно, что и когда
+# автопилот сделал бы на этой записи.
+#
+# Чего в логе нет, восстанавливается из него же:
+#   вертикальная скорость - производная высоты, горизонтальная - из полной
+#   скорости (планета в модели не вращается), отсюда апоцентр по Кеплеру;
+#   тяга - расход массы (производная) на скорость истечения из varkt;
+#   твердое топливо - до момента, когда расход падает вдвое от стартового
+#   (выгорание ускорителей), линейно убывает до нуля.
+#
+# Отсчет времени лога начинается с команды на первую ступень (как при записи
+# log_ksp.py: лог начинается с запуска двигателей). Когда лог заканчивается,
+# воспроизведение останавливается, даже если полет по логике автопилота не
+# закончен (лог обычно короче полета до орбиты).
+#
+# Время идет не быстрее чем в warp раз быстрее реального (по умолчанию
+# 1000). В режиме lockstep (по умолчанию) следующий шаг моделирования
+# делается только тогда, когда поток автопилота ждет: все ожидания замены
+# kRPC (sleep, ожидание потока, threading.Event автопилота - SimEvent) идут
+# через MockUniverse.wait_on, который отмечает, чего ждет поток, а notify
+# отмечает разбуженные. После шага поток моделирования ждет (условие idle),
+# пока разбуженный автопилот снова не начнет ждать, - результат не зависит
+# от загрузки машины, и его можно сравнивать с эталоном. Задержка решений в секундах
+# лога тогда - только от логики автопилота (паузы, ожидание событий), а
+# реальное время, которое автопилот считал после каждого шага, - в отчете
+# отдельно. Без lockstep автопилот может не успевать за warp, и его решения
+# опаздывают по времени лога, как на медленной машине.
+
+WARP = 1000.0
+BURNOUT_FRACTION = 0.5   # Выгорание ускорителей: расход ниже этой доли стартового
+TIME_TOLERANCE = 0.5     # Допуск по времени команд при сравнении с эталоном, с
+
+
+class ReplayUniverse(mock_krpc.MockUniverse):
+    """
+    Замена kRPC, в которой полет - запись log (Trajectory varkt.load_ksp_data).
+
+    commands - записанные команды: словари {time, phase, kind, name, value},
+    time - секунды лога (None - до старта). finished - лог закончился.
+    actor - поток автопилота для режима lockstep; busy_times - реальное
+    время (с), которое он работал после шагов, на которых не ждал.
+    """
+
+    def __init__(self, log, warp=WARP, params=None, lockstep=True):
+        super().__init__(warp, params)
+        if len(log) < 2:
+            raise ValueError("В логе меньше двух строк")
+        p = self.p
+        t = np.asarray(log['time'], dtype=float)
+        height = np.asarray(log['height'], dtype=float)
+        speed = np.asarray(log['speed'], dtype=float)
+        mass = np.asarray(log['mass'], dtype=float)
+        vy = np.gradient(height, t)
+        vx = np.sqrt(np.maximum(speed ** 2 - vy ** 2, 0.0))
+        flow = np.maximum(-np.gradient(mass, t), 0.0)
+        # Скорость истечения - та же, что у varkt на старте (тяга / расход)
+        exhaust = (p['F_booster_one'] * 4 + p['F_core_one']) / (p['flow_booster_units'] * 7.5 * 4 +
+                                                                 p['flow_core_units'] * 5.0)
+        self._t = t.tolist()
+        self._columns = {
+            'y': height.tolist(), 'vx': vx.tolist(), 'vy': vy.tolist(), 'm': mass.tolist(),
+            'pitch': np.asarray(log['pitch'], dtype=float).tolist(),
+            'thrust': (flow * exhaust).tolist(),
+        }
+        self.burnout_time = self._find_burnout(t, flow)
+        self.end_time = self._t[-1]
+        self.launch_ut = None
+        self.finished = threading.Event()
+        self.commands = []
+        self.lockstep = lockstep
+        self.actor = None
+        self._actor_done = False
+        self.busy_times = []
+        self._set_state(self._t[0])
+
+    @staticmethod
+    def _find_burnout(t, flow):
+        # Стартовый расход - медиана первых секунд работы двигателей
+        running = np.flatnonzero(flow > 0)
+        if not len(running):
+            return math.inf
+        start = flow[running[0]:np.searchsorted(t, t[running[0]] + 5.0)]
+        threshold = BURNOUT_FRACTION * float(np.median(start))
+        after = np.flatnonzero((flow < threshold) & (t > t[running[0]] + 5.0))
+        return float(t[after[0]]) if len(after) else math.inf
+
+    def _set_state(self, t):
+        times = self._t
+        i = min(max(bisect.bisect_right(times, t), 1), len(times) - 1)
+        t0, t1 = times[i - 1], times[i]
+        fraction = min(max((t - t0) / (t1 - t0), 0.0), 1.0) if t1 > t0 else 1.0
+        for name, values in self._columns.items():
+            v0 = values[i - 1]
+            setattr(self, name, v0 + (values[i] - v0) * fraction)
+        # Остаток твердого топлива по времени до выгорания
+        self.solid_fuel = max(0.0, self.burnout_time - t) * self.booster_rate
+
+    def log_time(self):
+        return None if self.launch_ut is None else self.ut - self.launch_ut
+
+    def activate_next_stage(self):
+        if self.launch_ut is None:
+            self.launch_ut = self.ut
+        return super().activate_next_stage()
+
+    def step(self, dt):
+        self.ut += dt
+        t = self.log_time()
+        if t is None:
+            return   # До старта - первая строка лога
+        if t > self.end_time:
+            self.finished.set()
+            return
+        self._set_state(self._t[0] + t)
+
+    def _actor_idle(self):
+        # Вызывается под замком idle: автопилот ждет (wait_on) и его не будили
+        # или он уже закончил (actor_done)
+        actor = self.actor
+        return actor is not None and (self.is_waiting(actor) or self._actor_done)
+
+    def actor_done(self):
+        """Поток автопилота закончил работу - больше его не ждем."""
+        with self.idle:
+            self._actor_done = True
+            self.idle.notify_all()
+
+    def _run(self):
+        # Как MockUniverse._run, но в режиме lockstep после каждого шага
+        # ждем, пока автопилот обработает обновления и снова начнет ждать
+        start = time.perf_counter()
+        sim_start = self.ut
+        while not self._stop.is_set():
+            with self.lock:
+                self.step(SIM_DT)
+                self.notify(self.tick)
+            for conn in list(self.connections):
+                conn._update_streams()
+            if self.lockstep:
+                busy_start = time.perf_counter()
+                with self.idle:
+                    busy = not self._actor_idle()
+                    while not self._actor_idle() and not self._stop.is_set():
+                        self.idle.wait()
+                if busy:
+                    self.busy_times.append(time.perf_counter() - busy_start)
+            delay = start + (self.ut - sim_start) / self.warp - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def record(self, kind, name, value, phase):
+        t = self.log_time()
+        self.commands.append({'time': None if t is None else round(t, 3), 'phase': phase,
+                              'kind': kind, 'name': name, 'value': value})
+
+
+def replay(log, warp=WARP, profile=None, params=None, lockstep=True, verbose=False):
+    """
+    Прогон autopilot.launch_complete_mission по записи log.
+
+    Возвращает словарь: commands (см. ReplayUniverse), phases (фазы
+    MissionStats с задержкой решений в секундах лога), log_time, wall_time,
+    speedup, busy (реальное время работы автопилота после шагов: count,
+    mean, max), error (исключение автопилота, если было).
+    """
+    universe = ReplayUniverse(log, warp, params, lockstep)
+    conn = universe.connect('Воспроизведение')
+    stats = autopilot.MissionStats(conn)
+    stats.listeners.append(lambda kind, name, value: universe.record(kind, name, value,
+                                                                      stats.current_phase))
+    errors = []
+
+    def run():
+        try:
+            autopilot.launch_complete_mission(conn, profile=profile, stats=stats)
+        except Exception as e:   # Ошибка автопилота - тоже результат проверки
+            errors.append(e)
+        finally:
+            universe.actor_done()
+            universe.finished.set()
+
+    output = io.StringIO()
+    start = time.perf_counter()
+    with mock_krpc.patch_time(universe, autopilot), mock_krpc.patch_threading(universe, autopilot), \
+            contextlib.redirect_stdout(sys.stdout if verbose else output):
+        # Автопилот в фоновом потоке: когда лог кончается, он может ждать
+        # события, которое уже не наступит, - тогда поток просто бросаем
+        thread = threading.Thread(target=run, name="replay-autopilot", daemon=True)
+        universe.actor = thread
+        thread.start()
+        universe.finished.wait()
+        wall = time.perf_counter() - start
+        thread.join(timeout=0.1)
+    log_time = min(universe.log_time() or 0.0, universe.end_time)
+    universe.stop()
+
+    busy = universe.busy_times
+    phases = list(stats.phases)
+    if stats._current is not None:
+        phases.append(stats._current)   # Фаза, на которой кончился лог
+    return {
+        'commands': universe.commands,
+        'phases': [{'name': record['name'], 'rpcs': record['rpcs'], 'latency': record['latency']}
+                   for record in phases],
+        'burnout_time': universe.burnout_time,
+        'log_time': log_time,
+        'wall_time': wall,
+        'speedup': log_time / wall if wall > 0 else math.inf,
+        'busy': {'count': len(busy), 'mean': float(np.mean(busy)) if busy else 0.0,
+                 'max': max(busy, default=0.0)},
+        'error': repr(errors[0]) if errors else None,
+    }
+
+
+def compare_commands(result, baseline, tolerance=TIME_TOLERANCE):
+    """
+    Сравнение записанных команд с эталоном. Фазы, ступени и газ должны идти
+    в том же порядке и в пределах tolerance секунд; команды тангажа -
+    последний угол в каждой фазе (±0.5°). Возвращает список расхождений.
+    """
+    def key_commands(commands):
+        return [c for c in commands if c['kind'] == 'phase' or c['name'] in ('stage', 'throttle')]
+
+    def last_pitch(commands):
+        pitch = {}
+        for c in commands:
+            if c['name'] == 'pitch':
+                pitch[c['phase']] = c['value']
+        return pitch
+
+    problems = []
+    got, expected = key_commands(result['commands']), key_commands(baseline['commands'])
+    for i, (a, b) in enumerate(zip(got, expected)):
+        if (a['kind'], a['name']) != (b['kind'], b['name']):
+            problems.append(f"#{i}: {a['name']} вместо {b['name']} (t={b['time']})")
+            break
+        if a['value'] != b['value'] and not (isinstance(a['value'], float) and isinstance(b['value'], float)
+                                             and abs(a['value'] - b['value']) <= 0.05):
+            problems.append(f"#{i} {a['name']}: значение {a['value']} вместо {b['value']}")
+        if (a['time'] is None) != (b['time'] is None) or \
+                (a['time'] is not None and abs(a['time'] - b['time']) > tolerance):
+            problems.append(f"#{i} {a['name']}: t={a['time']} вместо {b['time']}")
+    if len(got) != len(expected):
+        problems.append(f"команд фаз/ступеней/газа {len(got)} вместо {len(expected)}")
+    got_pitch, expected_pitch = last_pitch(result['commands']), last_pitch(baseline['commands'])
+    for phase, value in expected_pitch.items():
+        if phase not in got_pitch or abs(got_pitch[phase] - value) > 0.5:
+            problems.append(f"{phase}: последний тангаж {got_pitch.get(phase)} вместо {value:.2f}")
+    return problems
+
+
+def format_result(name, result):
+    lines = [f"{name}: {result['log_time']:.1f} с лога за {result['wall_time']:.2f} с "
+             f"(x{result['speedup']:.0f}), команд {len(result['commands'])}"]
+    if result['error']:
+        lines.append(f"  ОШИБКА автопилота: {result['error']}")
+    for c in result['commands']:
+        if c['kind'] == 'phase' or c['name'] in ('stage', 'throttle'):
+            t = '-' if c['time'] is None else f"{c['time']:.2f}"
+            value = '' if c['value'] is None else f" {c['value']:.3g}" if isinstance(c['value'], float) \
+                else f" {c['value']}"
+            lines.append(f"  {t:>8} {c['kind']:<8} {c['name']}{value}")
+    latencies = [p['latency'] for p in result['phases'] if p['latency'] is not None]
+    if latencies:
+        lines.append(f"  задержка решений (с лога): средняя {np.mean(latencies):.3f}, "
+                     f"макс. {max(latencies):.3f}")
+    busy = result['busy']
+    if busy['count']:
+        lines.append(f"  работа автопилота после шага (реальное время): {busy['count']} раз, "
+                     f"в среднем {busy['mean'] * 1000:.2f} мс, макс. {busy['max'] * 1000:.2f} мс")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка автопилота на записанных полетах (без KSP)")
+    parser.add_argument('logs', nargs='+', help="логи телеметрии (log_ksp.py)")
+    parser.add_argument('--warp', type=float, default=WARP, help="ускорение времени")
+    parser.add_argument('--save', default=None, help="папка: сохранить команды как эталон (JSON)")
+    parser.add_argument('--check', default=None, help="папка с эталонами: сравнить команды (код выхода 1 при расхождении)")
+    parser.add_argument('--tolerance', type=float, default=TIME_TOLERANCE, help="допуск по времени команд, с")
+    parser.add_argument('--free', action='store_true',
+                        help="без lockstep: моделирование не ждет автопилот (как в реальном полете)")
+    parser.add_argument('--verbose', action='store_true', help="показывать вывод автопилота")
+    args = parser.parse_args()
+
+    # Длина лога не ограничивается t_max модели
+    varkt.t_max = math.inf
+    failed = False
+    for path in args.logs:
+        name = os.path.splitext(os.path.basename(path))[0]
+        log = varkt.load_ksp_data(path)
+        if len(log) < 2:
+            print(f"{path}: лог пуст")
+            failed = True
+            continue
+        result = replay(log, args.warp, lockstep=not args.free, verbose=args.verbose)
+        print(format_result(path, result))
+
+        if args.save:
+            os.makedirs(args.save, exist_ok=True)
+            with open(os.path.join(args.save, name + '.json'), 'w') as f:
+                json.dump(result, f, indent=1, ensure_ascii=False)
+        if args.check:
+            with open(os.path.join(args.check, name + '.json')) as f:
+                problems = compare_commands(result, json.load(f), args.tolerance)
+            for problem in problems:
+                print(f"  РАСХОЖДЕНИЕ: {problem}")
+            if not problems:
+                print("  совпадает с эталоном")
+            failed |= bool(problems)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
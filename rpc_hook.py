@@ -0,0 +1,95 @@
+import time
+
+# ============================================
+# Перехват RPC соединения kRPC
+# ============================================
+#
+# Подменить conn._invoke после подключения недостаточно: клиент krpc при
+# подключении создает функции процедур динамических сервисов, и в каждую уже
+# подставлен метод _invoke (krpc/service.py, _construct_func) - замена
+# атрибута на них не действует. Зато любой RPC, из какого угодно сервиса,
+# уходит через соединение conn._rpc_connection: Client._invoke под замком
+# отправляет запрос (send_message) и ждет ответ (receive_message). Поэтому
+# перехват - обертка этого соединения.
+#
+# В замене kRPC (mock_krpc.py) соединения нет, а все вызовы идут через
+# conn._invoke - там оборачивается он.
+#
+# callback(call) получает RpcCall после ответа на запрос. У настоящего
+# клиента он вызывается под замком соединения: внутри callback нельзя делать
+# RPC (чтение потоков можно).
+
+
+class RpcCall:
+    """
+    Один RPC: service, procedure, start и end (time.perf_counter отправки
+    и получения ответа); argument(position) - значение аргумента float
+    (позиция 0 - объект, дальше значения, как в kRPC).
+    """
+
+    __slots__ = ('service', 'procedure', 'start', 'end', '_arguments', '_client')
+
+    def __init__(self, service, procedure, start, end, arguments, client=None):
+        self.service = service
+        self.procedure = procedure
+        self.start = start
+        self.end = end
+        self._arguments = arguments
+        self._client = client
+
+    def argument(self, position):
+        if self._client is None:
+            # Замена kRPC: аргументы - значения Python
+            return float(self._arguments[position]) if position < len(self._arguments) else None
+        from krpc.decoder import Decoder
+        for argument in self._arguments:
+            if argument.position == position:
+                return Decoder.decode(self._client, argument.value, self._client._types.float_type)
+        return None
+
+
+class _HookedConnection:
+    """Соединение RPC клиента krpc, сообщающее о каждом запросе."""
+
+    def __init__(self, client, connection, callback):
+        self._client = client
+        self._connection = connection
+        self._callback = callback
+        self._pending = None
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def send_message(self, message):
+        # Client._invoke держит замок соединения от отправки до ответа -
+        # запрос в ожидании один
+        self._pending = (message, time.perf_counter())
+        self._connection.send_message(message)
+
+    def receive_message(self, typ):
+        try:
+            return self._connection.receive_message(typ)
+        finally:
+            end = time.perf_counter()
+            message, start = self._pending
+            self._pending = None
+            for call in message.calls:
+                self._callback(RpcCall(call.service, call.procedure, start, end, call.arguments,
+                                       self._client))
+
+
+def on_rpc(conn, callback):
+    """Вызывать callback(RpcCall) после каждого RPC соединения conn."""
+    connection = getattr(conn, '_rpc_connection', None)
+    if connection is not None:
+        conn._rpc_connection = _HookedConnection(conn, connection, callback)
+        return
+    invoke = conn._invoke
+
+    def hooked_invoke(service, procedure, args, *rest, **kwargs):
+        start = time.perf_counter()
+        try:
+            return invoke(service, procedure, args, *rest, **kwargs)
+        finally:
+            callback(RpcCall(service, procedure, start, time.perf_counter(), list(args)))
+    conn._invoke = hooked_invoke
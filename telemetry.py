@@ -0,0 +1,792 @@
+import argparse
+import bisect
+import collections
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+
+# ============================================
+# Форматы файлов телеметрии
+# ============================================
+#
+# Текстовый (исходный): строка заголовка "Time Pitch Altitude Speed Mass",
+# дальше значения через пробел.
+#
+# Двоичный: заголовок + записи фиксированной длины (little-endian).
+#   8 байт   сигнатура b'KSPTLM1\0'
+#   uint32   полный размер заголовка в байтах (начало данных)
+#   uint16   число столбцов
+#   на каждый столбец: имя (16 байт ASCII, дополнено нулями)
+#                      тип NumPy (8 байт ASCII, например '<f8')
+# Записи идут подряд сразу после заголовка, поэтому файл можно
+# отобразить в память (np.memmap) и читать столбцы без разбора.
+#
+# Сессия (log_ksp.py --session) - папка data/sessions/<имя>: лог в любом из
+# форматов, разбитый на куски chunk-00000.log (.bin), новый кусок - по
+# размеру или длительности; с --compress куски сжаты gzip (.gz). Рядом -
+# индекс index.jsonl: время -> (кусок, смещение в байтах), по нему чтение
+# окна по времени начинается сразу с нужного места (см. SessionLog).
+
+MAGIC = b'KSPTLM1\0'
+_NAME_SIZE = 16
+_TYPE_SIZE = 8
+
+TEXT_HEADER = "Time Pitch Altitude Speed Mass\n"
+
+# Столбцы лога в порядке записи
+COLUMNS = (
+    ('time', '<f8'),
+    ('pitch', '<f8'),
+    ('altitude', '<f8'),
+    ('speed', '<f8'),
+    ('mass', '<f8'),
+)
+
+
+def record_dtype(columns=COLUMNS):
+    return np.dtype([(name, fmt) for name, fmt in columns])
+
+
+def encode_header(columns=COLUMNS):
+    size = len(MAGIC) + 4 + 2 + len(columns) * (_NAME_SIZE + _TYPE_SIZE)
+    parts = [MAGIC, struct.pack('<IH', size, len(columns))]
+    for name, fmt in columns:
+        parts.append(name.encode('ascii').ljust(_NAME_SIZE, b'\0'))
+        parts.append(fmt.encode('ascii').ljust(_TYPE_SIZE, b'\0'))
+    return b''.join(parts)
+
+
+def read_header(f):
+    """Читает заголовок двоичного лога. Возвращает (размер заголовка, столбцы)."""
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError("Файл не является двоичным логом телеметрии")
+    size, count = struct.unpack('<IH', f.read(6))
+    columns = []
+    for _ in range(count):
+        name = f.read(_NAME_SIZE).rstrip(b'\0').decode('ascii')
+        fmt = f.read(_TYPE_SIZE).rstrip(b'\0').decode('ascii')
+        columns.append((name, fmt))
+    return size, tuple(columns)
+
+
+def is_binary_log(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+# ============================================
+# Запись
+# ============================================
+
+class _LogWriter:
+    """Общее для форматов: заголовок при открытии, строки по одной или блоком."""
+
+    def __init__(self, file):
+        self.file = file
+        file.write(self.header)
+
+    def write_row(self, row):
+        self.file.write(self.encode(row))
+
+    def write_rows(self, rows):
+        data = [self.encode(row) for row in rows]
+        self.file.write(data[0][:0].join(data))
+
+
+class TextLogWriter(_LogWriter):
+    """Исходный текстовый формат (читается глазами и старым кодом)."""
+
+    mode = "w"
+    header = TEXT_HEADER
+
+    @staticmethod
+    def encode(row):
+        return "%.2f %.2f %.2f %.2f %.2f\n" % row
+
+
+class BinaryLogWriter(_LogWriter):
+    """Двоичный формат: одна запись фиксированной длины на отсчет."""
+
+    mode = "wb"
+    header = encode_header()
+    _record = struct.Struct('<' + 'd' * len(COLUMNS))  # все столбцы '<f8'
+
+    @classmethod
+    def encode(cls, row):
+        return cls._record.pack(*row)
+
+
+WRITERS = {
+    'text': TextLogWriter,
+    'bin': BinaryLogWriter,
+}
+
+
+def open_log(path, fmt='text'):
+    """Открывает файл лога на запись. Возвращает (файл, writer)."""
+    writer_cls = WRITERS[fmt]
+    file = open(path, writer_cls.mode)
+    return file, writer_cls(file)
+
+
+# Что делать, если очередь записи заполнена
+OVERFLOW_POLICIES = ('drop-oldest', 'drop-newest', 'block')
+
+
+class BackgroundWriter:
+    """
+    Запись лога в отдельном потоке.
+
+    Цикл опроса только кладет строки в ограниченную очередь (put не ждет диск),
+    поток записи забирает все накопленное и пишет одним блоком, fsync - не чаще
+    раза в fsync_interval секунд. При переполнении очереди:
+        'drop-oldest' - выбрасывается самая старая строка (по умолчанию),
+        'drop-newest' - выбрасывается новая строка,
+        'block'       - опрос ждет, пока поток записи освободит место.
+    close() дописывает все, что осталось в очереди, и закрывает файл.
+
+    status - необязательная функция, которую поток записи вызывает с последней
+    строкой каждого блока (например, для вывода в консоль вне цикла опроса).
+    """
+
+    def __init__(self, file, writer, capacity=65536, policy='drop-oldest',
+                 flush_interval=0.25, fsync_interval=1.0, status=None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {policy}")
+        self.file = file
+        self.writer = writer
+        self.capacity = capacity
+        self.policy = policy
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.status = status
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.fsyncs = 0
+        self.max_queued = 0
+        self.error = None
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, row):
+        with self._cond:
+            if len(self._queue) >= self.capacity:
+                if self.policy == 'drop-newest':
+                    self.dropped += 1
+                    return
+                if self.policy == 'drop-oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._queue) >= self.capacity and self.error is None:
+                        self._cond.wait()
+            self._queue.append(row)
+            self.max_queued = max(self.max_queued, len(self._queue))
+            if len(self._queue) >= self.capacity // 2:
+                self._cond.notify_all()
+
+    def _take(self):
+        with self._cond:
+            # Копим строки flush_interval секунд (или до половины очереди)
+            if not self._closing and len(self._queue) < self.capacity // 2:
+                self._cond.wait(self.flush_interval)
+            rows = list(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+            return rows, self._closing
+
+    def _write(self, rows):
+        self.writer.write_rows(rows)
+        self.written += len(rows)
+        self.batches += 1
+
+    def _sync(self):
+        # Файл из нескольких (SessionLog: кусок и индекс) сбрасывает себя сам
+        sync = getattr(self.file, 'sync', None)
+        if sync is not None:
+            sync()
+        else:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.fsyncs += 1
+
+    def _run(self):
+        last_sync = time.monotonic()
+        try:
+            while True:
+                rows, closing = self._take()
+                if rows:
+                    self._write(rows)
+                    if self.status is not None:
+                        self.status(rows[-1])
+                if time.monotonic() - last_sync >= self.fsync_interval:
+                    self._sync()
+                    last_sync = time.monotonic()
+                if closing and not rows:
+                    break
+        except Exception as e:
+            with self._cond:
+                self.error = e
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        try:
+            if self.error is None:
+                self._sync()
+        finally:
+            self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def report(self):
+        return (f"записано {self.written} строк блоками ({self.batches}), fsync {self.fsyncs}, "
+                f"потеряно {self.dropped} (политика {self.policy}), "
+                f"макс. очередь {self.max_queued}/{self.capacity}")
+
+
+# ============================================
+# Чтение
+# ============================================
+
+def load_binary(path):
+    """
+    Отображает двоичный лог в память. Возвращает структурированный
+    np.memmap: столбцы (log['time'], log['altitude'], ...) - это виды
+    на файл, данные не копируются и не разбираются.
+    Недописанная последняя запись отбрасывается.
+    """
+    with open(path, 'rb') as f:
+        size, columns = read_header(f)
+    dtype = record_dtype(columns)
+    count = (os.path.getsize(path) - size) // dtype.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=size, shape=(count,))
+
+
+CHUNK_BYTES = 1 << 20   # Сколько читать за раз, байт
+
+
+def _tokens_per_line(data):
+    """Число чисел (слов) в каждой строке блока data, заканчивающегося '\\n'."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    newline = buf == 10
+    space = newline | (buf == 32) | (buf == 9) | (buf == 13)
+    # Начало слова - не пробел после пробела или начала блока
+    starts = ~space
+    starts[1:] &= space[:-1]
+    line = np.cumsum(newline) - newline
+    return np.bincount(line[starts], minlength=int(newline.sum()))
+
+
+def _parse_text(data, ncols):
+    # Обычно все строки блока целые: один разбор NumPy на весь блок. Общего
+    # числа слов мало - лишнее слово в одной строке и недостающее в другой
+    # сдвинули бы столбцы, поэтому считаем слова в каждой строке
+    tokens = data.split()
+    if len(tokens) == data.count(b'\n') * ncols and (_tokens_per_line(data) == ncols).all():
+        try:
+            return np.array(tokens, dtype=float).reshape(-1, ncols)
+        except ValueError:
+            pass
+    # Заголовок или битые строки - построчно, пропуская их
+    rows = []
+    for line in data.split(b'\n'):
+        parts = line.split()
+        if len(parts) >= ncols:
+            try:
+                rows.append([float(v) for v in parts[:ncols]])
+            except ValueError:
+                continue
+    return np.array(rows, dtype=float).reshape(-1, ncols)
+
+
+def _open_for_reading(path, offset=None):
+    """
+    Открывает лог на чтение с начала данных (или с offset - начала строки
+    или записи, для сжатого куска - начала члена gzip, см. SessionLog).
+    Возвращает (файл, тип записи, двоичный ли) или None, если файла нет или
+    его заголовок еще не дописан.
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    if path.endswith('.gz'):
+        f = _GzipStream(f)
+    head = f.read(len(MAGIC))
+    if head == MAGIC:
+        f.seek(0)
+        try:
+            size, columns = read_header(f)
+        except (ValueError, struct.error):
+            f.close()
+            return None
+        f.seek(size)
+        opened = f, record_dtype(columns), True
+    elif len(head) < len(MAGIC) and MAGIC.startswith(head):
+        f.close()
+        return None   # Формат еще не виден
+    else:
+        f.seek(0)
+        opened = f, record_dtype(), False
+    if offset is not None:
+        f.seek_member(offset) if isinstance(f, _GzipStream) else f.seek(offset)
+    return opened
+
+
+def iter_chunks(path, t_max=None, follow=False, chunk_bytes=CHUNK_BYTES, poll_interval=0.1,
+                idle_timeout=None, stop=None, t_min=None, offset=None):
+    """
+    Читает лог (текстовый или двоичный, в том числе сжатый .gz, или папку
+    сессии - см. iter_session) блоками: каждый блок - структурированный
+    массив с теми же столбцами, что в load_binary.
+
+    t_max - закончить на первой строке с временем больше t_max (дальше
+    файл не читается), t_min - пропустить строки раньше t_min. offset -
+    начать с этого места файла (из индекса сессии). follow - не заканчивать на конце файла, а ждать, пока
+    log_ksp.py допишет новые строки: если новых строк нет, через poll_interval
+    отдается пустой блок (можно проверить окно, Ctrl-C и т.п.), недописанная
+    последняя строка ждет продолжения. Чтение в режиме follow заканчивается
+    по stop (threading.Event) или после idle_timeout секунд без новых строк.
+    Если файла еще нет, в режиме follow ждем его появления.
+    """
+    if os.path.isdir(path):
+        if follow:
+            raise ValueError("Режим follow для папки сессии не поддерживается")
+        yield from iter_session(path, t_min, t_max, chunk_bytes)
+        return
+    opened = None
+    idle_since = time.monotonic()
+    while opened is None:
+        opened = _open_for_reading(path, offset)
+        if opened is not None:
+            break
+        if not follow:
+            raise FileNotFoundError(path)
+        if (stop is not None and stop.is_set()) or \
+                (idle_timeout is not None and time.monotonic() - idle_since > idle_timeout):
+            return
+        yield np.zeros(0, dtype=record_dtype())
+        if poll_interval:
+            time.sleep(poll_interval)
+
+    f, dtype, binary = opened
+    ncols = len(dtype.names)
+    rest = b''
+    # Заголовок текстового лога - только в начале файла (не с offset)
+    first = not binary and offset is None
+    with f:
+        final = False
+        while True:
+            data = f.read(chunk_bytes)
+            if not data and not follow and rest and not binary and not final:
+                # Последняя строка файла без перевода строки
+                data, final = b'\n', True
+            if data:
+                idle_since = time.monotonic()
+                data = rest + data
+                if binary:
+                    end = len(data) - len(data) % dtype.itemsize
+                    block = np.frombuffer(data[:end], dtype=dtype)
+                else:
+                    end = data.rfind(b'\n') + 1
+                    lines = data[:end]
+                    if first and end:
+                        first = False
+                        # Первая строка - заголовок, если это TEXT_HEADER или она не
+                        # читается числами (строка "nan 12.3 ..." - данные)
+                        header_end = lines.find(b'\n') + 1
+                        head = lines[:header_end]
+                        if head.split() == TEXT_HEADER.encode('ascii').split() or \
+                                not len(_parse_text(head, ncols)):
+                            lines = lines[header_end:]
+                    block = np.zeros(0, dtype=dtype)
+                    if lines:
+                        values = _parse_text(lines, ncols)
+                        block = np.empty(len(values), dtype=dtype)
+                        for i, name in enumerate(dtype.names):
+                            block[name] = values[:, i]
+                rest = data[end:]
+                if t_min is not None and len(block) and block['time'][0] < t_min:
+                    block = block[block['time'] >= t_min]
+                if t_max is not None and len(block):
+                    over = np.flatnonzero(block['time'] > t_max)
+                    if len(over):
+                        if over[0]:
+                            yield block[:over[0]]
+                        return
+                if len(block):
+                    yield block
+                continue
+
+            # Конец файла
+            if not follow or (stop is not None and stop.is_set()):
+                return
+            if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                return
+            yield np.zeros(0, dtype=dtype)
+            if poll_interval:
+                time.sleep(poll_interval)
+
+
+def iter_rows(path, t_max=None, follow=False, **options):
+    """Строки лога по одной (кортежи в порядке столбцов), через iter_chunks."""
+    for block in iter_chunks(path, t_max, follow, **options):
+        yield from block.tolist()
+
+
+def iter_text_rows(path):
+    """Построчно читает текстовый лог, пропуская заголовок и битые строки."""
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            # Time Pitch Altitude Speed Mass
+            if len(parts) >= 5:
+                try:
+                    yield tuple(float(v) for v in parts[:5])
+                except ValueError:
+                    continue # Заголовок или битая строка
+
+
+# ============================================
+# Сессии: лог кусками с ротацией и индексом по времени
+# ============================================
+
+SESSIONS_DIR = "data/sessions"
+INDEX_NAME = "index.jsonl"
+INDEX_PERIOD = 1.0   # Запись индекса не чаще раза в столько секунд лога
+CHUNK_EXTENSIONS = {'text': '.log', 'bin': '.bin'}
+
+
+def session_name():
+    """Имя новой сессии по местному времени: 20250101-120000."""
+    return time.strftime('%Y%m%d-%H%M%S')
+
+
+class SessionLog:
+    """
+    Запись лога в папку сессии directory: и файл, и writer для
+    BackgroundWriter (пишет блоками через write_rows).
+
+    Новый кусок начинается, когда текущий достиг max_bytes байт на диске
+    или max_seconds секунд лога (проверка - перед каждым блоком). Каждый
+    кусок начинается с заголовка формата и читается сам по себе.
+
+    Индекс index.jsonl: первая строка - {"format", "compress"}, дальше
+    {"chunk", "offset", "time"}: с байта offset куска chunk начинаются строки
+    со временем от time. Запись индекса - в начале каждого куска и дальше
+    не чаще раза в INDEX_PERIOD секунд лога, поэтому индекс мал даже для
+    многочасовой сессии.
+
+    compress - куски gzip: каждая запись индекса начинает новый член gzip
+    (с него можно распаковывать, не читая кусок с начала), внутри члена
+    блоки сбрасываются Z_SYNC_FLUSH - на диске всегда все записанные строки.
+    Уже существующая сессия не перезаписывается (FileExistsError).
+    """
+
+    def __init__(self, directory, fmt='text', max_bytes=None, max_seconds=None, compress=False):
+        self.directory = directory
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compress = compress
+        self.chunks = []
+        self.index_entries = 0
+
+        writer_cls = WRITERS[fmt]
+        self._encode = writer_cls.encode
+        self._text = fmt == 'text'
+        header = writer_cls.header
+        self._header = header.encode('ascii') if self._text else header
+
+        os.makedirs(directory, exist_ok=True)
+        self._index = open(os.path.join(directory, INDEX_NAME), 'x', encoding='utf-8')
+        self._write_index({'format': fmt, 'compress': compress})
+        self._file = None
+        self._compressor = None
+        self._chunk_start = None
+        self._last_index = None
+
+    def _write_index(self, record):
+        self._index.write(json.dumps(record) + '\n')
+        self.index_entries += 1
+
+    def _new_member(self, data=b''):
+        # Закрывает текущий член gzip и начинает новый с data
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush(zlib.Z_FINISH))
+        self._compressor = zlib.compressobj(wbits=31)
+        if data:
+            self._file.write(self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def _open_chunk(self, t):
+        self._close_chunk()
+        name = f"chunk-{len(self.chunks):05d}{CHUNK_EXTENSIONS[self.fmt]}" + ('.gz' if self.compress else '')
+        self._file = open(os.path.join(self.directory, name), 'wb')
+        self.chunks.append(name)
+        if self.compress:
+            self._new_member(self._header)
+        else:
+            self._file.write(self._header)
+        self._chunk_start = t
+        self._last_index = None
+
+    def _close_chunk(self):
+        if self._file is None:
+            return
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush(zlib.Z_FINISH))
+            self._compressor = None
+        # Закрытый кусок больше не сбрасывается sync - на диск сразу
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def _rotate_due(self, t):
+        if self._file is None:
+            return True
+        if self.max_bytes is not None and self._file.tell() >= self.max_bytes:
+            return True
+        return self.max_seconds is not None and t - self._chunk_start >= self.max_seconds
+
+    def write_rows(self, rows):
+        # Блок делится по точкам индекса: ротация и индекс не зависят от того,
+        # какими пачками строки приходят от BackgroundWriter
+        start = 0
+        while start < len(rows):
+            t = rows[start][0]
+            if self._rotate_due(t):
+                self._open_chunk(t)
+            if self._last_index is None or t - self._last_index >= INDEX_PERIOD:
+                if self.compress:
+                    self._new_member()
+                self._write_index({'chunk': self.chunks[-1], 'offset': self._file.tell(), 'time': t})
+                self._last_index = t
+            end = start + 1
+            limit = self._last_index + INDEX_PERIOD
+            while end < len(rows) and rows[end][0] < limit:
+                end += 1
+            self._write_data(rows[start:end])
+            start = end
+
+    def _write_data(self, rows):
+        data = [self._encode(row) for row in rows]
+        data = ''.join(data).encode('ascii') if self._text else b''.join(data)
+        if self.compress:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._file.write(data)
+
+    def write_row(self, row):
+        self.write_rows([row])
+
+    # Файловые методы для BackgroundWriter
+
+    def flush(self):
+        self._index.flush()
+        if self._file is not None:
+            self._file.flush()
+
+    def sync(self):
+        """flush и fsync текущего куска и индекса: записи индекса находят данные на диске."""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        # Индекс - после куска: его записи указывают только на данные, уже лежащие на диске
+        self._index.flush()
+        os.fsync(self._index.fileno())
+
+    def fileno(self):
+        return (self._file or self._index).fileno()
+
+    def close(self):
+        self._close_chunk()
+        self._file = None
+        self._index.close()
+
+
+class _GzipStream:
+    """
+    Чтение файла из нескольких членов gzip, в том числе недописанного
+    последнего (его данные отдаются по мере записи). seek - по распакованным
+    данным (назад - распаковка с начала), seek_member - на начало члена по
+    смещению в файле.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._restart(0)
+
+    def _restart(self, offset):
+        self.raw.seek(offset)
+        self._decompressor = zlib.decompressobj(wbits=31)
+        self._buffer = b''
+        self._position = 0
+
+    def _feed(self, data):
+        parts = [self._buffer]
+        while data:
+            parts.append(self._decompressor.decompress(data))
+            if not self._decompressor.eof:
+                break
+            # Член закончился - дальше следующий
+            data = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(wbits=31)
+        self._buffer = b''.join(parts)
+
+    def read(self, size):
+        while len(self._buffer) < size:
+            data = self.raw.read(CHUNK_BYTES)
+            if not data:
+                break
+            self._feed(data)
+        result, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._position += len(result)
+        return result
+
+    def seek(self, position):
+        if position < self._position:
+            self._restart(0)
+        while self._position < position and self.read(min(position - self._position, CHUNK_BYTES)):
+            pass
+
+    def seek_member(self, offset):
+        self._restart(offset)
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_session_index(directory):
+    """
+    Индекс сессии: (параметры {"format", "compress"}, записи индекса
+    {"chunk", "offset", "time"} по порядку). Недописанная последняя строка
+    пропускается.
+    """
+    meta, entries = {}, []
+    with open(os.path.join(directory, INDEX_NAME), encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'chunk' in record:
+                entries.append(record)
+            else:
+                meta = record
+    return meta, entries
+
+
+def session_chunks(directory):
+    """Куски сессии по порядку (в том числе не попавшие в индекс)."""
+    return sorted(name for name in os.listdir(directory) if name.startswith('chunk-'))
+
+
+def iter_session(directory, t_min=None, t_max=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Блоки лога сессии со временем от t_min до t_max. По индексу чтение
+    начинается с последней записи не позже t_min (кусок и смещение) и
+    заканчивается на первой строке после t_max; остальные куски не
+    открываются.
+    """
+    _, entries = read_session_index(directory)
+    chunks = session_chunks(directory)
+    start_chunk, start_offset = 0, None
+    if t_min is not None and entries:
+        i = bisect.bisect_right([entry['time'] for entry in entries], t_min) - 1
+        if i >= 0 and entries[i]['chunk'] in chunks:
+            start_chunk, start_offset = chunks.index(entries[i]['chunk']), entries[i]['offset']
+    # Время начала куска - по первой записи индекса для него
+    chunk_start = {}
+    for entry in entries:
+        chunk_start.setdefault(entry['chunk'], entry['time'])
+
+    for name in chunks[start_chunk:]:
+        if t_max is not None and chunk_start.get(name, -np.inf) > t_max:
+            return
+        offset = start_offset if name == chunks[start_chunk] else None
+        yield from iter_chunks(os.path.join(directory, name), t_max, chunk_bytes=chunk_bytes,
+                               t_min=t_min, offset=offset)
+
+
+# ============================================
+# Конвертер
+# ============================================
+
+def convert_text_to_binary(src, dst):
+    count = 0
+    with open(dst, 'wb') as f:
+        writer = BinaryLogWriter(f)
+        for row in iter_text_rows(src):
+            writer.write_row(row)
+            count += 1
+    return count
+
+
+def convert_binary_to_text(src, dst):
+    log = load_binary(src)
+    names = [name for name, _ in COLUMNS]
+    with open(dst, 'w') as f:
+        writer = TextLogWriter(f)
+        # Большими блоками, чтобы не держать весь файл в памяти
+        for start in range(0, len(log), 65536):
+            block = log[start:start + 65536]
+            f.writelines(writer.encode(row) for row in zip(*(block[n].tolist() for n in names)))
+    return len(log)
+
+
+def export_window(src, dst, fmt='text', t_min=None, t_max=None):
+    """Строки лога или сессии src со временем от t_min до t_max - в файл dst формата fmt."""
+    count = 0
+    file, writer = open_log(dst, fmt)
+    with file:
+        for block in iter_chunks(src, t_max=t_max, t_min=t_min):
+            if len(block):
+                writer.write_rows(block.tolist())
+                count += len(block)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Конвертер логов телеметрии (текст <-> двоичный)")
+    parser.add_argument('src', help="исходный файл или папка сессии")
+    parser.add_argument('dst', help="результат")
+    parser.add_argument('--t-min', type=float, default=None, help="только строки не раньше, с")
+    parser.add_argument('--t-max', type=float, default=None, help="только строки не позже, с")
+    parser.add_argument('--format', choices=sorted(WRITERS), default=None,
+                        help="формат результата (для сессии и окна по времени; по умолчанию text)")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.src) or args.src.endswith('.gz') or args.format or \
+            args.t_min is not None or args.t_max is not None:
+        count = export_window(args.src, args.dst, args.format or 'text', args.t_min, args.t_max)
+    elif is_binary_log(args.src):
+        count = convert_binary_to_text(args.src, args.dst)
+    else:
+        count = convert_text_to_binary(args.src, args.dst)
+    print(f"Записей: {count}, сохранено в {args.dst}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import numpy as np
+
+# ============================================
+# Траектория: именованные столбцы в массивах NumPy
+# ============================================
+#
+# Вместо пяти списков Python (~40 байт на число) - по одному непрерывному
+# массиву на столбец (8 байт на число для float64, 4 - для float32).
+# Массивы выделяются заранее; если места не хватило, емкость удваивается.
+# Столбцы и срезы - виды на те же данные, без копирования.
+
+COLUMNS = ('time', 'height', 'speed', 'mass', 'pitch')
+
+
+class Trajectory:
+    """
+    Траектория ракеты (модель или лог KSP).
+
+        traj = Trajectory(capacity=901)
+        traj.append(t, h, v, m, pitch)
+        traj['height']      # столбец - вид на массив длины len(traj)
+        traj[100:200]       # срез - новая Trajectory на тех же массивах
+
+    every - хранить только каждый N-й отсчет из переданных в append
+    (последний переданный отсчет сохраняется при close()).
+    """
+
+    def __init__(self, capacity=1024, every=1, columns=COLUMNS, dtype=np.float64):
+        if every < 1:
+            raise ValueError("every должно быть >= 1")
+        self.columns = tuple(columns)
+        self.every = every
+        self._data = {name: np.empty(max(1, capacity), dtype=dtype) for name in self.columns}
+        self._size = 0
+        self._offered = 0      # Сколько отсчетов передано в append
+        self._pending = None   # Последний пропущенный отсчет (для close)
+
+    @classmethod
+    def from_columns(cls, **arrays):
+        """Траектория поверх готовых массивов (без копирования, если это уже ndarray)."""
+        traj = cls.__new__(cls)
+        traj.columns = tuple(arrays)
+        traj.every = 1
+        traj._data = {name: np.asarray(values) for name, values in arrays.items()}
+        sizes = {len(values) for values in traj._data.values()}
+        if len(sizes) > 1:
+            raise ValueError(f"Столбцы разной длины: {sorted(sizes)}")
+        traj._size = sizes.pop() if sizes else 0
+        traj._offered = traj._size
+        traj._pending = None
+        return traj
+
+    # --- запись ---
+
+    def _grow(self, needed):
+        capacity = len(self._data[self.columns[0]])
+        new_capacity = max(needed, capacity * 2)
+        for name, old in self._data.items():
+            new = np.empty(new_capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            self._data[name] = new
+
+    def append(self, *values):
+        """Добавляет отсчет (значения в порядке columns)."""
+        index = self._offered
+        self._offered += 1
+        if index % self.every:
+            self._pending = values
+            return
+        self._pending = None
+        if self._size >= len(self._data[self.columns[0]]):
+            self._grow(self._size + 1)
+        for name, value in zip(self.columns, values):
+            self._data[name][self._size] = value
+        self._size += 1
+
+    def extend(self, *columns):
+        """Добавляет блок отсчетов: массивы столбцов в порядке columns (как append)."""
+        columns = [np.asarray(values) for values in columns]
+        n = len(columns[0])
+        if not n:
+            return
+        # Номера сохраняемых отсчетов блока - те же, что дали бы вызовы append
+        first = -self._offered % self.every
+        self._pending = None
+        if (self._offered + n - 1) % self.every:
+            self._pending = tuple(values[-1] for values in columns)
+        self._offered += n
+        block = [values[first::self.every] for values in columns]
+        count = len(block[0])
+        if self._size + count > len(self._data[self.columns[0]]):
+            self._grow(self._size + count)
+        for name, values in zip(self.columns, block):
+            self._data[name][self._size:self._size + count] = values
+        self._size += count
+
+    def close(self):
+        """
+        Завершает запись: сохраняет последний отсчет, если его пропустило
+        прореживание, и отдает неиспользованную емкость.
+        """
+        if self._pending is not None:
+            values, self._pending = self._pending, None
+            if self._size >= len(self._data[self.columns[0]]):
+                self._grow(self._size + 1)
+            for name, value in zip(self.columns, values):
+                self._data[name][self._size] = value
+            self._size += 1
+        for name, array in self._data.items():
+            if len(array) > self._size:
+                self._data[name] = array[:self._size].copy()
+        return self
+
+    # --- чтение ---
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._data[key][:self._size]
+        if isinstance(key, slice):
+            return Trajectory.from_columns(**{name: self[name][key] for name in self.columns})
+        raise TypeError("Индекс траектории - имя столбца или срез")
+
+    def __getattr__(self, name):
+        # traj.height == traj['height']
+        data = self.__dict__.get('_data')
+        if data is not None and name in data:
+            return self[name]
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return f"Trajectory({self._size} отсчетов, столбцы: {', '.join(self.columns)})"
+
+    @property
+    def nbytes(self):
+        """Память под данные (с учетом свободной емкости)."""
+        return sum(array.nbytes for array in self._data.values())
+
+    def at(self, t, name):
+        """Значение столбца в момент t (линейная интерполяция по времени)."""
+        return np.interp(t, self['time'], self[name])
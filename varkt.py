@@ -1,5 +1,16 @@
+import argparse
+import json
 import math
-import matplotlib.pyplot as plt
+import os
+import sys
+import numpy as np
+
+import downsample
+import telemetry
+import trajectory
+from cache import DiskCache, make_key
+from guidance import GuidanceProfile
+from trajectory import Trajectory
 
 # ============================================
 # 1. ПАРАМЕТРЫ 
@@ -32,9 +43,19 @@ mass_drop_at_stage = 18531.0
 # Время сброса из лога 
 booster_jettison_time = 64.2
 
+# Сухая масса после выработки топлива центрального блока (оценка)
+m_dry = 25000.0
+
 turn_start_h = 1000.0    # Начинаем поворот на 1 км
 turn_end_h = 50000.0 
 
+# Программа тангажа (точки излома, из лога)
+h_mid = 10000.0      # на 10 км угол ~45°
+h_high = 30000.0     # на 30 км угол ~20°
+pitch_start = 89.0
+pitch_mid = 45.0
+pitch_high = 20.0
+
 # --- Атмосфера ---
 p0 = 1.2230948554874
 H = 5600
@@ -46,167 +67,597 @@ R = 600000
 dt = 0.1
 t_max = 90.0 
 
+# Параметры, которые можно менять от варианта к варианту
+PARAM_NAMES = (
+    'm0', 'Cx', 'S',
+    'flow_booster_units', 'flow_core_units',
+    'F_booster_one', 'F_core_one',
+    'mass_drop_at_stage', 'booster_jettison_time', 'm_dry',
+    'h_start', 'turn_start_h', 'h_mid', 'h_high', 'h_end',
+    'pitch_start', 'pitch_mid', 'pitch_high',
+)
+
+
+def default_params(**overrides):
+    # Текущие значения глобальных параметров модели (+ замены)
+    params = {name: globals()[name] for name in PARAM_NAMES}
+    for name, value in overrides.items():
+        if name not in params:
+            raise KeyError(f"Неизвестный параметр модели: {name}")
+        params[name] = value
+    return params
+
+
+# Программа тангажа (точки излома), подобранная optimize_profile.py
+PROFILE_PATH = 'data/pitch_profile.json'
+PROFILE_NAMES = (
+    'h_start', 'turn_start_h', 'h_mid', 'h_high', 'h_end',
+    'pitch_start', 'pitch_mid', 'pitch_high',
+)
+
+
+def load_profile(file_path=PROFILE_PATH):
+    # Параметры программы тангажа из файла ({} - файла нет, остаются значения выше)
+    try:
+        with open(file_path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    profile = data.get('profile', data)
+    return {name: float(profile[name]) for name in PROFILE_NAMES if name in profile}
+
+
+def save_profile(profile, file_path=PROFILE_PATH, **info):
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    data = {'profile': {name: float(profile[name]) for name in PROFILE_NAMES}}
+    data.update(info)
+    with open(file_path, 'w') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
 # ============================================
 # 2. МАТЕМАТИЧЕСКАЯ МОДЕЛЬ
 # ============================================
 
-def simulate_model():
-    t = 0.0
-    x = 0.0
-    y = 11.24 # Начальная высота из лога
-    vx = 0.0
-    vy = 0.0
-    m = m0
-    
-    current_mu = mu_start
-    current_F = F_thrust_start
-    boosters_attached = True
+def guidance_profile(params=None):
+    # Программа тангажа для параметров модели (+ замены), см. guidance.py
+    return GuidanceProfile.from_params(default_params(**(params or {})))
 
-    times = [t]
-    heights = [y]
-    velocities = [0.74] # Начальная скорость из лога
-    masses = [m]
-    pitches = [90.0] 
-    
-    print(f"Запуск модели... m0={m:.0f} кг")
-
-    while t < t_max:
-        
-        # 0 - 1000 м (Почти вертикальный взлет)
-        if y < h_start:
-            pitch_deg = 89.0
-
-        elif 1000.0 < y <= 10000.0:
-            fraction = (y - 1000.0) / 9000.0
-            # Из лога: на 10000м угол ~45°, значит разворот на 44° за этот этап
-            pitch_deg = 89.0 - (44.0 * fraction)
-
-        elif 10000.0 < y <= 30000.0:
-            fraction = (y - 10000.0) / 20000.0
-            # Из лога: на 30000м угол ~20°, значит разворот на 25° за этот этап
-            pitch_deg = 45.0 - (25.0 * fraction)
-        elif 30000.0 < y <= 51800.0:
-            fraction = (y - 30000.0) / 21800.0
-            # Из лога: на ~51800м угол ~0°, разворот на 20° за этот этап
-            pitch_deg = 20.0 - (20.0 * fraction)
+
+def load_guidance(file_path=PROFILE_PATH):
+    # Программа тангажа из файла optimize_profile.py (нет файла - из параметров выше)
+    return guidance_profile(load_profile(file_path))
+
+
+def pitch_program(y, p=None):
+    # Тангаж на одной высоте; в циклах лучше один раз получить guidance_profile(p)
+    return guidance_profile(p)(y)
+
+
+def model_accelerations(y, vx, vy, m, F, pitch_deg, p):
+    pitch_rad = math.radians(pitch_deg)
+
+    # ФИЗИКА
+    v_total = math.sqrt(vx**2 + vy**2)
+    rho = p0 * math.exp(-y / H)
+    g = g0 * (R / (R + y))**2
+
+    # Силы
+    F_gravity = m * g
+    F_drag = 0.5 * rho * v_total**2 * p['Cx'] * p['S']
+
+    # Проекции сил 
+    Fx_thrust = F * math.cos(pitch_rad)
+    Fy_thrust = F * math.sin(pitch_rad)
+
+    Fx_drag = F_drag * math.cos(pitch_rad)
+    Fy_drag = F_drag * math.sin(pitch_rad)
+
+    # Ускорения
+    if m > 0:
+        ax = (Fx_thrust - Fx_drag) / m
+        ay = (Fy_thrust - Fy_drag - F_gravity) / m
+    else:
+        ax, ay = 0, 0
+    return ax, ay
+
+# ============================================
+# 2.1 ИНТЕГРАТОРЫ
+# ============================================
+
+INTEGRATORS = ('euler', 'rk4', 'rk45')
+
+# Коэффициенты Дормана-Принса 5(4)
+_DP_C = (0.0, 1/5, 3/10, 4/5, 8/9, 1.0, 1.0)
+_DP_A = (
+    (),
+    (1/5,),
+    (3/40, 9/40),
+    (44/45, -56/15, 32/9),
+    (19372/6561, -25360/2187, 64448/6561, -212/729),
+    (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+    (35/384, 0.0, 500/1113, 125/192, -2187/6784, 11/84),
+)
+_DP_B = (35/384, 0.0, 500/1113, 125/192, -2187/6784, 11/84, 0.0)
+_DP_E = (71/57600, 0.0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40)
+
+
+def _rhs(s, stage, p):
+    # s = (x, y, vx, vy, m); stage - текущая тяга, расход и программа тангажа
+    x, y, vx, vy, m = s
+    ax, ay = model_accelerations(y, vx, vy, m, stage['F'], stage['guidance'](y), p)
+    dm = -stage['mu'] if stage['F'] > 0 else 0.0
+    return (vx, vy, ax, ay, dm)
+
+
+def _axpy(s, h, *terms):
+    # s + h * sum(coef * k)
+    out = list(s)
+    for coef, k in terms:
+        if coef:
+            for i in range(5):
+                out[i] += h * coef * k[i]
+    return tuple(out)
+
+
+def _rk4_step(s, h, stage, p):
+    k1 = _rhs(s, stage, p)
+    k2 = _rhs(_axpy(s, h, (0.5, k1)), stage, p)
+    k3 = _rhs(_axpy(s, h, (0.5, k2)), stage, p)
+    k4 = _rhs(_axpy(s, h, (1.0, k3)), stage, p)
+    return _axpy(s, h, (1/6, k1), (1/3, k2), (1/3, k3), (1/6, k4)), None, 4
+
+
+def _rk45_step(s, h, stage, p):
+    k = []
+    for a in _DP_A:
+        k.append(_rhs(_axpy(s, h, *zip(a, k)), stage, p))
+    s_new = _axpy(s, h, *zip(_DP_B, k))
+    err = _axpy((0.0,) * 5, h, *zip(_DP_E, k))
+    return s_new, err, 7
+
+
+def _event_values(s, stage, p):
+    # Функции событий: корень = момент события
+    y, m = s[1], s[4]
+    values = {
+        'h_start': y - p['h_start'],
+        'h_mid': y - p['h_mid'],
+        'h_high': y - p['h_high'],
+        'h_end': y - p['h_end'],
+    }
+    if stage['F'] > 0:
+        values['fuel'] = m - p['m_dry']
+    return values
+
+
+def _locate_event(s, h, stage, p, step_fn, name, g0_value):
+    # Метод Иллинойса по длине шага; возвращаем шаг сразу ПОСЛЕ корня,
+    # чтобы на следующем шаге знак функции события уже был новым
+    lo, hi = 0.0, h
+    g_lo = g0_value
+    g_hi = _event_values(step_fn(s, hi, stage, p)[0], stage, p)[name]
+    evals = 0
+    side = 0
+    while hi - lo > 1e-9:
+        tau = hi - g_hi * (hi - lo) / (g_hi - g_lo)
+        if not lo < tau < hi:
+            tau = 0.5 * (lo + hi)
+        g_tau = _event_values(step_fn(s, tau, stage, p)[0], stage, p)[name]
+        evals += 1
+        if g_tau == 0.0:
+            return tau, evals
+        if (g_tau > 0) == (g_lo > 0):
+            lo, g_lo = tau, g_tau
+            if side == -1:
+                g_hi *= 0.5
+            side = -1
         else:
-            # После достижения целевой высоты поддерживаем ~0°
-            pitch_deg = max(0.0, 20.0 * math.exp(-(y - 51800.0) / 10000.0))
+            hi, g_hi = tau, g_tau
+            if side == 1:
+                g_lo *= 0.5
+            side = 1
+    return hi, evals
+
+
+def integrate_model(params=None, method='euler', step=None, rtol=1e-6, atol=None,
+                    verbose=True, every=1):
+    """
+    Расчет одной траектории выбранным методом.
+
+    method:
+        'euler' - исходная схема (шаг dt, сброс проверяется после шага);
+        'rk4'   - классический Рунге-Кутта 4 с фиксированным шагом step;
+        'rk45'  - адаптивный Дорман-Принс 5(4) с допусками rtol/atol
+                  (по умолчанию atol = rtol, в м, м/с и кг).
+    Для 'rk4' и 'rk45' шаг заканчивается точно на событиях: сброс ускорителей,
+    выработка топлива (m = m_dry) и точки излома программы тангажа.
+
+    Возвращает (trajectory, info): trajectory - Trajectory со столбцами
+    time, height, speed, mass, pitch (every - хранить каждый N-й шаг),
+    info - словарь со статистикой: steps, rejected, rhs_evals, events.
+    """
+    if method not in INTEGRATORS:
+        raise ValueError(f"Неизвестный интегратор: {method}. Доступны: {INTEGRATORS}")
+    p = default_params(**(params or {}))
+    if atol is None:
+        atol = rtol
+
+    mu_core_p = p['flow_core_units'] * 5.0
+    stage = {
+        'F': (p['F_booster_one'] * 4) + p['F_core_one'],
+        'mu': p['flow_booster_units'] * 7.5 * 4 + mu_core_p,
+        'guidance': GuidanceProfile.from_params(p),
+    }
+    guidance = stage['guidance']
+    boosters_attached = True
+    info = {'method': method, 'steps': 0, 'rejected': 0, 'rhs_evals': 0, 'events': []}
+
+    t = 0.0
+    s = (0.0, 11.24, 0.0, 0.0, p['m0'])  # Начальная высота из лога
+
+    if method == 'euler':
+        step = dt if step is None else step
+        capacity = int(math.ceil(t_max / step)) + 2
+    else:
+        capacity = 256  # Число шагов заранее неизвестно - массивы растут по мере надобности
+    traj = Trajectory(capacity // every + 2, every=every)
+    traj.append(t, s[1], 0.74, s[4], 90.0)  # Начальная скорость из лога
+
+    if verbose:
+        print(f"Запуск модели... m0={s[4]:.0f} кг")
+
+    def jettison(t, s):
+        # Вычитаем массу пустых ускорителей и переходим на центральный двигатель
+        s = s[:4] + (s[4] - p['mass_drop_at_stage'],)
+        stage['mu'] = mu_core_p
+        stage['F'] = p['F_core_one']
+        info['events'].append(('jettison', t))
+        if verbose:
+            print(f"[СБРОС] t={t:.1f}с | Масса упала до {s[4]:.0f} кг | Угол {guidance(s[1]):.1f}°")
+        return s
+
+    def burnout(t):
+        stage['mu'] = 0.0
+        stage['F'] = 0.0
+        info['events'].append(('fuel', t))
+        if verbose:
+            print(f"[ТОПЛИВО] t={t:.1f}с | Топливо выработано")
+
+    if method == 'euler':
+        x, y, vx, vy, m = s
+        while t < t_max:
+            pitch_deg = guidance(y)
+            ax, ay = model_accelerations(y, vx, vy, m, stage['F'], pitch_deg, p)
+            info['rhs_evals'] += 1
+
+            # Интегрирование (Метод Эйлера)
+            vx += ax * step
+            vy += ay * step
+            x += vx * step
+            y += vy * step
+
+            # Расход топлива
+            if stage['F'] > 0:
+                m -= stage['mu'] * step
+            t += step
+            info['steps'] += 1
+
+            # Сброс ускорителей
+            if t >= p['booster_jettison_time'] and boosters_attached:
+                boosters_attached = False
+                x, y, vx, vy, m = jettison(t, (x, y, vx, vy, m))
+
+            if stage['F'] > 0 and m <= p['m_dry']:
+                burnout(t)
+
+            # Сохранение данных
+            traj.append(t, y, math.sqrt(vx**2 + vy**2), m, pitch_deg)
+        return traj.close(), info
+
+    step_fn = _rk4_step if method == 'rk4' else _rk45_step
+    h = step if step is not None else (dt if method == 'rk4' else 0.1)
+    just_rejected = False
+    while t_max - t > 1e-12:
+        h_try = min(h, t_max - t)
+        at_jettison = boosters_attached and t + h_try >= p['booster_jettison_time']
+        if at_jettison:
+            h_try = p['booster_jettison_time'] - t
+
+        s_new, err, evals = step_fn(s, h_try, stage, p)
+        info['rhs_evals'] += evals
+
+        if err is not None:
+            # Управление шагом по оценке ошибки
+            norm = max(abs(e) / (atol + rtol * max(abs(a), abs(b)))
+                       for e, a, b in zip(err, s, s_new))
+            factor = 5.0 if norm == 0 else min(5.0, max(0.2, 0.9 * norm ** -0.2))
+            if norm > 1.0:
+                info['rejected'] += 1
+                h = h_try * factor
+                just_rejected = True
+                continue
+            if just_rejected:
+                # Сразу после отказа шаг не увеличиваем
+                factor = min(factor, 1.0)
+                just_rejected = False
+            h = h_try * factor if not at_jettison else max(h, h_try * factor)
+
+        # Поиск событий внутри шага: берем самое раннее
+        g_old = _event_values(s, stage, p)
+        g_new = _event_values(s_new, stage, p)
+        first = None
+        for name, value in g_old.items():
+            if value != 0.0 and (value > 0) != (g_new[name] > 0):
+                tau, n = _locate_event(s, h_try, stage, p, step_fn, name, value)
+                info['rhs_evals'] += n * evals
+                if first is None or tau < first[0]:
+                    first = (tau, name)
+        if first is not None:
+            tau, name = first
+            s_new = step_fn(s, tau, stage, p)[0]
+            info['rhs_evals'] += evals
+            h_try = tau
+            at_jettison = False
+            if name == 'fuel':
+                burnout(t + tau)
+            else:
+                info['events'].append((name, t + tau))
+
+        s = s_new
+        t = p['booster_jettison_time'] if at_jettison else t + h_try
+        info['steps'] += 1
+
+        if at_jettison:
+            boosters_attached = False
+            s = jettison(t, s)
+            if stage['F'] > 0 and s[4] <= p['m_dry']:
+                burnout(t)
 
-        pitch_rad = math.radians(pitch_deg)
+        traj.append(t, s[1], math.sqrt(s[2]**2 + s[3]**2), s[4], guidance(s[1]))
+
+    return traj.close(), info
+
+
+def _constants():
+    # Все числовые константы модуля - в т.ч. измененные во время работы (t_max, dt)
+    return {name: value for name, value in globals().items()
+            if type(value) in (int, float) and not name.startswith('_')}
+
+
+def simulate_model(params=None, method='euler', step=None, rtol=1e-6, atol=None,
+                   verbose=True, every=1, cache=None):
+    # cache - DiskCache: тот же вариант модели (параметры, константы, интегратор,
+    # код модулей) второй раз не считается
+    if cache is not None:
+        key = make_key('model', constants=_constants(), params=params or {}, method=method,
+                       step=step, rtol=rtol, atol=atol, every=every)
+        result = cache.get(key)
+        if result is not None:
+            return result
+    result, _ = integrate_model(params, method=method, step=step, rtol=rtol, atol=atol,
+                                verbose=verbose, every=every)
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+# ============================================
+# 2.2 ПАКЕТНЫЙ РЕЖИМ (много вариантов ракеты сразу)
+# ============================================
+
+# Строка результата пакетного расчета
+BATCH_DTYPE = np.dtype([
+    ('time', 'f8'),
+    ('height', 'f8'),
+    ('speed', 'f8'),
+    ('mass', 'f8'),
+    ('pitch', 'f8'),
+])
+
+
+def simulate_batch(params=None, n_runs=None, every=1):
+    """
+    Расчет множества траекторий одновременно (векторизовано через NumPy).
+
+    params - словарь {имя параметра: число или массив длины n_runs};
+    недостающие параметры берутся из глобальных значений модуля.
+    Каждая строка летит по своей программе тангажа и сбрасывает
+    ускорители в свое время.
+
+    Возвращает структурированный массив формы (n_runs, n_steps + 1)
+    с полями time, height, speed, mass, pitch. При every > 1 хранится
+    только каждый N-й шаг (и последний) - памяти нужно в every раз меньше.
+    """
+    p = default_params(**(params or {}))
+    if n_runs is None:
+        n_runs = max(np.size(value) for value in p.values())
+    p = {name: np.broadcast_to(np.asarray(value, dtype=float), (n_runs,))
+         for name, value in p.items()}
+
+    mu_core_b = p['flow_core_units'] * 5.0
+    mu_start_b = p['flow_booster_units'] * 7.5 * 4 + mu_core_b
+    F_start_b = p['F_booster_one'] * 4 + p['F_core_one']
+
+    # Та же сетка времени, что и в simulate_model (с тем же накоплением ошибки)
+    grid = [0.0]
+    while grid[-1] < t_max:
+        grid.append(grid[-1] + dt)
+
+    # Какие шаги сохраняем: номер шага -> столбец результата
+    kept = [i for i in range(len(grid)) if i % every == 0 or i == len(grid) - 1]
+    slots = {i: k for k, i in enumerate(kept)}
+    out = np.empty((n_runs, len(kept)), dtype=BATCH_DTYPE)
+
+    x = np.zeros(n_runs)
+    y = np.full(n_runs, 11.24)  # Начальная высота из лога
+    vx = np.zeros(n_runs)
+    vy = np.zeros(n_runs)
+    m = p['m0'].copy()
+
+    current_mu = mu_start_b.copy()
+    current_F = F_start_b.copy()
+    boosters_attached = np.ones(n_runs, dtype=bool)
+    guidance = GuidanceProfile.from_params(p)
+
+    out[:, 0] = (0.0, 11.24, 0.74, 0.0, 90.0)  # Начальная скорость из лога
+    out['mass'][:, 0] = m
+
+    for i, t in enumerate(grid[1:], start=1):
+        pitch_deg = guidance.evaluate(y)
+        pitch_rad = np.radians(pitch_deg)
+        cos_p = np.cos(pitch_rad)
+        sin_p = np.sin(pitch_rad)
 
         # ФИЗИКА
-        v_total = math.sqrt(vx**2 + vy**2)
-        rho = p0 * math.exp(-y / H)
+        v_total = np.sqrt(vx**2 + vy**2)
+        rho = p0 * np.exp(-y / H)
         g = g0 * (R / (R + y))**2
-        
-        # Силы
-        F_gravity = m * g
-        F_drag = 0.5 * rho * v_total**2 * Cx * S
-        
-        # Проекции сил 
-        Fx_thrust = current_F * math.cos(pitch_rad)
-        Fy_thrust = current_F * math.sin(pitch_rad)
-        
-        Fx_drag = F_drag * math.cos(pitch_rad)
-        Fy_drag = F_drag * math.sin(pitch_rad)
-        
-        # Ускорения
-        if m > 0:
-            ax = (Fx_thrust - Fx_drag) / m
-            ay = (Fy_thrust - Fy_drag - F_gravity) / m
-        else:
-            ax, ay = 0, 0
-        
+
+        F_drag = 0.5 * rho * v_total**2 * p['Cx'] * p['S']
+
+        # Ускорения (m <= 0 - ракета "пустая", ускорение нулевое)
+        alive = m > 0
+        m_safe = np.where(alive, m, 1.0)
+        ax = np.where(alive, (current_F * cos_p - F_drag * cos_p) / m_safe, 0.0)
+        ay = np.where(alive, (current_F * sin_p - F_drag * sin_p - m * g) / m_safe, 0.0)
+
         # Интегрирование (Метод Эйлера)
         vx += ax * dt
         vy += ay * dt
         x += vx * dt
         y += vy * dt
-        
+
         # Расход топлива
-        if current_F > 0:
-            m -= current_mu * dt
-        t += dt
-        
-        # Сброс ускорителей
-        if t >= booster_jettison_time and boosters_attached:
-            boosters_attached = False
-            
-            # Вычитаем массу пустых ускорителей
-            m -= mass_drop_at_stage 
-            
-            # Меняем параметры на центральный двигатель
-            current_mu = mu_core      
-            current_F = F_core_one
-            print(f"[СБРОС] t={t:.1f}с | Масса упала до {m:.0f} кг | Угол {pitch_deg:.1f}°")
-        
-        # Сохранение данных
-        times.append(t)
-        heights.append(y)
-        velocities.append(math.sqrt(vx**2 + vy**2))
-        masses.append(m)
-        pitches.append(pitch_deg)
-    return times, heights, velocities, masses, pitches
+        m -= np.where(current_F > 0, current_mu * dt, 0.0)
+
+        # Сброс ускорителей (у каждой строки свое время)
+        jettison = boosters_attached & (t >= p['booster_jettison_time'])
+        if jettison.any():
+            boosters_attached &= ~jettison
+            m -= np.where(jettison, p['mass_drop_at_stage'], 0.0)
+            current_mu = np.where(jettison, mu_core_b, current_mu)
+            current_F = np.where(jettison, p['F_core_one'], current_F)
+
+        # Выработка топлива
+        burnout = (current_F > 0) & (m <= p['m_dry'])
+        if burnout.any():
+            current_mu = np.where(burnout, 0.0, current_mu)
+            current_F = np.where(burnout, 0.0, current_F)
+
+        k = slots.get(i)
+        if k is None:
+            continue
+        row = out[:, k]
+        row['time'] = t
+        row['height'] = y
+        row['speed'] = np.sqrt(vx**2 + vy**2)
+        row['mass'] = m
+        row['pitch'] = pitch_deg
+
+    return out
 
 # ============================================
 # 3. ЗАГРУЗКА ДАННЫХ 
 # ============================================
 
-def load_ksp_data():
-    times, heights, velocities, masses, pitches = [], [], [], [], []
-    
-    file_path = 'data/ksp_launch.log'
-    
+def load_ksp_binary(file_path):
+    # Двоичный лог: столбцы - виды на отображенный в память файл, без разбора
+    log = telemetry.load_binary(file_path)
+    times = log['time']
+    if len(times) and np.all(times[1:] >= times[:-1]):
+        # Время возрастает - обрезка по t_max остается видом
+        log = log[:np.searchsorted(times, t_max, side='right')]
+    else:
+        log = log[times <= t_max]
+    return Trajectory.from_columns(time=log['time'], height=log['altitude'], speed=log['speed'],
+                                   mass=log['mass'], pitch=log['pitch'])
+
+
+def _empty_trajectory():
+    return Trajectory.from_columns(**{name: np.empty(0) for name in trajectory.COLUMNS})
+
+
+def _log_files(file_path):
+    # Файлы, от которых зависит разобранный лог: сам лог или куски и индекс сессии
+    if os.path.isdir(file_path):
+        return [os.path.join(file_path, name) for name in sorted(os.listdir(file_path))]
+    return [file_path]
+
+
+def load_ksp_data(file_path='data/ksp_launch.log', cache=None, t_min=None):
+    # file_path - лог или папка сессии log_ksp.py --session (куски, в т.ч. .gz);
+    # t_min - только строки не раньше t_min (в сессии чтение начинается по индексу).
+    # cache - DiskCache для разобранного текстового лога (ключ - путь, время
+    # изменения и размер файлов); двоичный лог и так читается без разбора
     try:
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-            
-            start_index = 0
-            if any(c.isalpha() for c in lines[0]):
-                start_index = 1
-                
-            for line in lines[start_index:]:
-                parts = line.split()
-                # Time Pitch Altitude Speed Mass
-                if len(parts) >= 5:
-                    try:
-                        t = float(parts[0])
-                        p = float(parts[1]) # Pitch - 2-й столбец
-                        h = float(parts[2]) # Altitude - 3-й столбец
-                        v = float(parts[3]) # Speed - 4-й столбец
-                        m = float(parts[4]) # Mass - 5-й столбец
-                        
-                        if t <= t_max:
-                            times.append(t)
-                            pitches.append(p)
-                            heights.append(h)
-                            velocities.append(v)
-                            masses.append(m)
-                    except ValueError:
-                        continue # Пропускаем битые строки
-                        
+        plain = os.path.isfile(file_path) and not file_path.endswith('.gz')
+        if plain and telemetry.is_binary_log(file_path):
+            ksp = load_ksp_binary(file_path)
+            if t_min is not None:
+                ksp = Trajectory.from_columns(**{name: ksp[name][ksp['time'] >= t_min]
+                                                 for name in trajectory.COLUMNS})
+            return ksp
+        if cache is not None:
+            files = [(os.path.abspath(path), os.stat(path)) for path in _log_files(file_path)]
+            key = make_key('log', path=os.path.abspath(file_path), t_max=t_max, t_min=t_min,
+                           files=[(path, stat.st_mtime_ns, stat.st_size) for path, stat in files])
+            ksp = cache.get(key)
+            if ksp is not None:
+                return ksp
+        # Текстовый лог - блоками, чтение заканчивается на первой строке после t_max
+        ksp = Trajectory(capacity=4096)
+        for block in telemetry.iter_chunks(file_path, t_max=t_max, t_min=t_min):
+            ksp.extend(block['time'], block['altitude'], block['speed'], block['mass'],
+                       block['pitch'])
     except FileNotFoundError:
         print(f"ОШИБКА: Файл {file_path} не найден.")
-        return [], [], [], [], []
-        
-    return times, heights, velocities, masses, pitches
+        return _empty_trajectory()
+    ksp.close()
+    if cache is not None:
+        cache.put(key, ksp)
+    return ksp
 
 # ============================================
 # 4. ГРАФИКИ
 # ============================================
 
-def plot_comparison(model_data, ksp_data, title, y_label, m_idx, k_idx, filename):
-    mt = model_data[0]
-    m_val = model_data[m_idx] # Данные модели
+# Графики сравнения: (заголовок, подпись оси, столбец Trajectory, файл)
+PLOTS = (
+    ("ВЫСОТА ПОЛЕТА", "Высота (м)", 'height', "graph_height.png"),
+    ("СКОРОСТЬ", "Скорость (м/с)", 'speed', "graph_speed.png"),
+    ("МАССА РАКЕТЫ", "Масса (кг)", 'mass', "graph_mass.png"),
+    ("УГОЛ ТАНГАЖА", "Угол (град)", 'pitch', "graph_pitch.png"),
+)
+PLOT_SIZE = (10, 6)  # Размер графика, дюймы
+PLOT_DPI = 150
+PLOT_PIXELS = (PLOT_SIZE[0] * PLOT_DPI, PLOT_SIZE[1] * PLOT_DPI)
+
+
+def _pyplot():
+    # matplotlib загружается только для графиков: его импорт (шрифты, backend)
+    # занимает полсекунды, а расчету модели он не нужен
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def plot_comparison(model_data, ksp_data, title, y_label, column, filename, show=True,
+                    sampling='pixel'):
+    # show=False - только сохранить файл (без окна, например с Agg) и закрыть фигуру.
+    # sampling - прореживание точек KSP до пикселей графика
+    # (downsample.METHODS; None - рисовать все точки)
+    mt = model_data['time']
+    m_val = model_data[column] # Данные модели
     
-    kt = ksp_data[0]
-    k_val = ksp_data[k_idx]   # Данные KSP
+    kt = ksp_data['time']
+    k_val = ksp_data[column]   # Данные KSP
+    if sampling:
+        kt, k_val = downsample.downsample(kt, k_val, *PLOT_PIXELS, method=sampling)
     
-    plt.figure(figsize=(10, 6))
+    plt = _pyplot()
+    plt.figure(figsize=PLOT_SIZE)
     
     # Реальные данные (точки)
-    if kt:
+    if len(kt):
         plt.plot(kt, k_val, 'bo', markersize=2, alpha=0.6, label='KSP (Эксперимент)')
     
     # Модель (линия)
@@ -217,32 +668,184 @@ def plot_comparison(model_data, ksp_data, title, y_label, m_idx, k_idx, filename
     plt.ylabel(y_label, fontsize=12)
     plt.legend()
     plt.grid(True, alpha=0.3)
-    plt.savefig(filename, dpi=150)
-    plt.show()
+    plt.savefig(filename, dpi=PLOT_DPI)
+    if show:
+        plt.show()
+    else:
+        plt.close()
+
+
+def _init_plot_worker():
+    # В процессах-исполнителях - только файлы, без окон
+    _pyplot().switch_backend('Agg')
+
+
+def _plot_job(job):
+    plot_comparison(*job, show=False, sampling=None)
+    return job[-1]
+
+
+def plot_all(model_data, ksp_data, out_dir='.', workers=None, sampling='pixel'):
+    """
+    Все графики PLOTS в PNG в папке out_dir, параллельно в workers
+    процессах (backend Agg). Точки KSP прореживаются до отправки в процессы,
+    поэтому время не растет с длиной лога. Возвращает список файлов.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = []
+    for title, y_label, column, filename in PLOTS:
+        kt, k_val = ksp_data['time'], ksp_data[column]
+        if sampling:
+            kt, k_val = downsample.downsample(kt, k_val, *PLOT_PIXELS, method=sampling)
+        jobs.append(({'time': model_data['time'], column: model_data[column]},
+                     {'time': kt, column: k_val}, title, y_label, column,
+                     os.path.join(out_dir, filename)))
+
+    workers = min(len(jobs), workers or os.cpu_count() or 1)
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_plot_worker) as pool:
+            return list(pool.map(_plot_job, jobs))
+    return [_plot_job(job) for job in jobs]
 
 # ============================================
 # MAIN
 # ============================================
 
-def main():
-    
-    # 1. Считаем теорию
-    model_res = simulate_model() # times, heights, vels, masses, pitches
-    
-    # 2. Грузим практику
-    ksp_res = load_ksp_data()    # times, heights, vels, masses, pitches
-    
-    if not ksp_res[0]:
+def load_config(file_path):
+    """
+    Параметры модели из файла JSON: {"Cx": 0.45, ...} (или {"params": {...}},
+    как у файла программы тангажа). Неизвестные имена - ошибка.
+    """
+    with open(file_path) as f:
+        data = json.load(f)
+    params = data.get('params', data.get('profile', data))
+    unknown = sorted(set(params) - set(PARAM_NAMES))
+    if unknown:
+        raise KeyError(f"Неизвестные параметры модели в {file_path}: {', '.join(unknown)}")
+    return {name: float(value) for name, value in params.items()}
+
+
+def parse_overrides(items):
+    # ["Cx=0.45", "m0=180000"] -> {'Cx': 0.45, 'm0': 180000.0}
+    params = {}
+    for item in items:
+        name, sep, value = item.partition('=')
+        if not sep or name not in PARAM_NAMES:
+            raise ValueError(f"Ожидается ИМЯ=ЧИСЛО с именем из PARAM_NAMES: {item}")
+        params[name] = float(value)
+    return params
+
+
+def model_params(args):
+    # Параметры варианта: значения в этом файле < программа тангажа < --config < --set
+    params = {} if args.profile == '' else load_profile(args.profile)
+    if params and not args.quiet:
+        print(f"Программа тангажа из {args.profile}")
+    if args.config:
+        params.update(load_config(args.config))
+    params.update(parse_overrides(args.set))
+    return params
+
+
+def _simulate(args, params):
+    return simulate_model(params, method=args.method, step=args.step, rtol=args.rtol,
+                          verbose=not args.quiet, cache=args.cache)
+
+
+def _load_log(args):
+    ksp = load_ksp_data(args.log, args.cache)    # Trajectory с теми же столбцами
+    if not len(ksp):
         print("Данные KSP пусты! Проверь файл.")
-        return
+        sys.exit(2)
+    return ksp
+
+
+def run_simulate(args, params):
+    model = _simulate(args, params)
+    t, h, v, m = (model[name][-1] for name in ('time', 'height', 'speed', 'mass'))
+    print(f"t={t:.1f} с, H={h:.0f} м, V={v:.1f} м/с, m={m:.0f} кг ({len(model)} точек)")
+    if args.output:
+        # Тот же формат, что у лога KSP (telemetry.py): модель можно открыть как лог
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        file, writer = telemetry.open_log(args.output, args.format)
+        with file:
+            for row in zip(*(model[name].tolist() for name in ('time', 'pitch', 'height', 'speed', 'mass'))):
+                writer.write_row(row)
+        print(f"Траектория сохранена в {args.output}")
+
+
+def run_compare(args, params, model=None, ksp=None):
+    # compare.py сам импортирует varkt, поэтому импорт здесь, а не в начале файла
+    import compare
+    model = _simulate(args, params) if model is None else model
+    ksp = _load_log(args) if ksp is None else ksp
+    print(compare.format_report(compare.compare(model, ksp, params)))
+
+
+def run_plot(args, params, model=None, ksp=None):
+    model = _simulate(args, params) if model is None else model
+    ksp = _load_log(args) if ksp is None else ksp
+    # В файлы, параллельно; окно с графиками - dashboard.py
+    files = plot_all(model, ksp, args.out_dir, args.workers, args.sampling)
+    print(f"\nГотово! Графики сохранены: {', '.join(files)}")
+
+
+def main(argv=None):
+    global t_max
+    # Общие параметры варианта модели - у всех команд
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', default=None, help="файл JSON с параметрами модели")
+    common.add_argument('--set', action='append', default=[], metavar='ИМЯ=ЧИСЛО',
+                        help="заменить параметр модели (можно несколько раз)")
+    common.add_argument('--profile', default=PROFILE_PATH,
+                        help="файл программы тангажа ('' - не использовать)")
+    common.add_argument('--method', choices=INTEGRATORS, default='euler', help="интегратор")
+    common.add_argument('--step', type=float, default=None, help="шаг для euler и rk4, с")
+    common.add_argument('--rtol', type=float, default=1e-6, help="допуск для rk45")
+    common.add_argument('--t-max', type=float, default=t_max, help="длительность расчета и лога, с")
+    common.add_argument('--quiet', action='store_true', help="не печатать ход расчета")
+    common.add_argument('--no-cache', action='store_true',
+                        help="не использовать кэш расчетов и логов (cache.py)")
+    log = argparse.ArgumentParser(add_help=False)
+    log.add_argument('--log', default='data/ksp_launch.log', help="лог KSP")
+    plot = argparse.ArgumentParser(add_help=False)
+    plot.add_argument('--out-dir', default='.', help="папка для PNG")
+    plot.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    plot.add_argument('--sampling', choices=downsample.METHODS, default='pixel',
+                      help="прореживание точек KSP")
+
+    parser = argparse.ArgumentParser(
+        description="Математическая модель выведения: расчет, сравнение с логом KSP, графики. "
+                    "Без команды - сравнение и графики.", parents=[common, log, plot])
+    commands = parser.add_subparsers(dest='command')
+    simulate = commands.add_parser('simulate', parents=[common], help="только расчет модели")
+    simulate.add_argument('--output', default=None, help="сохранить траекторию (формат лога)")
+    simulate.add_argument('--format', choices=sorted(telemetry.WRITERS), default='text',
+                          help="формат файла траектории")
+    commands.add_parser('compare', parents=[common, log], help="ошибки модели относительно лога")
+    commands.add_parser('plot', parents=[common, log, plot], help="графики модели и лога в PNG")
+    args = parser.parse_args(argv)
+
+    t_max = args.t_max
+    args.cache = None if args.no_cache else DiskCache()
+    try:
+        params = model_params(args)
+    except (KeyError, ValueError, OSError) as e:
+        parser.error(str(e))
 
-    # 3. Рисуем графики (индексы: 1=h, 2=v, 3=m, 4=p)
-    plot_comparison(model_res, ksp_res, "ВЫСОТА ПОЛЕТА", "Высота (м)", 1, 1, "graph_height.png")
-    plot_comparison(model_res, ksp_res, "СКОРОСТЬ", "Скорость (м/с)", 2, 2, "graph_speed.png")
-    plot_comparison(model_res, ksp_res, "МАССА РАКЕТЫ", "Масса (кг)", 3, 3, "graph_mass.png")
-    plot_comparison(model_res, ksp_res, "УГОЛ ТАНГАЖА", "Угол (град)", 4, 4, "graph_pitch.png")
+    if args.command == 'simulate':
+        run_simulate(args, params)
+    elif args.command == 'compare':
+        run_compare(args, params)
+    elif args.command == 'plot':
+        run_plot(args, params)
+    else:
+        # 1. Считаем теорию, 2. грузим практику, 3. ошибки в числах, 4. графики
+        model, ksp = _simulate(args, params), _load_log(args)
+        run_compare(args, params, model, ksp)
+        run_plot(args, params, model, ksp)
 
-    print("\nГотово! Графики сохранены.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,133 @@
+import threading
+
+# ============================================
+# Общие потоки kRPC одного корабля
+# ============================================
+#
+# Автопилот, запись телеметрии и остальные задачи полета читают одни и те
+# же значения (высота, скорость, масса, тяга, орбита). Если каждая задача
+# открывает свои потоки, сервер присылает одно и то же по несколько раз.
+# VesselStreams создает поток канала при первом обращении и дальше отдает
+# всем один и тот же объект; закрываются потоки все вместе (close).
+#
+# При смене корабля (rebind) потоки старого корабля закрываются, а потоки,
+# не зависящие от корабля (время ut), остаются теми же объектами. Кто держит
+# у себя объекты потоков (log_ksp.StreamSampler), подписывается через
+# subscribe и после rebind заново берет потоки из VesselStreams; остальные
+# читают через streams[name] или streams.value(name) при каждом обращении.
+
+# Каналы: имя -> (система отсчета полета или объект, атрибут)
+#   'flight'       - vessel.flight() (поверхность: высота, тангаж)
+#   'body_flight'  - vessel.flight(body.reference_frame) (скорость относительно планеты)
+#   'orbit_flight' - vessel.flight(body.non_rotating_reference_frame) (орбитальные скорости)
+CHANNELS = {
+    'ut': ('space_center', 'ut'),
+    'surface_altitude': ('flight', 'surface_altitude'),
+    'pitch': ('flight', 'pitch'),
+    'speed': ('body_flight', 'speed'),
+    'mean_altitude': ('orbit_flight', 'mean_altitude'),
+    'vertical_speed': ('orbit_flight', 'vertical_speed'),
+    'horizontal_speed': ('orbit_flight', 'horizontal_speed'),
+    'mass': ('vessel', 'mass'),
+    'thrust': ('vessel', 'thrust'),
+    'available_thrust': ('vessel', 'available_thrust'),
+    'apoapsis_altitude': ('orbit', 'apoapsis_altitude'),
+    'periapsis_altitude': ('orbit', 'periapsis_altitude'),
+}
+
+# Источники, не зависящие от корабля: их потоки переживают rebind
+SHARED_SOURCES = ('space_center',)
+
+
+class VesselStreams:
+    """
+    Потоки каналов CHANNELS для корабля vessel на соединении conn.
+
+    streams['mass'] - поток (создается при первом обращении, потом общий),
+    streams.value('mass') - его текущее значение (без RPC).
+    После отделения ступеней, если активный корабль сменился, -
+    rebind(new_vessel): потоки старого корабля закрываются, подписчики
+    subscribe(callback) узнают об этом вызовом callback(streams).
+    """
+
+    def __init__(self, conn, vessel):
+        self.conn = conn
+        self.vessel = vessel
+        self._streams = {}
+        self._objects = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def _object(self, kind):
+        # Объекты-источники тоже создаются один раз (каждый - это RPC)
+        obj = self._objects.get(kind)
+        if obj is None:
+            vessel = self.vessel
+            if kind == 'space_center':
+                obj = self.conn.space_center
+            elif kind == 'vessel':
+                obj = vessel
+            elif kind == 'orbit':
+                obj = vessel.orbit
+            elif kind == 'flight':
+                obj = vessel.flight()
+            elif kind == 'body_flight':
+                obj = vessel.flight(self._object('orbit').body.reference_frame)
+            elif kind == 'orbit_flight':
+                obj = vessel.flight(self._object('orbit').body.non_rotating_reference_frame)
+            else:
+                raise KeyError(f"Неизвестный источник потока: {kind}")
+            self._objects[kind] = obj
+        return obj
+
+    def __getitem__(self, name):
+        with self._lock:
+            stream = self._streams.get(name)
+            if stream is None:
+                if name not in CHANNELS:
+                    raise KeyError(f"Неизвестный канал: {name}. Доступны: {', '.join(CHANNELS)}")
+                kind, attribute = CHANNELS[name]
+                stream = self.conn.add_stream(getattr, self._object(kind), attribute)
+                self._streams[name] = stream
+            return stream
+
+    def value(self, name):
+        return self[name]()
+
+    def snapshot(self, names):
+        """Текущие значения нескольких каналов (кортеж)."""
+        return tuple(self[name]() for name in names)
+
+    def __len__(self):
+        return len(self._streams)
+
+    def subscribe(self, callback):
+        """callback(streams) после каждой смены корабля (rebind)."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def rebind(self, vessel):
+        if vessel == self.vessel:
+            return
+        with self._lock:
+            old = {name: stream for name, stream in self._streams.items()
+                   if CHANNELS[name][0] not in SHARED_SOURCES}
+            for name in old:
+                del self._streams[name]
+            self._objects = {kind: obj for kind, obj in self._objects.items() if kind in SHARED_SOURCES}
+            self.vessel = vessel
+        # Сначала подписчики переходят на новые потоки, потом старые закрываются
+        for callback in list(self._subscribers):
+            callback(self)
+        for stream in old.values():
+            stream.remove()
+
+    def close(self):
+        with self._lock:
+            for stream in self._streams.values():
+                stream.remove()
+            self._streams.clear()
+            self._objects.clear()